@@ -0,0 +1,53 @@
+"""
+Compare filtering Tasks by a Player's limits using the CategoryIndex against a naive scan of every Task.
+
+Run from the repository root with: python -m benchmarks.category_index
+"""
+import random
+import timeit
+
+from data_classes.CategoryIndex import CategoryIndex
+from data_classes.Task import Task
+
+CATEGORY_COUNT = 30
+SIZES = (10_000, 100_000)
+REPEATS = 20
+
+
+def build_tasks(count: int, rng: random.Random):
+    index = CategoryIndex()
+    tasks = {}
+    for key in range(count):
+        task = Task(key, rng.randrange(1000), "Task text", "Task {}".format(key))
+        for category_id in rng.sample(range(CATEGORY_COUNT), rng.randint(0, 4)):
+            task.add_category(category_id)
+        task.set_index(index)
+        tasks[key] = task
+    return tasks, index
+
+
+def naive_scan(tasks, limits):
+    limit_mask = sum(1 << limit_id for limit_id in limits)
+    return {k: v for (k, v) in tasks.items() if not v.category_mask & limit_mask}
+
+
+def indexed(tasks, index, limits):
+    return {k: tasks[k] for k in CategoryIndex.keys(index.get_eligible_tasks(limits))}
+
+
+def main():
+    rng = random.Random(0)
+    for size in SIZES:
+        tasks, index = build_tasks(size, rng)
+        limits = set(rng.sample(range(CATEGORY_COUNT), 5))
+        assert naive_scan(tasks, limits).keys() == indexed(tasks, index, limits).keys()
+
+        naive_time = timeit.timeit(lambda: naive_scan(tasks, limits), number=REPEATS) / REPEATS
+        bitmap_time = timeit.timeit(lambda: index.get_eligible_tasks(limits), number=REPEATS) / REPEATS
+        indexed_time = timeit.timeit(lambda: indexed(tasks, index, limits), number=REPEATS) / REPEATS
+        print("{:>7} tasks: naive scan {:8.3f} ms, bitmap only {:8.3f} ms, bitmap to dict {:8.3f} ms".format(
+                size, naive_time * 1000, bitmap_time * 1000, indexed_time * 1000))
+
+
+if __name__ == "__main__":
+    main()
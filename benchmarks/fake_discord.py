@@ -0,0 +1,334 @@
+"""
+An in-process stand-in for Discord, for load testing the bot without a guild.
+
+FakeDiscord hands out channels, messages and users whose API methods take a simulated latency, are held to
+per-route rate limits the way Discord's are, and are all recorded. Rate limited calls are recorded as 429s and then
+retried after the limit resets, as discord.py does, unless raise_rate_limits is set. It can also emit reaction and
+message events into a bot, record them as a trace, and replay a trace faster than real time.
+"""
+import asyncio
+import json
+import random
+import time
+from collections import deque
+
+from discord import HTTPException
+
+# (calls, seconds) allowed in each bucket, per channel or per user, roughly as Discord enforces them.
+RATE_LIMITS = {
+    'send': (5, 5.0),
+    'edit': (5, 5.0),
+    'reaction': (1, 0.25),
+    'fetch': (50, 1.0),
+}
+# The bucket each route counts against. Every reaction route on a channel shares one bucket.
+ROUTE_BUCKETS = {
+    'send': 'send',
+    'edit': 'edit',
+    'add_reaction': 'reaction',
+    'remove_reaction': 'reaction',
+    'clear_reaction': 'reaction',
+    'clear_reactions': 'reaction',
+    'fetch_message': 'fetch',
+    'fetch_channel': 'fetch',
+    'fetch_user': 'fetch',
+}
+LATENCY = 0.05
+JITTER = 0.02
+
+
+class FakeResponse:
+    """The parts of an aiohttp response that HTTPException reads."""
+    def __init__(self, status: int, reason: str):
+        self.status = status
+        self.reason = reason
+
+
+class CallRecord:
+    __slots__ = ('route', 'target_id', 'start', 'end', 'status', 'detail')
+
+    def __init__(self, route: str, target_id: int, start: float, end: float, status: int, detail=None):
+        self.route = route
+        self.target_id = target_id
+        self.start = start
+        self.end = end
+        self.status = status
+        self.detail = detail
+
+
+class RateLimit:
+    """A sliding window allowing count calls every per seconds."""
+    def __init__(self, count: int, per: float):
+        self.count = count
+        self.per = per
+        self._calls = deque()
+
+    def acquire(self, now: float):
+        """Take a call from the window, returning 0, or return how many seconds until one is free."""
+        while self._calls and self._calls[0] <= now - self.per:
+            self._calls.popleft()
+        if len(self._calls) < self.count:
+            self._calls.append(now)
+            return 0.0
+        return self._calls[0] + self.per - now
+
+
+class FakeEmoji:
+    """A unicode emoji, as it appears in a reaction event."""
+    def __init__(self, name: str):
+        self.name = name
+        self.id = None
+
+    def __str__(self):
+        return self.name
+
+
+class FakeUser:
+    def __init__(self, discord, user_id: int, bot: bool = False):
+        self._discord = discord
+        self.id = user_id
+        self.name = f"user{user_id}"
+        self.display_name = self.name
+        self.mention = f"<@{user_id}>"
+        self.bot = bot
+
+    async def send(self, content=None, embed=None):
+        """Send a direct message, which is rate limited per user."""
+        channel = self._discord.get_dm_channel(self.id)
+        return await channel.send(content, embed=embed)
+
+
+class FakeChannel:
+    def __init__(self, discord, channel_id: int):
+        self._discord = discord
+        self.id = channel_id
+
+    async def send(self, content=None, embed=None):
+        def create():
+            return self._discord.create_message(self.id, content, embed)
+        return await self._discord.request("send", self.id, create)
+
+    async def fetch_message(self, message_id: int):
+        return await self._discord.request(
+                "fetch_message", self.id, lambda: self._discord.ensure_message(self.id, message_id))
+
+    def get_partial_message(self, message_id: int):
+        return self._discord.ensure_message(self.id, message_id)
+
+
+class FakeMessage:
+    def __init__(self, discord, channel: FakeChannel, message_id: int, content=None, embed=None):
+        self._discord = discord
+        self.channel = channel
+        self.id = message_id
+        self.content = content
+        self.embed = embed
+        self.reactions = {}
+
+    async def edit(self, content=None, embed=None):
+        def apply():
+            if content is not None:
+                self.content = content
+            if embed is not None:
+                self.embed = embed
+        return await self._discord.request("edit", self.channel.id, apply, detail=self.id)
+
+    async def add_reaction(self, emoji):
+        def apply():
+            self.reactions.setdefault(str(emoji), set()).add(self._discord.bot_user.id)
+        return await self._discord.request("add_reaction", self.channel.id, apply, detail=self.id)
+
+    async def remove_reaction(self, emoji, member):
+        def apply():
+            self.reactions.get(str(emoji), set()).discard(member.id)
+        return await self._discord.request("remove_reaction", self.channel.id, apply, detail=self.id)
+
+    async def clear_reaction(self, emoji):
+        def apply():
+            self.reactions.pop(str(emoji), None)
+        return await self._discord.request("clear_reaction", self.channel.id, apply, detail=self.id)
+
+    async def clear_reactions(self):
+        return await self._discord.request("clear_reactions", self.channel.id, self.reactions.clear, detail=self.id)
+
+
+class RawReactionEvent:
+    """The parts of a RawReactionActionEvent that the bot reads."""
+    def __init__(self, message_id: int, channel_id: int, user_id: int, emoji: FakeEmoji, member=None):
+        self.message_id = message_id
+        self.channel_id = channel_id
+        self.user_id = user_id
+        self.emoji = emoji
+        self.member = member
+        self.event_type = "REACTION_ADD"
+
+
+class FakeMessageEvent:
+    """A Message as it arrives in on_message."""
+    def __init__(self, channel: FakeChannel, author: FakeUser, content: str):
+        self.channel = channel
+        self.author = author
+        self.content = content
+
+
+class FakeDiscord:
+    """
+    Channels, messages and users for a bot to talk to, with every API call recorded in calls.
+
+    Events emitted into a bot are recorded in trace as dicts, with t the seconds since the first event, so that a run
+    can be saved with save_trace and replayed with replay.
+    """
+    def __init__(self, bot_user_id: int, latency: float = LATENCY, jitter: float = JITTER,
+            rate_limits=None, raise_rate_limits: bool = False, seed: int = 0):
+        self.latency = latency
+        self.jitter = jitter
+        self.rate_limits = RATE_LIMITS if rate_limits is None else rate_limits
+        self.raise_rate_limits = raise_rate_limits
+        self.bot_user = FakeUser(self, bot_user_id, bot=True)
+
+        self.calls = []
+        self.trace = []
+        self.events = []
+
+        self._rng = random.Random(seed)
+        self._buckets = {}
+        self._channels = {}
+        self._dm_channels = {}
+        self._messages = {}
+        self._users = {bot_user_id: self.bot_user}
+        self._next_id = 900_000_000_000_000_000
+        self._trace_start = None
+
+    # Objects
+
+    def get_channel(self, channel_id: int):
+        if channel_id not in self._channels:
+            self._channels[channel_id] = FakeChannel(self, channel_id)
+        return self._channels[channel_id]
+
+    async def fetch_channel(self, channel_id: int):
+        return await self.request("fetch_channel", channel_id, lambda: self.get_channel(channel_id))
+
+    def get_dm_channel(self, user_id: int):
+        if user_id not in self._dm_channels:
+            self._dm_channels[user_id] = FakeChannel(self, self._new_id())
+        return self._dm_channels[user_id]
+
+    def get_user(self, user_id: int):
+        if user_id not in self._users:
+            self._users[user_id] = FakeUser(self, user_id)
+        return self._users[user_id]
+
+    async def fetch_user(self, user_id: int):
+        return await self.request("fetch_user", user_id, lambda: self.get_user(user_id))
+
+    def ensure_message(self, channel_id: int, message_id: int):
+        """Return the message with an id, creating it if it was posted before the FakeDiscord existed."""
+        if message_id not in self._messages:
+            self._messages[message_id] = FakeMessage(self, self.get_channel(channel_id), message_id)
+        return self._messages[message_id]
+
+    def create_message(self, channel_id: int, content=None, embed=None):
+        message = FakeMessage(self, self.get_channel(channel_id), self._new_id(), content, embed)
+        self._messages[message.id] = message
+        return message
+
+    def _new_id(self):
+        self._next_id += 1
+        return self._next_id
+
+    # API calls
+
+    async def request(self, route: str, target_id: int, apply, detail=None):
+        """
+        Make a simulated API call on a route for a channel or user, returning the result of apply().
+        Every attempt is recorded, including those answered with a 429.
+        """
+        bucket_name = ROUTE_BUCKETS.get(route)
+        bucket_key = (bucket_name, target_id)
+        if bucket_key not in self._buckets and bucket_name in self.rate_limits:
+            self._buckets[bucket_key] = RateLimit(*self.rate_limits[bucket_name])
+        bucket = self._buckets.get(bucket_key)
+        while True:
+            start = time.monotonic()
+            await asyncio.sleep(max(0.0, self.latency + self._rng.uniform(-self.jitter, self.jitter)))
+            retry_after = bucket.acquire(time.monotonic()) if bucket is not None else 0.0
+            if not retry_after:
+                break
+            self.calls.append(CallRecord(route, target_id, start, time.monotonic(), 429, detail))
+            if self.raise_rate_limits:
+                raise HTTPException(FakeResponse(429, "Too Many Requests"), f"Rate limited on {route}")
+            await asyncio.sleep(retry_after)
+        result = apply()
+        self.calls.append(CallRecord(route, target_id, start, time.monotonic(), 200, detail))
+        return result
+
+    # Events
+
+    async def emit_reaction(self, bot, message_id: int, channel_id: int, user_id: int, emoji: str,
+            with_member: bool = True):
+        """Deliver a reaction add event to a bot, as the gateway would."""
+        self._record_event({
+            'event': "raw_reaction_add", 'message_id': message_id, 'channel_id': channel_id,
+            'user_id': user_id, 'emoji': emoji, 'with_member': with_member})
+        message = self.ensure_message(channel_id, message_id)
+        message.reactions.setdefault(emoji, set()).add(user_id)
+        member = self.get_user(user_id) if with_member else None
+        await bot.on_raw_reaction_add(RawReactionEvent(message_id, channel_id, user_id, FakeEmoji(emoji), member))
+
+    async def emit_message(self, bot, channel_id: int, author_id: int, content: str):
+        """Deliver a message create event to a bot, as the gateway would."""
+        self._record_event({'event': "message", 'channel_id': channel_id, 'author_id': author_id, 'content': content})
+        await bot.on_message(FakeMessageEvent(self.get_channel(channel_id), self.get_user(author_id), content))
+
+    async def emit_at_rate(self, emit, rate: float, duration: float):
+        """
+        Call emit() as a Poisson process of rate events per second for duration seconds.
+        Each call runs as its own task, so slow handlers do not hold back later events.
+        """
+        tasks = []
+        deadline = time.monotonic() + duration
+        while True:
+            await asyncio.sleep(self._rng.expovariate(rate))
+            if time.monotonic() >= deadline:
+                break
+            tasks.append(asyncio.get_event_loop().create_task(emit()))
+        await asyncio.gather(*tasks)
+
+    async def replay(self, bot, trace, speed: float = 1.0):
+        """Emit the events of a trace into a bot, speed times faster than they were recorded."""
+        start = time.monotonic()
+        tasks = []
+        for entry in trace:
+            delay = start + entry['t'] / speed - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            if entry['event'] == "raw_reaction_add":
+                emit = self.emit_reaction(
+                        bot, entry['message_id'], entry['channel_id'], entry['user_id'], entry['emoji'],
+                        entry.get('with_member', True))
+            elif entry['event'] == "message":
+                emit = self.emit_message(bot, entry['channel_id'], entry['author_id'], entry['content'])
+            else:
+                raise ValueError(f"Unknown trace event {entry['event']!r}")
+            tasks.append(asyncio.get_event_loop().create_task(emit))
+        await asyncio.gather(*tasks)
+
+    def _record_event(self, entry):
+        now = time.monotonic()
+        if self._trace_start is None:
+            self._trace_start = now
+        self.events.append((now, entry))
+        self.trace.append({'t': now - self._trace_start, **entry})
+
+    @staticmethod
+    def save_trace(path, trace):
+        """Write a trace as JSON lines."""
+        with open(path, 'w') as file:
+            for entry in trace:
+                file.write(json.dumps(entry) + "\n")
+
+    @staticmethod
+    def load_trace(path):
+        with open(path, 'r') as file:
+            return [json.loads(line) for line in file if line.strip()]
@@ -0,0 +1,155 @@
+"""
+Generate a seeded synthetic dataset of Categories, Players with Assignments, Tasks and Interfaces, written in the same
+form as the files in data/.
+
+Run from the repository root with: python -m benchmarks.generator <directory> [--scale small|medium|large] [--seed N]
+Any of the counts of a scale can be overridden, for instance --players 20000.
+"""
+import argparse
+import os
+import random
+
+from data_classes.Persistence import write_snapshot
+
+SCALES = {
+    'small': {'categories': 20, 'players': 1_000, 'tasks': 2_000, 'interfaces': 50},
+    'medium': {'categories': 30, 'players': 10_000, 'tasks': 20_000, 'interfaces': 200},
+    'large': {'categories': 60, 'players': 50_000, 'tasks': 100_000, 'interfaces': 1_000},
+}
+FILE_NAMES = {
+    'categories': "categories.json",
+    'players': "players.json",
+    'tasks': "tasks.json",
+    'interfaces': "interfaces.json",
+}
+# Ids in the range Discord snowflakes take, so that they serialize at a realistic size.
+FIRST_USER_ID = 150_000_000_000_000_000
+FIRST_MESSAGE_ID = 700_000_000_000_000_000
+FIRST_EMOJI_ID = 690_000_000_000_000_000
+FIRST_CHANNEL_ID = 697_000_000_000_000_000
+BOT_USER_ID = FIRST_USER_ID - 1
+START_TIME = 1_577_836_800.0
+SPAN = 365 * 24 * 60 * 60
+
+WORDS = (
+    "kneel write lines stand corner hold plank wear collar report daily photo hours silence count steps tidy room "
+    "recite rules crawl polish shoes journal gratitude breathing cold shower posture walk mile deadline").split()
+
+
+def _text(rng: random.Random, low: int, high: int):
+    return " ".join(rng.choice(WORDS) for _ in range(rng.randint(low, high)))
+
+
+def generate_categories(rng: random.Random, count: int):
+    return [
+        {
+            'key': key,
+            'name': _text(rng, 1, 2).title(),
+            'emoji': FIRST_EMOJI_ID + key,
+            'description': _text(rng, 5, 20)
+        } for key in range(count)]
+
+
+def generate_tasks(rng: random.Random, count: int, category_count: int, player_count: int):
+    tasks = []
+    for key in range(count):
+        raters = rng.sample(range(player_count), min(player_count, int(rng.expovariate(1 / 3))))
+        total_assignments = int(rng.expovariate(1 / 8))
+        tasks.append({
+            'key': key,
+            'creator_id': FIRST_USER_ID + rng.randrange(player_count),
+            'creation_time': START_TIME + rng.random() * SPAN,
+            'task_text': _text(rng, 10, 80),
+            'task_name': _text(rng, 2, 5).capitalize(),
+            'categories': rng.sample(range(category_count), rng.randint(0, min(4, category_count))),
+            'ratings': {str(FIRST_USER_ID + rater): rng.randint(1, 5) for rater in raters},
+            'total_assignments': total_assignments,
+            'total_completions': rng.randint(0, total_assignments)
+        })
+    return tasks
+
+
+def generate_players(rng: random.Random, count: int, category_count: int, task_count: int):
+    players = []
+    for key in range(FIRST_USER_ID, FIRST_USER_ID + count):
+        assignments = []
+        for task_id in rng.sample(range(task_count), min(task_count, int(rng.expovariate(1 / 4)))):
+            assignment_time = START_TIME + rng.random() * SPAN
+            completed = rng.random() < 0.6
+            assignments.append({
+                'task_id': task_id,
+                'assigner': rng.choice((BOT_USER_ID, FIRST_USER_ID + rng.randrange(count))),
+                'assignment_time': assignment_time,
+                'completed': completed,
+                'completion_time': assignment_time + rng.random() * 86400 if completed else None,
+                'verifiers': [FIRST_USER_ID + rng.randrange(count) for _ in range(rng.randint(0, 2))] if completed else []
+            })
+        players.append({
+            'key': key,
+            'available': rng.random() < 0.3,
+            'limits': rng.sample(range(category_count), rng.randint(0, min(5, category_count))),
+            'assignments': assignments,
+            'last_beg_time': START_TIME + rng.random() * SPAN if assignments else None,
+            'last_treat_time': None,
+            'credits': rng.randint(0, 5)
+        })
+    return players
+
+
+def generate_interfaces(rng: random.Random, count: int, player_count: int, task_count: int):
+    interfaces = []
+    for n in range(count):
+        interface = {
+            'key': FIRST_MESSAGE_ID + n,
+            'channel_id': FIRST_CHANNEL_ID + rng.randrange(3),
+            'type': rng.choice(("actions", "categoryInfo", "limits", "categories", "assignments", "tasks",
+                    "verification")),
+            'pages': False,
+            'page': 0
+        }
+        if interface['type'] in ("categoryInfo", "assignments", "tasks"):
+            interface['pages'] = True
+        if interface['type'] in ("limits", "assignments", "tasks", "verification"):
+            interface['player_id'] = FIRST_USER_ID + rng.randrange(player_count)
+        if interface['type'] in ("categories", "verification"):
+            interface['task_id'] = rng.randrange(task_count)
+        interfaces.append(interface)
+    return interfaces
+
+
+def generate(directory, scale: str = 'small', seed: int = 0, **counts):
+    """
+    Write a synthetic dataset to a directory, returning a dict mapping each kind of list to its file path.
+    counts may override any of the counts of the named scale.
+    """
+    counts = {**SCALES[scale], **{k: v for (k, v) in counts.items() if v is not None}}
+    rng = random.Random(seed)
+    records = {
+        'categories': generate_categories(rng, counts['categories']),
+        'tasks': generate_tasks(rng, counts['tasks'], counts['categories'], counts['players']),
+        'players': generate_players(rng, counts['players'], counts['categories'], counts['tasks']),
+        'interfaces': generate_interfaces(rng, counts['interfaces'], counts['players'], counts['tasks']),
+    }
+    os.makedirs(directory, exist_ok=True)
+    paths = {}
+    for (kind, file_name) in FILE_NAMES.items():
+        paths[kind] = os.path.join(directory, file_name)
+        write_snapshot(paths[kind], records[kind])
+    return paths
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a synthetic dataset for benchmarking.")
+    parser.add_argument('directory')
+    parser.add_argument('--scale', choices=SCALES, default='small')
+    parser.add_argument('--seed', type=int, default=0)
+    for kind in FILE_NAMES:
+        parser.add_argument(f'--{kind}', type=int)
+    args = parser.parse_args()
+    paths = generate(args.directory, args.scale, args.seed, **{kind: getattr(args, kind) for kind in FILE_NAMES})
+    for (kind, path) in paths.items():
+        print(f"{kind}: {path} ({os.path.getsize(path) / 2**20:.1f} MiB)")
+
+
+if __name__ == "__main__":
+    main()
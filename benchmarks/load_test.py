@@ -0,0 +1,236 @@
+"""
+Drive the bot's click handling end to end against FakeDiscord, and report click-to-edit latency, API calls per click
+and rate limiting.
+
+The storm scenario has a number of Players each click a button on an actions or category info panel within a few
+seconds of each other, as happens when a round starts. The steady scenario emits reactions and messages at fixed
+rates instead. Either can be recorded as a trace and replayed later, faster than real time.
+
+Run from the repository root with:
+    python -m benchmarks.load_test --scale small --players 300 --duration 2 --record storm.jsonl
+    python -m benchmarks.load_test --scale small --replay storm.jsonl --speed 4
+
+The run exits with an error if the median click-to-edit latency is above --max-edit-p50 seconds, so that it can
+guard against regressions.
+"""
+import argparse
+import asyncio
+import json
+import random
+import sys
+import tempfile
+import time
+
+from benchmarks.fake_discord import LATENCY, FakeDiscord
+from benchmarks.generator import BOT_USER_ID, FIRST_CHANNEL_ID, SCALES, generate
+from benchmarks.offline import OfflineBot
+from data_classes.ClickQueue import ClickQueue
+from data_classes.Outbound import OutboundScheduler
+from data_classes.ReactionDispatcher import ReactionDispatcher
+
+STORM_TYPES = ('actions', 'categoryInfo')
+STORM_PLAYERS = 300
+STORM_DURATION = 2.0
+PERCENTILES = (0.5, 0.95, 0.99)
+# The run fails if the median click waits longer than this many seconds for its Interface to be edited.
+MAX_EDIT_P50 = 5.0
+
+
+class LoadTestBot(OfflineBot):
+    """
+    An OfflineBot that talks to a FakeDiscord, with the same outbound machinery as TaskMistress.
+    List changes are only marked, never written, so that disk writes don't count against the handlers.
+    """
+    def __init__(self, directory, discord: FakeDiscord):
+        self.discord = discord
+        super().__init__(directory)
+        self.user = discord.bot_user
+        self.outbound = OutboundScheduler()
+        self.reaction_dispatcher = ReactionDispatcher(self.outbound)
+        self.click_queue = ClickQueue()
+        self.messages_seen = 0
+        for canned_dict in (self.category_list, self.player_list, self.task_list, self.interface_list):
+            canned_dict.defer_writes()
+
+    def get_channel(self, channel_id: int):
+        return self.discord.get_channel(channel_id)
+
+    async def fetch_channel(self, channel_id: int):
+        return await self.discord.fetch_channel(channel_id)
+
+    def get_user(self, user_id: int):
+        return self.discord.get_user(user_id)
+
+    async def fetch_user(self, user_id: int):
+        return await self.discord.fetch_user(user_id)
+
+    async def on_message(self, message):
+        if message.author.bot:
+            return  # Ignore bots
+        self.messages_seen += 1
+
+    async def on_raw_reaction_add(self, event):
+        await self.interface_list.handle_reaction(event)
+
+
+def _clicks(bot, types):
+    """Return (message_id, channel_id, emoji) for every button on the Interfaces of the given types."""
+    clicks = []
+    for interface in bot.interface_list.values():
+        if interface.TYPE in types:
+            clicks.extend((interface.message_id, interface.channel_id, str(e)) for e in interface.buttons())
+    if not clicks:
+        raise ValueError(f"The dataset has no Interfaces of types {', '.join(types)}")
+    return clicks
+
+
+async def storm(discord: FakeDiscord, bot, players: int, duration: float, types=STORM_TYPES, seed: int = 0):
+    """Have players Players each click one button within duration seconds, at uniformly random times."""
+    rng = random.Random(seed)
+    clicks = _clicks(bot, types)
+    player_ids = rng.sample([p.player_id for p in bot.player_list.values()], min(players, len(bot.player_list)))
+    schedule = sorted((rng.uniform(0, duration), player_id, rng.choice(clicks)) for player_id in player_ids)
+    start = time.monotonic()
+    tasks = []
+    for (offset, player_id, (message_id, channel_id, emoji)) in schedule:
+        delay = start + offset - time.monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        tasks.append(asyncio.get_event_loop().create_task(
+                discord.emit_reaction(bot, message_id, channel_id, player_id, emoji)))
+    await asyncio.gather(*tasks)
+
+
+async def steady(discord: FakeDiscord, bot, reaction_rate: float, message_rate: float, duration: float,
+        types=STORM_TYPES, seed: int = 0):
+    """Emit reactions and messages at the given rates per second for duration seconds."""
+    rng = random.Random(seed)
+    clicks = _clicks(bot, types)
+    player_ids = [p.player_id for p in bot.player_list.values()]
+
+    def reaction():
+        (message_id, channel_id, emoji) = rng.choice(clicks)
+        return discord.emit_reaction(bot, message_id, channel_id, rng.choice(player_ids), emoji)
+
+    def message():
+        return discord.emit_message(bot, FIRST_CHANNEL_ID, rng.choice(player_ids), "Hello!")
+
+    emitters = []
+    if reaction_rate > 0:
+        emitters.append(discord.emit_at_rate(reaction, reaction_rate, duration))
+    if message_rate > 0:
+        emitters.append(discord.emit_at_rate(message, message_rate, duration))
+    await asyncio.gather(*emitters)
+
+
+def _percentiles(values):
+    if not values:
+        return None
+    values = sorted(values)
+    summary = {f"p{int(q * 100)}": values[int(q * (len(values) - 1))] for q in PERCENTILES}
+    summary['max'] = values[-1]
+    summary['count'] = len(values)
+    return summary
+
+
+def _first_after(calls, routes, message_id, since: float):
+    """Return the end of the first successful call on one of routes for a message that started after since."""
+    ends = [c.end for c in calls if c.route in routes and c.detail == message_id and c.start >= since and c.status == 200]
+    return min(ends) if ends else None
+
+
+def summarize(discord: FakeDiscord):
+    """Return the latency, API call and rate limit figures of everything the FakeDiscord has seen."""
+    clicks = [(t, e) for (t, e) in discord.events if e['event'] == "raw_reaction_add"]
+    edit_latencies = []
+    cleanup_latencies = []
+    for (t, entry) in clicks:
+        edited = _first_after(discord.calls, ("edit",), entry['message_id'], t)
+        if edited is not None:
+            edit_latencies.append(edited - t)
+        cleaned = _first_after(discord.calls, ("remove_reaction", "clear_reaction", "clear_reactions"), entry['message_id'], t)
+        if cleaned is not None:
+            cleanup_latencies.append(cleaned - t)
+
+    routes = {}
+    for call in discord.calls:
+        counts = routes.setdefault(call.route, {'ok': 0, 'rate_limited': 0})
+        counts['ok' if call.status == 200 else 'rate_limited'] += 1
+    succeeded = sum(c['ok'] for c in routes.values())
+    return {
+        'clicks': len(clicks),
+        'messages': sum(1 for (_, e) in discord.events if e['event'] == "message"),
+        'api_calls': succeeded,
+        'api_calls_per_click': succeeded / len(clicks) if clicks else None,
+        'rate_limited': sum(c['rate_limited'] for c in routes.values()),
+        'routes': routes,
+        'click_to_edit': _percentiles(edit_latencies),
+        'click_to_cleanup': _percentiles(cleanup_latencies),
+    }
+
+
+async def run(directory, args):
+    discord = FakeDiscord(BOT_USER_ID, latency=args.latency, jitter=args.jitter, seed=args.seed)
+    bot = LoadTestBot(directory, discord)
+    start = time.monotonic()
+    if args.replay:
+        await discord.replay(bot, FakeDiscord.load_trace(args.replay), args.speed)
+    elif args.scenario == 'storm':
+        await storm(discord, bot, args.players, args.duration, seed=args.seed)
+    else:
+        await steady(discord, bot, args.reaction_rate, args.message_rate, args.duration, seed=args.seed)
+    await bot.click_queue.join()
+    elapsed = time.monotonic() - start
+    await bot.outbound.stop()
+
+    if args.record:
+        FakeDiscord.save_trace(args.record, discord.trace)
+    report = summarize(discord)
+    report['seconds'] = elapsed
+    report['outbound'] = bot.outbound.get_stats()
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test click handling against a fake Discord.")
+    parser.add_argument('--scale', choices=SCALES, default='small')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--data', help="Use, or generate into, this directory instead of a temporary one.")
+    parser.add_argument('--scenario', choices=('storm', 'steady'), default='storm')
+    parser.add_argument('--players', type=int, default=STORM_PLAYERS, help="Players clicking in the storm.")
+    parser.add_argument('--duration', type=float, default=STORM_DURATION, help="Seconds the events are spread over.")
+    parser.add_argument('--reaction-rate', type=float, default=50.0, help="Reactions per second when steady.")
+    parser.add_argument('--message-rate', type=float, default=5.0, help="Messages per second when steady.")
+    parser.add_argument('--latency', type=float, default=LATENCY, help="Mean seconds each API call takes.")
+    parser.add_argument('--jitter', type=float, default=LATENCY / 2)
+    parser.add_argument('--record', help="Write the emitted events to this file as a trace.")
+    parser.add_argument('--replay', help="Emit the events of this trace instead of running a scenario.")
+    parser.add_argument('--speed', type=float, default=1.0, help="How many times faster than recorded to replay.")
+    parser.add_argument('--output', help="Write the report as JSON to this file instead of standard output.")
+    parser.add_argument('--max-edit-p50', type=float, default=MAX_EDIT_P50,
+            help="Exit with an error if the median click-to-edit latency is above this many seconds, unless 0.")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as temp_directory:
+        directory = args.data or temp_directory
+        generate(directory, args.scale, args.seed)
+        report = asyncio.run(run(directory, args))
+
+    print(f"{report['clicks']} clicks, {report['api_calls']} API calls, {report['rate_limited']} rate limited",
+            file=sys.stderr)
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(report, file, indent=4)
+    else:
+        json.dump(report, sys.stdout, indent=4)
+        print()
+
+    edit_latency = report['click_to_edit']
+    if args.max_edit_p50 and edit_latency is not None and edit_latency['p50'] > args.max_edit_p50:
+        print(f"Median click-to-edit latency {edit_latency['p50']:.2f} s is above {args.max_edit_p50:g} s",
+                file=sys.stderr)
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+"""
+Measure the memory used by a full in-memory dataset of Tasks, Players and Assignments.
+
+Run from the repository root with: python -m benchmarks.memory
+"""
+import gc
+import random
+import tracemalloc
+
+from data_classes.Player import Player
+from data_classes.Task import Task
+
+TASK_COUNT = 100_000
+PLAYER_COUNT = 50_000
+ASSIGNMENTS_PER_PLAYER = 5
+CATEGORY_COUNT = 30
+TASK_NAMES = ["Task name {}".format(n) for n in range(50)]
+
+
+class FakeUser:
+    def __init__(self, user_id):
+        self.id = user_id
+
+
+def build_tasks(rng: random.Random):
+    tasks = {}
+    for key in range(TASK_COUNT):
+        task = Task(key, rng.randrange(PLAYER_COUNT), "Task text number {}".format(key), rng.choice(TASK_NAMES))
+        for category_id in rng.sample(range(CATEGORY_COUNT), rng.randint(0, 4)):
+            task.add_category(category_id)
+        for _ in range(rng.randint(0, 5)):
+            task.add_rating(FakeUser(rng.randrange(PLAYER_COUNT)), rng.randint(1, 5))
+        tasks[key] = task
+    return tasks
+
+
+def build_players(rng: random.Random):
+    players = {}
+    for key in range(PLAYER_COUNT):
+        player = Player(key)
+        player.available = rng.random() < 0.3
+        for limit_id in rng.sample(range(CATEGORY_COUNT), rng.randint(0, 5)):
+            player.toggle_limit(limit_id)
+        for _ in range(ASSIGNMENTS_PER_PLAYER):
+            player.assign_task(rng.randrange(TASK_COUNT), rng.randrange(PLAYER_COUNT))
+        players[key] = player
+    return players
+
+
+def measure(build, rng):
+    gc.collect()
+    tracemalloc.start()
+    data = build(rng)
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return data, current, peak
+
+
+def main():
+    rng = random.Random(0)
+    tasks, task_bytes, task_peak = measure(build_tasks, rng)
+    players, player_bytes, player_peak = measure(build_players, rng)
+    print("{:>7} tasks:   {:7.1f} MiB ({:5.0f} bytes each, peak {:7.1f} MiB)".format(
+            len(tasks), task_bytes / 2**20, task_bytes / len(tasks), task_peak / 2**20))
+    print("{:>7} players: {:7.1f} MiB ({:5.0f} bytes each with {} assignments, peak {:7.1f} MiB)".format(
+            len(players), player_bytes / 2**20, player_bytes / len(players), ASSIGNMENTS_PER_PLAYER,
+            player_peak / 2**20))
+
+
+if __name__ == "__main__":
+    main()
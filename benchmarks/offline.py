@@ -0,0 +1,69 @@
+"""
+A stand-in for the TaskMistress bot with the data lists loaded, for benchmarking without a Discord connection.
+"""
+import os
+
+from benchmarks.generator import BOT_USER_ID, FILE_NAMES
+from data_classes.Leaderboard import Leaderboard
+from data_classes.Lists import CategoryList, PlayerList, TaskList, InterfaceList
+from data_classes.Persistence import read_records
+from data_classes.TaskPicker import TaskPicker
+from data_classes.UserResolver import UserResolver
+
+LIST_CLASSES = {
+    'categories': CategoryList,
+    'players': PlayerList,
+    'tasks': TaskList,
+    'interfaces': InterfaceList,
+}
+
+
+class OfflineEmoji:
+    def __init__(self, emoji_id: int):
+        self.id = emoji_id
+        self.name = f"emoji{emoji_id}"
+
+    def __str__(self):
+        return f"<:{self.name}:{self.id}>"
+
+
+class OfflineUser:
+    def __init__(self, user_id: int):
+        self.id = user_id
+        self.name = f"user{user_id}"
+        self.display_name = self.name
+        self.mention = f"<@{user_id}>"
+        self.bot = user_id == BOT_USER_ID
+
+
+class OfflineBot:
+    """Has the attributes of TaskMistress that the data_classes use, with every user and emoji known locally."""
+    def __init__(self, directory, stream: bool = False):
+        self.user = OfflineUser(BOT_USER_ID)
+        self.directory = directory
+        self.leaderboard = Leaderboard()
+        self.user_resolver = UserResolver(self)
+
+        self.category_list = self.load_list('categories', stream=stream)
+        self.player_list = self.load_list('players', stream=stream)
+        self.task_list = self.load_list('tasks', stream=stream)
+        self.interface_list = self.load_list('interfaces', stream=stream)
+        self.leaderboard.rebuild(self.player_list, self.task_list)
+        self.task_picker = TaskPicker(self.task_list)
+
+    def path(self, kind: str):
+        return os.path.join(self.directory, FILE_NAMES[kind])
+
+    def load_list(self, kind: str, path=None, stream: bool = False, binary: bool = False):
+        """Load one of the data lists, from its file in the directory unless given another path."""
+        path = path or self.path(kind)
+        return LIST_CLASSES[kind](self, path, records=read_records(path, stream=stream), binary=binary)
+
+    def get_emoji(self, emoji_id: int):
+        return OfflineEmoji(emoji_id)
+
+    def get_user(self, user_id: int):
+        return OfflineUser(user_id)
+
+    async def fetch_user(self, user_id: int):
+        return OfflineUser(user_id)
@@ -0,0 +1,201 @@
+"""
+Time the data_classes layer on a synthetic dataset: loading and saving each list, from_dict/to_dict round trips,
+available Player lookups, Task eligibility filtering and building the Embed of every Interface type.
+
+Runs offline; nothing connects to Discord. Results are written as JSON, and can be compared against a baseline
+saved from an earlier run, in which case the exit status is 1 if anything got slower than the tolerance allows.
+
+Run from the repository root with:
+    python -m benchmarks.suite --scale small --output results.json
+    python -m benchmarks.suite --scale small --baseline results.json --tolerance 0.25
+"""
+import argparse
+import asyncio
+import inspect
+import json
+import platform
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+from benchmarks.generator import FILE_NAMES, SCALES, generate
+from benchmarks.offline import OfflineBot
+from data_classes.Assignment import Assignment
+from data_classes.BinarySnapshot import json_to_binary
+from data_classes.Interfaces import INTERFACE_TYPES, PagedInterface
+from data_classes.Player import Player
+from data_classes.Task import Task
+
+REPEAT = 5
+TOLERANCE = 0.25
+SAMPLE_PLAYERS = 100
+
+
+def load_cases(bot):
+    for kind in FILE_NAMES:
+        yield f"load:{kind}", lambda kind=kind: bot.load_list(kind)
+        yield f"load:{kind}:stream", lambda kind=kind: bot.load_list(kind, stream=True)
+        binary_path = bot.path(kind)[:-len(".json")] + ".bin"
+        json_to_binary(bot.path(kind), binary_path, kind)
+        yield f"load:{kind}:binary", lambda kind=kind, path=binary_path: bot.load_list(kind, path=path)
+
+
+def save_cases(bot):
+    for kind in FILE_NAMES:
+        canned_dict = bot.load_list(kind)
+        yield f"save:{kind}", canned_dict.save
+        binary_path = bot.path(kind)[:-len(".json")] + ".bin"
+        binary_dict = bot.load_list(kind, path=binary_path, binary=True)
+        yield f"save:{kind}:binary", binary_dict.save
+
+
+def round_trip_cases(bot):
+    lists = {
+        'categories': bot.category_list,
+        'players': bot.player_list,
+        'tasks': bot.task_list,
+        'interfaces': bot.interface_list,
+    }
+    for (kind, canned_dict) in lists.items():
+        yield f"round_trip:{kind}", lambda c=canned_dict: [c.from_dict(bot, v.to_dict()) for v in c.values()]
+
+    assignments = [a for player in bot.player_list.values() for a in player.assignments.values()]
+    yield "round_trip:assignments", lambda: [Assignment.from_dict(bot, a.to_dict()) for a in assignments]
+    # Players with their Assignments deserialized, rather than left serialized until accessed.
+    players = list(bot.player_list.values())
+    yield "round_trip:players:hydrated", lambda: [Player.from_dict(bot, p.to_dict()).assignments for p in players]
+    tasks = list(bot.task_list.values())
+    yield "round_trip:tasks:objects", lambda: [Task.from_dict(bot, t.to_dict()) for t in tasks]
+
+
+def query_cases(bot):
+    players = bot.player_list
+    yield "players:get_available_players", players.get_available_players
+    yield "players:count_available_players", players.count_available_players
+    yield "players:sample_available_players", lambda: players.sample_available_players(10)
+
+    sample = random.Random(0).sample(list(players.values()), min(SAMPLE_PLAYERS, len(players)))
+    tasks = bot.task_list
+    yield "tasks:eligibility", lambda: [tasks.get_tasks_for_player(p) for p in sample]
+    yield "tasks:eligibility:bitmap", lambda: [tasks.category_index.get_eligible_tasks(p.limits) for p in sample]
+    yield "tasks:pick", lambda: [bot.task_picker.pick(p) for p in sample]
+    yield "tasks:top_by_severity", lambda: tasks.get_top_tasks('severity', 10)
+
+
+def embed_cases(bot):
+    loop = asyncio.new_event_loop()
+    interfaces = {}
+    for interface in bot.interface_list.values():
+        interfaces.setdefault(interface.TYPE, interface)
+
+    def build(interface):
+        if isinstance(interface, PagedInterface):
+            interface._paginator = None  # Time a cold build, not a Paginator cache hit.
+        embed = interface.build_embed()
+        if inspect.isawaitable(embed):
+            embed = loop.run_until_complete(embed)
+        return embed
+
+    for tag in INTERFACE_TYPES:
+        if tag in interfaces:
+            yield f"embed:{tag}", lambda interface=interfaces[tag]: build(interface)
+
+
+def time_case(func, repeat: int):
+    """Run func repeat times, returning a dict of timings in seconds, or of the error if it raised."""
+    runs = []
+    try:
+        for _ in range(repeat):
+            start = time.perf_counter()
+            func()
+            runs.append(time.perf_counter() - start)
+    except Exception as exc:
+        return {'error': f"{type(exc).__name__}: {exc}"}
+    return {'median': statistics.median(runs), 'min': min(runs), 'runs': len(runs)}
+
+
+def run(directory, repeat: int = REPEAT, only=None):
+    """Run every benchmark, or those whose names start with one of only, against the dataset in a directory."""
+    bot = OfflineBot(directory)
+    results = {}
+    for cases in (load_cases, save_cases, round_trip_cases, query_cases, embed_cases):
+        for (name, func) in cases(bot):
+            if only and not any(name.startswith(prefix) for prefix in only):
+                continue
+            results[name] = time_case(func, repeat)
+            print(format_result(name, results[name]), file=sys.stderr)
+    return results
+
+
+def format_result(name, result, baseline=None):
+    if 'error' in result:
+        return f"{name:<40} {result['error']}"
+    line = f"{name:<40} {result['median'] * 1000:10.3f} ms"
+    if baseline is not None and 'median' in baseline:
+        line += f"  (baseline {baseline['median'] * 1000:10.3f} ms, x{result['median'] / baseline['median']:.2f})"
+    return line
+
+
+def compare(results, baseline, tolerance: float = TOLERANCE):
+    """Return a list of (name, result, baseline result) for benchmarks slower than the baseline by over tolerance."""
+    regressions = []
+    for (name, result) in results.items():
+        base = baseline.get(name)
+        if base is None or 'median' not in result or 'median' not in base:
+            continue
+        if result['median'] > base['median'] * (1 + tolerance):
+            regressions.append((name, result, base))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the data_classes layer on synthetic data.")
+    parser.add_argument('--scale', choices=SCALES, default='small')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--repeat', type=int, default=REPEAT)
+    parser.add_argument('--data', help="Use, or generate into, this directory instead of a temporary one.")
+    parser.add_argument('--only', nargs='*', help="Only run benchmarks whose names start with these prefixes.")
+    parser.add_argument('--output', help="Write the results as JSON to this file instead of standard output.")
+    parser.add_argument('--baseline', help="Compare against the results JSON of an earlier run.")
+    parser.add_argument('--tolerance', type=float, default=TOLERANCE,
+            help="Fraction by which a benchmark may be slower than the baseline before it counts as a regression.")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as temp_directory:
+        directory = args.data or temp_directory
+        generate(directory, args.scale, args.seed)
+        results = run(directory, args.repeat, args.only)
+
+    report = {
+        'meta': {
+            'scale': args.scale,
+            'seed': args.seed,
+            'repeat': args.repeat,
+            'python': platform.python_version(),
+            'machine': platform.machine(),
+        },
+        'results': results,
+    }
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(report, file, indent=4)
+    else:
+        json.dump(report, sys.stdout, indent=4)
+        print()
+
+    if args.baseline:
+        with open(args.baseline, 'r') as file:
+            baseline = json.load(file)
+        if baseline['meta']['scale'] != args.scale:
+            print(f"Baseline was run at scale {baseline['meta']['scale']}, not {args.scale}.", file=sys.stderr)
+        regressions = compare(results, baseline['results'], args.tolerance)
+        for (name, result, base) in regressions:
+            print("Regression: " + format_result(name, result, base), file=sys.stderr)
+        if regressions:
+            raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,45 +1,49 @@
-from datetime import datetime
 import logging
+import time
 
 log = logging.getLogger(__name__)
 
 class Assignment:
+    """An Assignment of a Task to a Player. Times are UTC timestamps and verifiers a tuple of user ids."""
+    __slots__ = ('task_id', 'assigner', 'assignment_time', 'completed', 'completion_time', 'verifiers')
+
     def __init__(self, task_id, assigner_id):
         self.task_id = task_id
 
         self.assigner = assigner_id
-        self.assignment_time = datetime.utcnow()
+        self.assignment_time = time.time()
 
         self.completed = False
         self.completion_time = None
 
-        self.verifiers = []
+        self.verifiers = ()
 
     @classmethod
     def from_dict(cls, bot, d):
         assignment = Assignment(
-                d['key'],
+                d['task_id'],
                 d['assigner'])
-        assignment.assignment_time = datetime.utcfromtimestamp(d['assignment_time'])
+        assignment.assignment_time = d['assignment_time']
         assignment.completed = d['completed']
-        assignment.verifiers = d['verifiers']
+        assignment.completion_time = d['completion_time']
+        assignment.verifiers = tuple(d['verifiers'])
         return assignment
 
     def to_dict(self):
         return {
             'task_id': self.task_id,
             'assigner': self.assigner,
-            'assignment_time': self.assignment_time.timestamp(),
+            'assignment_time': self.assignment_time,
             'completed': self.completed,
-            'completion_time': self.completion_time.timestamp(),
-            'verifiers': self.verifiers
+            'completion_time': self.completion_time,
+            'verifiers': list(self.verifiers)
         }
 
     def mark_completed(self):
         """Mark an assignment as completed and record the completion time."""
         self.completed = True
-        self.completion_time = datetime.utcnow()
+        self.completion_time = time.time()
 
     def add_verifier(self, verifier_id):
         """Record a verifier of a completed Assignment."""
-        self.verifiers.append(verifier_id)
+        self.verifiers += (verifier_id,)
@@ -0,0 +1,322 @@
+"""
+A versioned binary snapshot format for the data lists, read through a memory map.
+
+A snapshot is a header, a table of fixed-width records, a table of fixed-width Assignment records for the players
+list, and a string table holding every text and variable-length field, each stored once however often it is used.
+Records are only decoded when they are accessed, so loading never builds the whole list of records at once.
+
+Convert between the JSON and binary forms with:
+    python -m data_classes.BinarySnapshot to-binary data/tasks.json data/tasks.bin tasks
+    python -m data_classes.BinarySnapshot to-json data/tasks.bin data/tasks.json
+"""
+import argparse
+import json
+import logging
+import math
+import mmap
+import os
+import struct
+from collections.abc import Mapping, Sequence
+
+log = logging.getLogger(__name__)
+
+MAGIC = b"TMSNAP\r\n"
+VERSION = 1
+KINDS = ('categories', 'players', 'tasks', 'interfaces')
+# The string reference stored for None.
+NO_STRING = 0xFFFFFFFF
+
+# magic, version, kind, record count, assignment count, and the offsets of the records, assignments and strings.
+HEADER = struct.Struct("<8sHHIIQQQ")
+STRING_COUNT = struct.Struct("<I")
+STRING_BOUNDS = struct.Struct("<QQ")
+# Every record begins with its key.
+KEY = struct.Struct("<q")
+# key, JSON string. Categories and Interfaces are few and vary in shape, so they are stored whole.
+JSON_RECORD = struct.Struct("<qI")
+# key, creator_id, creation_time, task_text, task_name, categories, raters, rating values, assignments, completions
+TASK_RECORD = struct.Struct("<qqdIIIIIII")
+# key, available, limits, last_beg_time, last_treat_time, credits, first assignment, assignment count
+PLAYER_RECORD = struct.Struct("<q?IddiII")
+# task_id, assigner, assignment_time, completed, completion_time, verifiers
+ASSIGNMENT_RECORD = struct.Struct("<qqd?dI")
+
+RECORD_STRUCTS = {
+    'categories': JSON_RECORD,
+    'players': PLAYER_RECORD,
+    'tasks': TASK_RECORD,
+    'interfaces': JSON_RECORD,
+}
+
+
+def is_binary_snapshot(path):
+    with open(path, 'rb') as file:
+        return file.read(len(MAGIC)) == MAGIC
+
+
+def json_default(value):
+    """Serialize the records and Assignments of a BinarySnapshot as JSON, for json.dump's default argument."""
+    if isinstance(value, Mapping):
+        return dict(value)
+    if isinstance(value, Sequence):
+        return list(value)
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def _pack_time(value):
+    return math.nan if value is None else value
+
+
+def _unpack_time(value):
+    return None if math.isnan(value) else value
+
+
+def _pack_ints(values):
+    return struct.pack(f"<{len(values)}q", *values)
+
+
+def _unpack_ints(data):
+    return list(struct.unpack(f"<{len(data) // 8}q", data))
+
+
+class _StringTable:
+    """Collects the byte strings of a snapshot being written, storing each distinct one once."""
+    def __init__(self):
+        self._refs = {}
+        self._strings = []
+
+    def add(self, value):
+        """Return the reference for a str or bytes value, or NO_STRING for None."""
+        if value is None:
+            return NO_STRING
+        if isinstance(value, str):
+            value = value.encode('utf-8')
+        if value not in self._refs:
+            self._refs[value] = len(self._strings)
+            self._strings.append(value)
+        return self._refs[value]
+
+    def to_bytes(self):
+        offsets = [0]
+        for value in self._strings:
+            offsets.append(offsets[-1] + len(value))
+        return b"".join([
+            STRING_COUNT.pack(len(self._strings)),
+            struct.pack(f"<{len(offsets)}Q", *offsets),
+            *self._strings])
+
+
+def write_binary_snapshot(path, kind: str, records):
+    """Atomically replace a file with a binary snapshot of the given serialized records of a list of kind."""
+    record_struct = RECORD_STRUCTS[kind]
+    strings = _StringTable()
+    body = bytearray()
+    assignments = bytearray()
+    assignment_count = 0
+    for v in records:
+        if record_struct is JSON_RECORD:
+            body += JSON_RECORD.pack(v['key'], strings.add(json.dumps(v, default=json_default)))
+        elif kind == 'tasks':
+            ratings = v['ratings']
+            body += TASK_RECORD.pack(
+                    v['key'], v['creator_id'], _pack_time(v['creation_time']),
+                    strings.add(v['task_text']), strings.add(v['task_name']),
+                    strings.add(_pack_ints(v['categories'])),
+                    strings.add(_pack_ints([int(k) for k in ratings])), strings.add(bytes(ratings.values())),
+                    v['total_assignments'], v['total_completions'])
+        elif kind == 'players':
+            first = assignment_count
+            for a in v['assignments']:
+                assignments += ASSIGNMENT_RECORD.pack(
+                        a['task_id'], a['assigner'], _pack_time(a['assignment_time']), a['completed'],
+                        _pack_time(a['completion_time']), strings.add(_pack_ints(a['verifiers'])))
+                assignment_count += 1
+            body += PLAYER_RECORD.pack(
+                    v['key'], v['available'], strings.add(_pack_ints(v['limits'])),
+                    _pack_time(v['last_beg_time']), _pack_time(v['last_treat_time']), v['credits'],
+                    first, assignment_count - first)
+
+    records_offset = HEADER.size
+    assignments_offset = records_offset + len(body)
+    strings_offset = assignments_offset + len(assignments)
+    header = HEADER.pack(
+            MAGIC, VERSION, KINDS.index(kind), len(body) // record_struct.size, assignment_count,
+            records_offset, assignments_offset, strings_offset)
+
+    tmp_path = path + ".tmp"
+    with open(tmp_path, 'wb') as file:
+        for part in (header, body, assignments, strings.to_bytes()):
+            file.write(part)
+    os.replace(tmp_path, path)
+
+
+class BinarySnapshot(Sequence):
+    """
+    The records of a binary snapshot file, memory-mapped and decoded on access.
+
+    Each item is a BinaryRecord that reads its key straight from the map and decodes the rest of the record the
+    first time any other field is looked up.
+    """
+    def __init__(self, path):
+        with open(path, 'rb') as file:
+            self._buffer = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        (magic, version, kind, self._count, self._assignment_count,
+                self._records_offset, self._assignments_offset, strings_offset) = HEADER.unpack_from(self._buffer)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a binary snapshot")
+        if version != VERSION:
+            raise ValueError(f"{path} is a version {version} snapshot, but only version {VERSION} can be read")
+        self.kind = KINDS[kind]
+        self._record_struct = RECORD_STRUCTS[self.kind]
+
+        (string_count,) = STRING_COUNT.unpack_from(self._buffer, strings_offset)
+        self._string_bounds_offset = strings_offset + STRING_COUNT.size
+        self._strings_offset = self._string_bounds_offset + (string_count + 1) * 8
+
+    def __len__(self):
+        return self._count
+
+    def __getitem__(self, index: int):
+        if index < 0:
+            index += self._count
+        if not 0 <= index < self._count:
+            raise IndexError(index)
+        return BinaryRecord(self, index)
+
+    def key_at(self, index: int):
+        (key,) = KEY.unpack_from(self._buffer, self._records_offset + index * self._record_struct.size)
+        return key
+
+    def decode(self, index: int):
+        """Return the serialized record at an index as a dict, the same as its JSON form."""
+        fields = self._record_struct.unpack_from(self._buffer, self._records_offset + index * self._record_struct.size)
+        if self._record_struct is JSON_RECORD:
+            return json.loads(self._string(fields[1]))
+        if self.kind == 'tasks':
+            (key, creator_id, creation_time, text, name, categories, raters, values, assignments, completions) = fields
+            return {
+                'key': key,
+                'creator_id': creator_id,
+                'creation_time': _unpack_time(creation_time),
+                'task_text': self._text(text),
+                'task_name': self._text(name),
+                'categories': _unpack_ints(self._string(categories)),
+                'ratings': dict(zip(_unpack_ints(self._string(raters)), self._string(values))),
+                'total_assignments': assignments,
+                'total_completions': completions
+            }
+        (key, available, limits, last_beg_time, last_treat_time, credits, first, count) = fields
+        return {
+            'key': key,
+            'available': available,
+            'limits': _unpack_ints(self._string(limits)),
+            'assignments': AssignmentRecords(self, first, count),
+            'last_beg_time': _unpack_time(last_beg_time),
+            'last_treat_time': _unpack_time(last_treat_time),
+            'credits': credits
+        }
+
+    def decode_assignment(self, index: int):
+        (task_id, assigner, assignment_time, completed, completion_time, verifiers) = ASSIGNMENT_RECORD.unpack_from(
+                self._buffer, self._assignments_offset + index * ASSIGNMENT_RECORD.size)
+        return {
+            'task_id': task_id,
+            'assigner': assigner,
+            'assignment_time': _unpack_time(assignment_time),
+            'completed': completed,
+            'completion_time': _unpack_time(completion_time),
+            'verifiers': _unpack_ints(self._string(verifiers))
+        }
+
+    def _string(self, ref: int):
+        if ref == NO_STRING:
+            return None
+        (start, end) = STRING_BOUNDS.unpack_from(self._buffer, self._string_bounds_offset + ref * 8)
+        return self._buffer[self._strings_offset + start:self._strings_offset + end]
+
+    def _text(self, ref: int):
+        data = self._string(ref)
+        return None if data is None else data.decode('utf-8')
+
+
+class BinaryRecord(Mapping):
+    """A record of a BinarySnapshot, read as a mapping like its JSON form."""
+    __slots__ = ('_snapshot', '_index', '_fields')
+
+    def __init__(self, snapshot: BinarySnapshot, index: int):
+        self._snapshot = snapshot
+        self._index = index
+        self._fields = None
+
+    def __getitem__(self, name):
+        if name == 'key' and self._fields is None:
+            return self._snapshot.key_at(self._index)
+        return self._decoded()[name]
+
+    def __iter__(self):
+        return iter(self._decoded())
+
+    def __len__(self):
+        return len(self._decoded())
+
+    def _decoded(self):
+        if self._fields is None:
+            self._fields = self._snapshot.decode(self._index)
+        return self._fields
+
+
+class AssignmentRecords(Sequence):
+    """A Player's serialized Assignments in a BinarySnapshot, each decoded when accessed."""
+    __slots__ = ('_snapshot', '_first', '_count')
+
+    def __init__(self, snapshot: BinarySnapshot, first: int, count: int):
+        self._snapshot = snapshot
+        self._first = first
+        self._count = count
+
+    def __len__(self):
+        return self._count
+
+    def __getitem__(self, index: int):
+        if index < 0:
+            index += self._count
+        if not 0 <= index < self._count:
+            raise IndexError(index)
+        return self._snapshot.decode_assignment(self._first + index)
+
+
+def json_to_binary(json_path, binary_path, kind: str):
+    """Convert a JSON snapshot of a list of the given kind to a binary snapshot."""
+    with open(json_path, 'r') as file:
+        records = json.load(file)
+    write_binary_snapshot(binary_path, kind, records)
+
+
+def binary_to_json(binary_path, json_path):
+    """Convert a binary snapshot to a JSON snapshot."""
+    snapshot = BinarySnapshot(binary_path)
+    tmp_path = json_path + ".tmp"
+    with open(tmp_path, 'w') as file:
+        json.dump(list(snapshot), file, default=json_default)
+    os.replace(tmp_path, json_path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert data list snapshots between JSON and binary forms.")
+    commands = parser.add_subparsers(dest='command', required=True)
+    to_binary = commands.add_parser('to-binary')
+    to_binary.add_argument('json_path')
+    to_binary.add_argument('binary_path')
+    to_binary.add_argument('kind', choices=KINDS)
+    to_json = commands.add_parser('to-json')
+    to_json.add_argument('binary_path')
+    to_json.add_argument('json_path')
+    args = parser.parse_args()
+    if args.command == 'to-binary':
+        json_to_binary(args.json_path, args.binary_path, args.kind)
+    else:
+        binary_to_json(args.binary_path, args.json_path)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,12 +1,15 @@
 import logging
+import sys
 from discord import Emoji
 
 log = logging.getLogger(__name__)
 
 class Category:
+    __slots__ = ('key', 'name', 'emoji', 'description', '__weakref__')
+
     def __init__(self, key: int, name: str, emoji: Emoji, description: str):
         self.key = key
-        self.name = name
+        self.name = sys.intern(name)
 
         self.emoji = emoji
         self.description = description
@@ -25,7 +28,7 @@ class Category:
             'key': self.key,
             'name': self.name,
             'emoji': self.emoji.id,
-            'self.description': self.description
+            'description': self.description
         }
 
     @classmethod
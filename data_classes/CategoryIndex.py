@@ -0,0 +1,69 @@
+import logging
+
+log = logging.getLogger(__name__)
+
+# The bit positions set in each possible byte, for walking the set bits of a bitmap a byte at a time.
+_BYTE_BITS = [tuple(bit for bit in range(8) if byte >> bit & 1) for byte in range(256)]
+
+
+class CategoryIndex:
+    """
+    Inverted index mapping each category_id to a bitmap of the Tasks in that category.
+
+    Bit n of a bitmap stands for the Task with task_id n, and bit n of a category mask for the Category with key n.
+    Both kinds of key are handed out lowest-first by get_available_key, so they serve directly as compact bit positions.
+
+    The version increases whenever a Task is added or removed, its categories change or it is rated, so that anything
+    derived from which Tasks are eligible, or from their ratings, can tell when it is stale.
+    """
+    def __init__(self):
+        self.all_tasks = 0
+        self.version = 0
+        self._tasks_by_category = {}
+
+    def add_task(self, task):
+        """Index a Task and its current categories."""
+        self.all_tasks |= 1 << task.task_id
+        for category_id in task.categories:
+            self.category_added(task.task_id, category_id)
+        self.version += 1
+
+    def remove_task(self, task):
+        """Remove a Task from the index and from every category."""
+        bit = ~(1 << task.task_id)
+        self.all_tasks &= bit
+        for (category_id, bitmap) in self._tasks_by_category.items():
+            self._tasks_by_category[category_id] = bitmap & bit
+        self.version += 1
+
+    def category_added(self, task_id: int, category_id: int):
+        self._tasks_by_category[category_id] = self._tasks_by_category.get(category_id, 0) | 1 << task_id
+        self.version += 1
+
+    def category_removed(self, task_id: int, category_id: int):
+        self._tasks_by_category[category_id] = self._tasks_by_category.get(category_id, 0) & ~(1 << task_id)
+        self.version += 1
+
+    def ratings_changed(self, task_id: int):
+        self.version += 1
+
+    def get_tasks_in_categories(self, category_ids):
+        """Return a bitmap of the Tasks in any of the given categories."""
+        bitmap = 0
+        for category_id in category_ids:
+            bitmap |= self._tasks_by_category.get(category_id, 0)
+        return bitmap
+
+    def get_eligible_tasks(self, limits):
+        """Return a bitmap of the Tasks in none of the categories set as limits."""
+        return self.all_tasks & ~self.get_tasks_in_categories(limits)
+
+    @staticmethod
+    def keys(bitmap: int):
+        """Yield the task_ids set in a bitmap, in ascending order."""
+        data = bitmap.to_bytes((bitmap.bit_length() + 7) // 8, 'little')
+        for (index, byte) in enumerate(data):
+            if byte:
+                base = index * 8
+                for bit in _BYTE_BITS[byte]:
+                    yield base + bit
@@ -0,0 +1,77 @@
+import asyncio
+import logging
+
+from diagnostics.Watchdog import labelled
+from discord import HTTPException
+
+log = logging.getLogger(__name__)
+
+CLICK_WINDOW = 0.25
+
+
+class ClickQueue:
+    """
+    Queues button clicks per Interface message and handles them in batches.
+
+    Clicks arriving within window seconds of the first are handled together, in order. Each batch then costs at most
+    one Embed edit, if any handler asked for one, plus one cleanup of its button presses through the
+    ReactionDispatcher, paced against the channel's reaction rate limit.
+    """
+    def __init__(self, window: float = CLICK_WINDOW):
+        self.window = window
+
+        self._pending = {}
+        self._drainers = {}
+
+    def submit(self, interface, event, user):
+        """Queue a click on an Interface to be handled with the rest of its batch."""
+        message_id = interface.message_id
+        self._pending.setdefault(message_id, []).append((event, user))
+        if message_id not in self._drainers:
+            self._drainers[message_id] = asyncio.get_event_loop().create_task(self._drain(interface))
+
+    async def join(self):
+        """Wait until every queued click has been handled."""
+        while self._drainers:
+            await asyncio.gather(*self._drainers.values(), return_exceptions=True)
+
+    async def _drain(self, interface):
+        message_id = interface.message_id
+        try:
+            while message_id in self._pending:
+                await asyncio.sleep(self.window)
+                batch = self._pending.pop(message_id)
+                try:
+                    with labelled(f"interface {message_id}"):
+                        await self._handle_batch(interface, batch)
+                except Exception as exc:
+                    # Keep draining, so that later clicks on this Interface are still handled.
+                    log.exception(f"Error handling clicks on Interface {message_id}", exc_info=exc)
+        finally:
+            del self._drainers[message_id]
+
+    async def _handle_batch(self, interface, batch):
+        needs_update = False
+        for (event, user) in batch:
+            try:
+                needs_update |= bool(await interface.handle_click(event, user))
+            except Exception as exc:
+                log.exception(f"Error handling {event.emoji} on Interface {interface.message_id}", exc_info=exc)
+
+        try:
+            message = await interface.get_message()
+            if needs_update:
+                await interface.update(message=message)
+            await self._clear_presses(interface, message, batch)
+        except (HTTPException, ValueError) as exc:
+            log.exception(f"Could not update Interface {interface.message_id}", exc_info=exc)
+
+    async def _clear_presses(self, interface, message, batch):
+        emojis = interface.buttons()
+        buttons = {str(emoji): emoji for emoji in emojis}
+        presses = [(buttons[str(event.emoji)], user) for (event, user) in batch if str(event.emoji) in buttons]
+        if not presses:
+            return
+        failures = await interface.bot.reaction_dispatcher.clear_presses(message, presses, emojis)
+        for (emoji, exc) in failures:
+            log.warning(f"Could not clear {emoji or 'buttons'} on Interface {interface.message_id}: {exc}")
@@ -1,8 +1,12 @@
 import logging
+import time
 from discord import Embed, Emoji, Member, Message, Reaction, User
 from discord.abc import Messageable
 from discord import NotFound, Forbidden, HTTPException
 
+from data_classes.Outbound import PRIORITIES
+from data_classes.Pagination import Paginator
+
 log = logging.getLogger(__name__)
 logging.basicConfig()
 log.setLevel(logging.DEBUG)
@@ -33,6 +37,27 @@ COLORS = {
     'confirm': 0x33ff33,
     'error': 0xff3333
 }
+INTERFACE_TYPES = {}
+# Seconds a Player must wait between begs for a Task.
+BEG_COOLDOWN = 60 * 60
+
+
+def interface_type(tag: str):
+    """Class decorator registering an Interface subclass under the type tag used in its serialized form."""
+    def register(cls):
+        cls.TYPE = tag
+        INTERFACE_TYPES[tag] = cls
+        return cls
+    return register
+
+
+def button(emoji: str):
+    """Method decorator marking a coroutine as the handler for clicks on a given button."""
+    def mark(handler):
+        handler.button_emoji = emoji
+        return handler
+    return mark
+
 
 class Interface:
     """
@@ -43,80 +68,208 @@ class Interface:
     An Interface typically has a number of Reactions that act as buttons.
 
     Most Interface class methods allow an optional Message parameter to reduce API calls to fetch the same message.
+    Otherwise the message handle comes from the InterfaceList's MessageCache, which rarely needs to fetch.
+
+    Built Embeds are kept until render_key() changes, and update() skips the edit if the Embed matches the one last sent.
+
+    Subclasses register their type with @interface_type, and their click handlers with @button, so that both
+    deserialization and click routing are dict lookups.
+    Click handlers only change state; they return True if the Embed needs updating, and the ClickQueue takes care of
+    updating it and removing the button presses once per batch of clicks.
     """
+    TYPE = None
+    BUTTON_HANDLERS = {}
+    # Called with (Interface, emoji, seconds) after each handled click, if set.
+    click_timer = None
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        handlers = dict(cls.BUTTON_HANDLERS)
+        for attribute in cls.__dict__.values():
+            if hasattr(attribute, 'button_emoji'):
+                handlers[attribute.button_emoji] = attribute
+        cls.BUTTON_HANDLERS = handlers
+
     def __init__(self, bot):
         self.bot = bot
         self.message_id = None
+        self.channel_id = None
         self.pages = False
         self.page = 0
 
+        self._embed = None
+        self._embed_key = None
+        self._sent_payload = None
+
     @classmethod
     def from_dict(cls, bot, d):
-        if d['type'] == "actions":
-            return ActionsInterface.from_dict(bot, d)
-        if d['type'] == "categoryInfo":
-            return CategoryInfoInterface.from_dict(bot, d)
-        if d['type'] == "limits":
-            return LimitsInterface.from_dict(bot, d)
-        if d['type'] == "categories":
-            return CategoriesInterface.from_dict(bot, d)
-        if d['type'] == "assignments":
-            return AssignmentsInterface.from_dict(bot, d)
-        if d['type'] == "tasks":
-            return TasksInterface.from_dict(bot, d)
-        if d['type'] == "verification":
-            return VerificationInterface.from_dict(bot, d)
+        if d['type'] not in INTERFACE_TYPES:
+            raise ValueError(f"Unknown Interface type '{d['type']}' for message {d['key']}")
+        return INTERFACE_TYPES[d['type']].from_dict(bot, d)
 
     async def get_message(self):
-        """Gets the message containing the Embed that represents this Interface through an API call."""
-        # TODO: Can throw (NotFound, Forbidden, HTTPException)
-        message = await self.bot.fetch_message(self.message_id)
+        """Gets the message containing the Embed that represents this Interface, through an API call if not cached."""
+        if self.channel_id is None:
+            raise ValueError(f"Channel of Interface {self.message_id} is not known yet.")
+        message = await self.bot.interface_list.message_cache.fetch_message(self.message_id, self.channel_id)
+        if message is None:
+            raise ValueError(f"Message of Interface {self.message_id} was deleted or can't be read.")
         return message
 
     async def post(self, channel: Messageable):
         """Posts a message containing the Embed that represents this Interface to the given channel."""
-        message = await channel.send(embed=self.build_embed())
+        embed = self.get_embed()
+        message = await self.bot.outbound.send(channel, embed=embed, priority=PRIORITIES['PANEL'])
         self.message_id = message.id
+        self.channel_id = message.channel.id
+        self.bot.interface_list.message_cache.put(message)
+        self._sent_payload = embed.to_dict()
         return message
 
     async def update(self, message: Message = None):
-        """Updates the Interface Message with a fresh Embed."""
+        """Updates the Interface Message with a fresh Embed, unless it would be identical to the current one."""
+        embed = self.get_embed()
+        payload = embed.to_dict()
+        if payload == self._sent_payload:
+            return
         if message is None:
             message = await self.get_message()
         # TODO: Can throw (Forbidden, HTTPException)
-        await message.edit(embed=self.build_embed())
+        await self.bot.outbound.edit(message, embed=embed)
+        self._sent_payload = payload
+
+    def get_embed(self):
+        """Return the Embed for this Interface, only building it again if render_key() has changed."""
+        key = self.render_key()
+        if self._embed is None or key is None or key != self._embed_key:
+            self._embed = self.build_embed()
+            self._embed_key = key
+        return self._embed
+
+    def render_key(self):
+        """Return a value that changes whenever build_embed() would build a different Embed, or None to always build."""
+        return None
 
     async def add_button(self, emoji: Emoji, message: Message = None):
         if message is None:
             message = await self.get_message()
         # TODO: Can throw (HTTPException, Forbidden, NotFound, InvalidArgument)
-        await message.add_reaction(emoji)
+        await self.bot.outbound.add_reaction(message, emoji)
 
     async def clear_buttons(self, message: Message = None):
         if message is None:
             message = await self.get_message()
         # TODO: Can throw (Forbidden, HTTPException)
-        await message.clear_reactions()
+        await self.bot.outbound.clear_reactions(message)
 
     async def remove_button_press(self, emoji: Emoji, member: Member, message: Message = None):
         if message is None:
             message = await self.get_message()
         # TODO: Can throw (HTTPException, Forbidden, NotFound, InvalidArgument)
-        await message.remove_reaction(emoji, member)
+        await self.bot.outbound.remove_reaction(message, emoji, member)
 
     def build_embed(self):
         """Create the Embed object for this Interface."""
         raise NotImplementedError
 
-    async def add_buttons(self):
+    def buttons(self):
+        """Return the emojis of the buttons this Interface needs, in the order they should appear."""
+        return list(self.BUTTON_HANDLERS)
+
+    async def add_buttons(self, message: Message = None):
         """Add the required buttons for this Interface."""
-        raise NotImplementedError
+        if message is None:
+            message = await self.get_message()
+        await self.bot.reaction_dispatcher.install([(message, self.buttons())])
 
     async def handle_click(self, event, user: User):
-        """Handle a reaction being added to the Embed."""
+        """
+        Handle a reaction being added to the Embed, by passing it to the handler registered for its emoji.
+        Returns True if the Embed needs updating.
+        """
+        emoji = str(event.emoji)
+        handler = self.BUTTON_HANDLERS.get(emoji)
+        if handler is None:
+            return False
+        log.info(f"{emoji} clicked on Interface: {self}")
+        start = time.perf_counter()
+        try:
+            return await handler(self, event, user)
+        finally:
+            if Interface.click_timer is not None:
+                Interface.click_timer(self, emoji, time.perf_counter() - start)
+
+
+class PagedInterface(Interface):
+    """
+    Base class for Interfaces that show a list of items a page at a time, with buttons to move between pages.
+    Only the items on the visible page are built into the Embed, and neighbouring pages are kept ready by a Paginator.
+    """
+    PAGE_SIZE = 10
+
+    def __init__(self, bot):
+        super().__init__(bot)
+        self.pages = True
+
+        self._paginator = None
+
+    @property
+    def paginator(self):
+        if self._paginator is None:
+            self._paginator = Paginator(self.page_source, self.PAGE_SIZE, count=self.count_items)
+        return self._paginator
+
+    def page_source(self):
+        """Return an iterable of all the items to be paged through, in a stable order."""
+        raise NotImplementedError
+
+    def count_items(self):
+        """Return the number of items returned by page_source()."""
+        raise NotImplementedError
+
+    def page_version(self):
+        """Return a value that changes whenever page_source() would return different items."""
         raise NotImplementedError
 
+    def build_page_embed(self):
+        """Create the Embed for this Interface, without any items."""
+        raise NotImplementedError
+
+    def add_item_field(self, embed: Embed, item):
+        """Add a field describing one item to the Embed."""
+        raise NotImplementedError
 
+    def render_key(self):
+        return self.page_version(), self.page
+
+    def build_embed(self):
+        version = self.page_version()
+        page_count = self.paginator.get_page_count(version)
+        self.page = min(self.page, page_count - 1)
+        embed = self.build_page_embed()
+        for item in self.paginator.get_page(self.page, version):
+            self.add_item_field(embed, item)
+        embed.set_footer(text="Page {} of {}".format(self.page + 1, page_count))
+        return embed
+
+    @button(SYMBOLS['BACK_ARROW'])
+    async def on_back(self, event, user: User):
+        if self.page == 0:
+            return False
+        self.page -= 1
+        self.bot.interface_list.record(self.message_id)
+        return True
+
+    @button(SYMBOLS['FWRD_ARROW'])
+    async def on_forward(self, event, user: User):
+        if self.page + 1 >= self.paginator.get_page_count(self.page_version()):
+            return False
+        self.page += 1
+        self.bot.interface_list.record(self.message_id)
+        return True
+
+
+@interface_type("actions")
 class ActionsInterface(Interface):
     """Interface for various one-click game actions."""
     def __init__(self, bot):
@@ -126,6 +279,7 @@ class ActionsInterface(Interface):
     def from_dict(cls, bot, d):
         interface = ActionsInterface(bot)
         interface.message_id = d['key']
+        interface.channel_id = d.get('channel_id')
         interface.pages = d['pages']
         interface.page = d['page']
         return interface
@@ -133,11 +287,15 @@ class ActionsInterface(Interface):
     def to_dict(self):
         return {
             'key': self.message_id,
-            'type': "actions",
+            'channel_id': self.channel_id,
+            'type': self.TYPE,
             'pages': self.pages,
             'page': self.page
         }
 
+    def render_key(self):
+        return self.page
+
     def build_embed(self):
         embed = Embed(
                 title="Action Buttons",
@@ -165,22 +323,61 @@ class ActionsInterface(Interface):
                 inline=False)
         return embed
 
-    async def add_buttons(self, message: Message = None):
-        if message is None:
-            message = self.get_message()
-        await self.add_button(SYMBOLS['AVAILABLE'], message=message)
-        await self.add_button(SYMBOLS['UNAVAILABLE'], message=message)
-        await self.add_button(SYMBOLS['UNSET_LIMITS'], message=message)
-        await self.add_button(SYMBOLS['SET_LIMITS'], message=message)
-        await self.add_button(SYMBOLS['BEG'], message=message)
-
-    async def handle_click(self, event, user: User):
-        log.info(f"Button clicked on Interface: {self}")
-        if event.emoji == SYMBOLS['AVAILABLE']:
-            log.info(f"AVAILABLE clicked on Interface: {self}")
+    def buttons(self):
+        return [
+            SYMBOLS['AVAILABLE'],
+            SYMBOLS['UNAVAILABLE'],
+            SYMBOLS['UNSET_LIMITS'],
+            SYMBOLS['SET_LIMITS'],
+            SYMBOLS['BEG']
+        ]
+
+    @button(SYMBOLS['AVAILABLE'])
+    async def on_available(self, event, user: User):
+        player = self.bot.player_list.get_player(user)
+        self.bot.player_list.set_available(player, True)
+
+    @button(SYMBOLS['UNAVAILABLE'])
+    async def on_unavailable(self, event, user: User):
+        player = self.bot.player_list.get_player(user)
+        self.bot.player_list.set_available(player, False)
+
+    @button(SYMBOLS['UNSET_LIMITS'])
+    async def on_unset_limits(self, event, user: User):
+        player = self.bot.player_list.get_player(user)
+        player.unset_limits()
+        self.bot.player_list.record(player.player_id)
+
+    @button(SYMBOLS['BEG'])
+    async def on_beg(self, event, user: User):
+        """Assign a weighted random Task the Player who clicked does not already hold, and send it to them."""
+        player = self.bot.player_list.get_player(user)
+        if not player.available:
+            await self.bot.outbound.send(user, "Mark yourself as available before begging for a Task.")
+            return
+        now = time.time()
+        if player.last_beg_time is not None and now - player.last_beg_time < BEG_COOLDOWN:
+            minutes = int(player.last_beg_time + BEG_COOLDOWN - now) // 60 + 1
+            await self.bot.outbound.send(user, f"You can beg for another Task in {minutes} minutes.")
+            return
+        task = self.bot.task_picker.pick(player, exclude=player.assignments.keys())
+        if task is None:
+            await self.bot.outbound.send(user, "There are no new Tasks available within your limits.")
+            return
+        player.assign_task(task.task_id, self.bot.user.id)
+        player.last_beg_time = now
+        task.assigned()
+        self.bot.player_list.record(player.player_id)
+        self.bot.task_list.record(task.task_id)
+        embed = Embed(
+                title="Task {}: {}".format(task.task_id, task.task_name),
+                description=task.task_text,
+                color=COLORS['default'])
+        await self.bot.outbound.send(user, embed=embed)
 
 
-class CategoryInfoInterface(Interface):
+@interface_type("categoryInfo")
+class CategoryInfoInterface(PagedInterface):
     """Interface describing Task Categories."""
 
     def __init__(self, bot):
@@ -190,6 +387,7 @@ class CategoryInfoInterface(Interface):
     def from_dict(cls, bot, d):
         interface = CategoryInfoInterface(bot)
         interface.message_id = d['key']
+        interface.channel_id = d.get('channel_id')
         interface.pages = d['pages']
         interface.page = d['page']
         return interface
@@ -197,33 +395,38 @@ class CategoryInfoInterface(Interface):
     def to_dict(self):
         return {
             'key': self.message_id,
-            'type': "categoryInfo",
+            'channel_id': self.channel_id,
+            'type': self.TYPE,
             'pages': self.pages,
             'page': self.page
         }
 
-    def build_embed(self):
-        embed = Embed(
+    def page_source(self):
+        return self.bot.category_list.values()
+
+    def count_items(self):
+        return len(self.bot.category_list)
+
+    def page_version(self):
+        return self.bot.category_list.version
+
+    def build_page_embed(self):
+        return Embed(
                 title="Category Information",
                 description="This is a complete list of all Categories that can be applied to Tasks or set as a Limit.",
                 color=COLORS['default'])
-        for category in self.bot.category_list.values():
-            embed.add_field(
-                    name="{category.name} {category.emoji}",
-                    value=category.description)
-        return embed
 
-    async def add_buttons(self, message: Message = None):
-        if message is None:
-            message = self.get_message()
-        await self.add_button(SYMBOLS['REFRESH'], message=message)
+    def add_item_field(self, embed: Embed, category):
+        embed.add_field(
+                name=f"{category.name} {category.emoji}",
+                value=category.description)
 
-    async def handle_click(self, event, user: User):
-        log.info(f"Button clicked on Interface: {self}")
-        if event.emoji == SYMBOLS['AVAILABLE']:
-            log.info(f"AVAILABLE clicked on Interface: {self}")
+    @button(SYMBOLS['REFRESH'])
+    async def on_refresh(self, event, user: User):
+        return True
 
 
+@interface_type("limits")
 class LimitsInterface(Interface):
     """Interface for setting Player limits."""
 
@@ -236,6 +439,7 @@ class LimitsInterface(Interface):
     def from_dict(cls, bot, d):
         interface = LimitsInterface(bot, d['player_id'])
         interface.message_id = d['key']
+        interface.channel_id = d.get('channel_id')
         interface.pages = d['pages']
         interface.page = d['page']
         return interface
@@ -243,29 +447,28 @@ class LimitsInterface(Interface):
     def to_dict(self):
         return {
             'key': self.message_id,
-            'type': "limits",
+            'channel_id': self.channel_id,
+            'type': self.TYPE,
             'pages': self.pages,
             'page': self.page,
             'player_id': self.player_id
         }
 
     async def build_embed(self):
-        user = await self.bot.fetch_user(self.player_id)
-        player = self.bot.player_list.get_player_by_id(self.player_id)
+        user = await self.bot.user_resolver.resolve(self.player_id)
+        player = self.bot.player_list.get_value(self.player_id)
         embed = Embed(
-                title="Limits for {}".format(user.display_name),
+                title="Limits for {}".format(user.display_name if user is not None else self.player_id),
                 description="Click the buttons below to toggle your Limits.",
                 color=COLORS['default'])
         # TODO: For limit in player's limits, add field describing limit.
         return embed
 
-    def add_buttons(self):
-        pass
-
-    async def handle_click(self, event, user: User):
-        pass
+    def buttons(self):
+        return [category.emoji for category in self.bot.category_list.values()]
 
 
+@interface_type("categories")
 class CategoriesInterface(Interface):
     """Interface for setting Task categories."""
     def __init__(self, bot, task_id: int):
@@ -277,6 +480,7 @@ class CategoriesInterface(Interface):
     def from_dict(cls, bot, d):
         interface = CategoriesInterface(bot, d['task_id'])
         interface.message_id = d['key']
+        interface.channel_id = d.get('channel_id')
         interface.pages = d['pages']
         interface.page = d['page']
         return interface
@@ -284,29 +488,28 @@ class CategoriesInterface(Interface):
     def to_dict(self):
         return {
             'key': self.message_id,
-            'type': "categories",
+            'channel_id': self.channel_id,
+            'type': self.TYPE,
             'pages': self.pages,
             'page': self.page,
             'task_id': self.task_id
         }
 
     def build_embed(self):
-        task = self.bot.player_list.get_player_by_id(self.task_id)
+        task = self.bot.task_list.get_value(self.task_id)
         embed = Embed(
-                title="Limits for {} ({})".format(task.name, task.id),
+                title="Limits for {} ({})".format(task.task_name, task.task_id),
                 description="Click the buttons below to toggle task categories.",
                 color=COLORS['default'])
         # TODO: For category in task's categories, add field describing category.
         return embed
 
-    def add_buttons(self):
-        pass
-
-    async def handle_click(self, event, user: User):
-        pass
+    def buttons(self):
+        return [category.emoji for category in self.bot.category_list.values()]
 
 
-class AssignmentsInterface(Interface):
+@interface_type("assignments")
+class AssignmentsInterface(PagedInterface):
     """Interface for viewing Player Assignments."""
     def __init__(self, bot, player_id: int):
         super().__init__(bot)
@@ -317,6 +520,7 @@ class AssignmentsInterface(Interface):
     def from_dict(cls, bot, d):
         interface = AssignmentsInterface(bot, d['player_id'])
         interface.message_id = d['key']
+        interface.channel_id = d.get('channel_id')
         interface.pages = d['pages']
         interface.page = d['page']
         return interface
@@ -324,23 +528,38 @@ class AssignmentsInterface(Interface):
     def to_dict(self):
         return {
             'key': self.message_id,
-            'type': "assignments",
+            'channel_id': self.channel_id,
+            'type': self.TYPE,
             'pages': self.pages,
             'page': self.page,
             'player_id': self.player_id
         }
 
-    def build_embed(self):
-        pass
+    def page_source(self):
+        return self.bot.player_list.get_value(self.player_id).assignments.values()
 
-    def add_buttons(self):
-        pass
+    def count_items(self):
+        return len(self.bot.player_list.get_value(self.player_id).assignments)
 
-    async def handle_click(self, event, user: User):
-        pass
+    def page_version(self):
+        return self.bot.player_list.key_version(self.player_id)
+
+    def build_page_embed(self):
+        return Embed(
+                title="Assignments",
+                description="Tasks assigned to <@{}>.".format(self.player_id),
+                color=COLORS['default'])
+
+    def add_item_field(self, embed: Embed, assignment):
+        task = self.bot.task_list.get_value(assignment.task_id)
+        embed.add_field(
+                name="{}: {}".format(task.task_id, task.task_name),
+                value="Completed" if assignment.completed else "Not yet completed",
+                inline=False)
 
 
-class TasksInterface(Interface):
+@interface_type("tasks")
+class TasksInterface(PagedInterface):
     """Interface for viewing Player Tasks (as in, user created Tasks)."""
     def __init__(self, bot, player_id: int):
         super().__init__(bot)
@@ -351,6 +570,7 @@ class TasksInterface(Interface):
     def from_dict(cls, bot, d):
         interface = TasksInterface(bot, d['player_id'])
         interface.message_id = d['key']
+        interface.channel_id = d.get('channel_id')
         interface.pages = d['pages']
         interface.page = d['page']
         return interface
@@ -358,21 +578,36 @@ class TasksInterface(Interface):
     def to_dict(self):
         return {
             'key': self.message_id,
-            'type': "tasks",
+            'channel_id': self.channel_id,
+            'type': self.TYPE,
             'pages': self.pages,
-            'page': self.page
+            'page': self.page,
+            'player_id': self.player_id
         }
 
-    def build_embed(self):
-        pass
+    def page_source(self):
+        return self.bot.task_list.get_tasks_by_player(self.player_id).values()
 
-    def add_buttons(self):
-        pass
+    def count_items(self):
+        return self.bot.task_list.count_tasks_by_player(self.player_id)
 
-    async def handle_click(self, event, user: User):
-        pass
+    def page_version(self):
+        return self.bot.task_list.player_tasks_version(self.player_id)
+
+    def build_page_embed(self):
+        return Embed(
+                title="Tasks",
+                description="Tasks written by <@{}>.".format(self.player_id),
+                color=COLORS['default'])
+
+    def add_item_field(self, embed: Embed, task):
+        embed.add_field(
+                name="{}: {}".format(task.task_id, task.task_name),
+                value=task.task_text[:1024],
+                inline=False)
 
 
+@interface_type("verification")
 class VerificationInterface(Interface):
     """Interface for verifying Task completion."""
     def __init__(self, bot, player_id: int, task_id: int):
@@ -385,6 +620,7 @@ class VerificationInterface(Interface):
     def from_dict(cls, bot, d):
         interface = VerificationInterface(bot, d['player_id'], d['task_id'])
         interface.message_id = d['key']
+        interface.channel_id = d.get('channel_id')
         interface.pages = d['pages']
         interface.page = d['page']
         return interface
@@ -392,7 +628,8 @@ class VerificationInterface(Interface):
     def to_dict(self):
         return {
             'key': self.message_id,
-            'type': "verification",
+            'channel_id': self.channel_id,
+            'type': self.TYPE,
             'pages': self.pages,
             'page': self.page,
             'player_id': self.player_id,
@@ -401,9 +638,3 @@ class VerificationInterface(Interface):
 
     def build_embed(self):
         pass
-
-    def add_buttons(self):
-        pass
-
-    async def handle_click(self, event, user: User):
-        pass
@@ -0,0 +1,159 @@
+import logging
+
+log = logging.getLogger(__name__)
+
+# Points a Player earns for each kind of contribution during a season.
+POINTS = {
+    'completions': 2,
+    'verified': 3,
+    'authored': 1,
+}
+
+
+def is_season_completion(completed: bool, completion_time, since: float):
+    """Whether an Assignment counts as completed in a season that began at since. A missing time counts as 0."""
+    return bool(completed) and (completion_time or 0) >= since
+
+
+def is_season_verified(completed: bool, completion_time, verifiers, since: float):
+    """
+    Whether an Assignment counts as verified in a season that began at since: completed in the season, with at least
+    one verifier, whenever it was added. Rebuilding the Leaderboard and updating it as Players play both count this.
+    """
+    return is_season_completion(completed, completion_time, since) and bool(verifiers)
+
+
+class FenwickTree:
+    """
+    A binary indexed tree of counts at positions 1 to size.
+    Adding to a count, taking a prefix sum and finding the position where a prefix sum is reached all take O(log size).
+    The tree doubles in size when a position beyond the end is added to.
+    """
+    def __init__(self, size: int = 64):
+        self._counts = [0] * (size + 1)
+        self._tree = [0] * (size + 1)
+        self.total = 0
+
+    @property
+    def size(self):
+        return len(self._tree) - 1
+
+    def add(self, position: int, delta: int):
+        if position > self.size:
+            self._grow(position)
+        self._counts[position] += delta
+        self.total += delta
+        while position <= self.size:
+            self._tree[position] += delta
+            position += position & -position
+
+    def prefix_sum(self, position: int):
+        """Return the sum of the counts at positions 1 to position."""
+        position = min(position, self.size)
+        result = 0
+        while position > 0:
+            result += self._tree[position]
+            position -= position & -position
+        return result
+
+    def find(self, count: int):
+        """Return the lowest position whose prefix sum is at least count, for 1 <= count <= total."""
+        position = 0
+        step = 1 << self.size.bit_length()
+        while step:
+            next_position = position + step
+            if next_position <= self.size and self._tree[next_position] < count:
+                position = next_position
+                count -= self._tree[position]
+            step >>= 1
+        return position + 1
+
+    def _grow(self, position: int):
+        size = self.size
+        while size < position:
+            size *= 2
+        counts = self._counts + [0] * (size + 1 - len(self._counts))
+        self._counts = [0] * (size + 1)
+        self._tree = [0] * (size + 1)
+        self.total = 0
+        for (index, count) in enumerate(counts):
+            if count:
+                self.add(index, count)
+
+
+class Leaderboard:
+    """
+    Season scores for Players, kept up to date as they complete, get verified and author Tasks.
+
+    A FenwickTree counts how many Players hold each score, so a Player's rank is a prefix sum and the top k are found
+    by walking down from the highest score, both in logarithmic time rather than by sorting every Player.
+    Players only appear once they have scored.
+    """
+    def __init__(self, season_begin: float = None):
+        self.season_begin = season_begin or 0
+
+        self._contributions = {}
+        self._scores = {}
+        self._players_by_score = {}
+        self._tree = FenwickTree()
+
+    def rebuild(self, player_list, task_list):
+        """Score everything done since the season began, replacing any current scores."""
+        self._contributions = {}
+        self._scores = {}
+        self._players_by_score = {}
+        self._tree = FenwickTree()
+        for (player_id, completions, verified) in player_list.count_completions_since(self.season_begin):
+            self.add(player_id, 'completions', completions)
+            if verified:
+                self.add(player_id, 'verified', verified)
+        for (creator_id, authored) in task_list.count_authored_since(self.season_begin):
+            self.add(creator_id, 'authored', authored)
+
+    def add(self, player_id: int, contribution: str, count: int = 1):
+        """Count a Player's contribution, one of the keys of POINTS, and move them up the standings."""
+        contributions = self._contributions.setdefault(player_id, dict.fromkeys(POINTS, 0))
+        contributions[contribution] += count
+        self._set_score(player_id, self._scores.get(player_id, 0) + POINTS[contribution] * count)
+
+    def get_contributions(self, player_id: int):
+        """Return a dict of the counts of each contribution a Player made this season."""
+        return dict(self._contributions.get(player_id, dict.fromkeys(POINTS, 0)))
+
+    def get_score(self, player_id: int):
+        return self._scores.get(player_id, 0)
+
+    def get_rank(self, player_id: int):
+        """Return a Player's rank, counting from 1 and shared by equal scores, or None if they have not scored."""
+        score = self._scores.get(player_id)
+        if score is None:
+            return None
+        return self._tree.total - self._tree.prefix_sum(score) + 1
+
+    def get_top(self, count: int):
+        """Return a list of (rank, player_id, score) for the top count Players, highest score first."""
+        top = []
+        seen = 0
+        while len(top) < count and seen < self._tree.total:
+            score = self._tree.find(self._tree.total - seen)
+            players = sorted(self._players_by_score[score])
+            top.extend((seen + 1, player_id, score) for player_id in players)
+            seen += len(players)
+        return top[:count]
+
+    def __len__(self):
+        return self._tree.total
+
+    def _set_score(self, player_id: int, score: int):
+        old = self._scores.get(player_id)
+        if old is not None:
+            self._tree.add(old, -1)
+            self._players_by_score[old].discard(player_id)
+            if not self._players_by_score[old]:
+                del self._players_by_score[old]
+        if score > 0:
+            self._scores[player_id] = score
+            self._tree.add(score, 1)
+            self._players_by_score.setdefault(score, set()).add(player_id)
+        else:
+            self._scores.pop(player_id, None)
@@ -1,11 +1,18 @@
-import json
 import logging
+import random
+import time
+from collections.abc import MutableMapping
 from typing import Any, Coroutine
 
 import data_classes.Interfaces as Interfaces
 from data_classes.Category import Category
+from data_classes.CategoryIndex import CategoryIndex
+from data_classes.Leaderboard import is_season_completion, is_season_verified
+from data_classes.MessageCache import MessageCache
+from data_classes.Persistence import Journal, read_records, write_snapshot
 from data_classes.Player import Player
 from data_classes.Task import Task
+from data_classes.TaskStats import TaskStats
 from discord import Emoji, User, Message
 from discord.abc import Messageable
 
@@ -13,14 +20,83 @@ log = logging.getLogger(__name__)
 logging.basicConfig()
 log.setLevel(logging.DEBUG)
 
+class LazyRecords(MutableMapping):
+    """
+    A mapping of key to value that holds serialized records and only deserializes a value when it is first accessed.
+    Records that were never accessed are handed back unchanged when saving, so they never need deserializing at all.
+    """
+    def __init__(self, records, deserialize):
+        self._records = {v['key']: v for v in records}
+        self._deserialize = deserialize
+        self._loaded = {}
+
+    def __getitem__(self, key):
+        if key not in self._loaded:
+            self._loaded[key] = self._deserialize(self._records.pop(key))
+        return self._loaded[key]
+
+    def __setitem__(self, key, value):
+        self._records.pop(key, None)
+        self._loaded[key] = value
+
+    def __delitem__(self, key):
+        if key in self._records:
+            del self._records[key]
+        else:
+            del self._loaded[key]
+
+    def __contains__(self, key):
+        return key in self._loaded or key in self._records
+
+    def __iter__(self):
+        yield from list(self._loaded)
+        yield from list(self._records)
+
+    def __len__(self):
+        return len(self._loaded) + len(self._records)
+
+    def iter_records(self):
+        """Yield every serialized record, serializing only the values that have been accessed."""
+        for v in self._loaded.values():
+            yield v.to_dict()
+        yield from self._records.values()
+
+
 class CannedDict:
-    """A class that creates a dictionary and manages loading and saving the dictionary to a specified file."""
-    def __init__(self, bot, path):
+    """
+    A class that creates a dictionary and manages loading and saving the dictionary to a specified file.
+
+    In journal mode, changes to single keys are appended to a journal next to the file instead of rewriting it.
+    With deferred writes, saving only marks the list dirty, and a WriteBehind writes the changes out later.
+
+    The version increases every time the list is saved or a change is recorded, so that anything rendered from the
+    list can tell when it is stale. key_version does the same for a single key, for anything rendered from one value.
+
+    Records already read from the file, for instance on a worker thread at startup, can be passed in instead of
+    having the list read them itself. Subclasses with LAZY set keep values serialized until they are first accessed.
+
+    With binary set, the list is saved as a binary snapshot of its KIND instead of JSON. Either form can be loaded.
+    """
+    LAZY = False
+    KIND = None
+    # Called with (KIND, operation, seconds) after the list is loaded, saved, journaled or has a row recorded, if set.
+    io_timer = None
+
+    def __init__(self, bot, path, journal: bool = False, records=None, binary: bool = False):
         self.bot = bot
         self._path = path
         self._list = {}
+        self._kind = self.KIND if binary else None
+        self._journal = Journal(path, kind=self._kind) if journal else None
+        self.version = 0
+        self._saved_version = 0
+        self._key_versions = {}
+
+        self._deferred = False
+        self._dirty = False
+        self._pending_keys = set()
 
-        self.load(bot)
+        self._timed('load', self.load, bot, records)
 
     def __contains__(self, key):
         return key in self._list
@@ -28,11 +104,96 @@ class CannedDict:
     def __getitem__(self, key):
         return self._list[key]
 
+    def __len__(self):
+        return len(self._list)
+
+    def load(self, bot, records=None):
+        """Load a file and deserialize the list, replaying any journaled changes, unless given the records."""
+        if records is None:
+            records = read_records(self._path, self._journal is not None)
+        if self.LAZY:
+            self._list = LazyRecords(records, lambda d: self.from_dict(bot, d))
+        else:
+            self._list = {v['key']: self.from_dict(bot, v) for v in records}
+
+    def from_dict(self, bot, d):
+        """Deserialize a single value of the list."""
+        raise NotImplementedError
+
     def save(self):
         """Serialize the list and save to a file."""
-        json.dump(
-                [v.to_dict() for v in self._list.values()],
-                open(self._path, 'w'))
+        self.version += 1
+        self._saved_version = self.version
+        self._write_all()
+
+    def _write_all(self):
+        if self._deferred:
+            self._dirty = True
+            self._pending_keys.clear()
+            return
+        records = self._iter_records()
+        if self._journal is None:
+            self._timed('save', write_snapshot, self._path, records, self._kind)
+        else:
+            self._timed('save', self._journal.reset, records)
+
+    def record(self, key):
+        """Persist a change to a single key. Appends to the journal in journal mode, otherwise saves the list."""
+        self.version += 1
+        self._key_versions[key] = self.version
+        if self._journal is None:
+            self._write_all()
+        elif self._deferred:
+            if not self._dirty:
+                self._pending_keys.add(key)
+        else:
+            self._timed('journal', self._journal.append, [self._journal_entry(key)])
+
+    def defer_writes(self):
+        """Only mark the list as changed when saving, leaving the writing to a WriteBehind."""
+        self._deferred = True
+
+    def key_version(self, key):
+        """A number that increases whenever a change to a key is recorded, or the whole list is saved."""
+        return max(self._saved_version, self._key_versions.get(key, 0))
+
+    def take_pending_write(self):
+        """
+        Copy outstanding changes and clear them. Returns a callable that writes the copy, or None.
+        The callable does not touch the list, so it can safely run on another thread.
+        """
+        if self._dirty:
+            records = list(self._iter_records())
+            self._dirty = False
+            self._pending_keys.clear()
+            if self._journal is None:
+                return lambda: self._timed('save', write_snapshot, self._path, records, self._kind)
+            return lambda: self._timed('save', self._journal.reset, records)
+        if self._pending_keys:
+            entries = [self._journal_entry(key) for key in self._pending_keys]
+            self._pending_keys.clear()
+            return lambda: self._timed('journal', self._journal.append, entries)
+        return None
+
+    def _timed(self, operation: str, func, *args):
+        """Call func with args, reporting how long it took to io_timer."""
+        start = time.perf_counter()
+        try:
+            return func(*args)
+        finally:
+            if CannedDict.io_timer is not None:
+                CannedDict.io_timer(self.KIND, operation, time.perf_counter() - start)
+
+    def _iter_records(self):
+        """Serialize the values of the list one at a time, so that saving never holds every record at once."""
+        if isinstance(self._list, LazyRecords):
+            return self._list.iter_records()
+        return (v.to_dict() for v in self._list.values())
+
+    def _journal_entry(self, key):
+        if key in self._list:
+            return {'op': 'set', 'key': key, 'value': self._list[key].to_dict()}
+        return {'op': 'del', 'key': key}
 
     def has_key(self, key):
         """Returns True if key is present in list."""
@@ -54,10 +215,10 @@ class CannedDict:
 
 class CategoryList(CannedDict):
     """Manages a dictionary mapping category_id to Category."""
+    KIND = "categories"
 
-    def load(self, bot):
-        """Load a file and deserialize the list."""
-        self._list = {v['key']: Category.from_dict(bot, v) for v in json.load(open(self._path, 'r'))}
+    def from_dict(self, bot, d):
+        return Category.from_dict(bot, d)
 
     def get_category_by_emoji(self, emoji: Emoji):
         """Return the Category associated with a given Emoji, or None."""
@@ -68,26 +229,118 @@ class CategoryList(CannedDict):
         key = self.get_available_key()
         category = Category(key, name, emoji, description)
         self._list[key] = category
-        self.save()
+        self.record(key)
         return key, category
 
 class PlayerList(CannedDict):
-    """Manages a dictionary mapping user_id to Player"""
+    """
+    Manages a dictionary mapping user_id to Player.
+
+    The keys of available Players are kept in a list, with each key's position in a dict, so that availability can
+    be changed, and available Players sampled, in constant time. Availability must be changed through set_available.
+    """
+    KIND = "players"
 
-    def load(self, bot):
-        """Load a file and deserialize the list."""
-        self._list = {v['key']: Player.from_dict(bot, v) for v in json.load(open(self._path, 'r'))}
+    def load(self, bot, records=None):
+        super().load(bot, records)
+        self._available_keys = []
+        self._available_positions = {}
+        for (key, player) in self._list.items():
+            if player.available:
+                self._add_available(key)
+
+    def from_dict(self, bot, d):
+        return Player.from_dict(bot, d)
 
     def get_player(self, user: User):
         """Return a Player for a given user_id. Adds the Player if not already in the PlayerList."""
         if user.id not in self._list:
             self._list[user.id] = Player(user.id)
-            self.save()
+            self.record(user.id)
         return self._list[user.id]
 
+    def set_available(self, player: Player, available: bool):
+        """Mark a Player as available or unavailable to receive assignments."""
+        if player.available == available:
+            return
+        player.available = available
+        if available:
+            self._add_available(player.player_id)
+        else:
+            self._remove_available(player.player_id)
+        self.record(player.player_id)
+
     def get_available_players(self):
         """Return a dict mapping player_id to Player for Players who are marked as available."""
-        return {k: v for (k, v) in self._list.items() if v.available}
+        return {k: self._list[k] for k in self._available_keys}
+
+    def count_available_players(self):
+        return len(self._available_keys)
+
+    def sample_available_players(self, count: int = 1):
+        """Return a list of up to count distinct Players chosen at random from those marked as available."""
+        keys = random.sample(self._available_keys, min(count, len(self._available_keys)))
+        return [self._list[k] for k in keys]
+
+    def _add_available(self, key):
+        self._available_positions[key] = len(self._available_keys)
+        self._available_keys.append(key)
+
+    def _remove_available(self, key):
+        # Move the last key into the removed key's position, so that removal never shifts the list.
+        position = self._available_positions.pop(key)
+        last_key = self._available_keys.pop()
+        if last_key != key:
+            self._available_keys[position] = last_key
+            self._available_positions[last_key] = position
+
+    def count_completions_since(self, since: float):
+        """Yield (player_id, completions, verified completions) for Players who completed Assignments since a time."""
+        for player in self._list.values():
+            completions = verified = 0
+            for a in player.get_assignment_records():
+                if is_season_completion(a['completed'], a['completion_time'], since):
+                    completions += 1
+                    verified += is_season_verified(a['completed'], a['completion_time'], a['verifiers'], since)
+            if completions:
+                yield (player.player_id, completions, verified)
+
+    def complete_assignment(self, player: Player, task_id: int):
+        """
+        Mark a Player's Assignment of a Task as completed, counting it for the Task and on the Leaderboard, where it
+        also counts as verified if it was verified before it was completed.
+        """
+        assignment = player.assignments[task_id]
+        if assignment.completed:
+            return assignment
+        assignment.mark_completed()
+        self.record(player.player_id)
+        if task_id in self.bot.task_list:
+            self.bot.task_list.get_value(task_id).completed()
+            self.bot.task_list.record(task_id)
+        since = self.bot.leaderboard.season_begin
+        if is_season_completion(assignment.completed, assignment.completion_time, since):
+            self.bot.leaderboard.add(player.player_id, 'completions')
+        if is_season_verified(assignment.completed, assignment.completion_time, assignment.verifiers, since):
+            self.bot.leaderboard.add(player.player_id, 'verified')
+        return assignment
+
+    def verify_assignment(self, player: Player, task_id: int, verifier_id: int):
+        """
+        Record a verifier of a Player's completed Assignment. The first verification counts on the Leaderboard, if the
+        Assignment was completed this season.
+        """
+        assignment = player.assignments[task_id]
+        if verifier_id in assignment.verifiers:
+            return assignment
+        since = self.bot.leaderboard.season_begin
+        counted = is_season_verified(assignment.completed, assignment.completion_time, assignment.verifiers, since)
+        assignment.add_verifier(verifier_id)
+        self.record(player.player_id)
+        if not counted and is_season_verified(
+                assignment.completed, assignment.completion_time, assignment.verifiers, since):
+            self.bot.leaderboard.add(player.player_id, 'verified')
+        return assignment
 
     def clear_assignments(self):
         """Clears all Assignments for all Players."""
@@ -96,48 +349,167 @@ class PlayerList(CannedDict):
 
 
 class TaskList(CannedDict):
-    """Manages a dictionary mapping task_id to Task."""
-
-    def load(self, bot):
-        """Load a file and deserialize the list."""
-        self._list = {v['key']: Task.from_dict(bot, v) for v in json.load(open(self._path, 'r'))}
+    """
+    Manages a dictionary mapping task_id to Task, with a CategoryIndex for filtering Tasks by limits, and TaskStats
+    ranking Tasks by severity and completion rate.
+
+    The Tasks written by each Player are also kept by creator, with a version for each creator that increases
+    whenever one of their Tasks is added or changed.
+    """
+    KIND = "tasks"
+    category_index = None
+    task_stats = None
+    _tasks_by_creator = None
+
+    def load(self, bot, records=None):
+        super().load(bot, records)
+        self.category_index = CategoryIndex()
+        self.task_stats = TaskStats()
+        self._tasks_by_creator = {}
+        self._creator_versions = {}
+        for (key, task) in self._list.items():
+            task.set_index(self.category_index)
+            task.set_stats(self.task_stats)
+            self._tasks_by_creator.setdefault(task.creator_id, {})[key] = task
+
+    def record(self, key):
+        super().record(key)
+        if key in self._list:
+            self._creator_versions[self._list[key].creator_id] = self.version
+
+    def from_dict(self, bot, d):
+        return Task.from_dict(bot, d)
+
+    @property
+    def selection_version(self):
+        """A number that increases whenever the Tasks eligible for a set of limits, or their ratings, change."""
+        return self.category_index.version
 
     def get_tasks_by_player(self, player_key: int):
         """Return a dict mapping task_key to Task for Tasks written by a given Player."""
-        raise NotImplementedError
+        return dict(self._tasks_by_creator.get(player_key, {}))
+
+    def count_tasks_by_player(self, player_key: int):
+        return len(self._tasks_by_creator.get(player_key, {}))
+
+    def player_tasks_version(self, player_key: int):
+        """A number that increases whenever a Task written by a given Player is recorded, or the list is saved."""
+        return max(self._saved_version, self._creator_versions.get(player_key, 0))
 
     def get_tasks_for_player(self, player: Player):
         """Return a dict mapping task_key to Task for Tasks that are available for a given Player."""
-        raise NotImplementedError
+        eligible = self.category_index.get_eligible_tasks(player.limits)
+        return {key: self._list[key] for key in CategoryIndex.keys(eligible)}
+
+    def get_weight_stats_for_player(self, player: Player):
+        """Yield (task_key, mean rating, completions, assignments) for Tasks that are available for a given Player."""
+        for (key, task) in self.get_tasks_for_player(player).items():
+            yield (key, task.get_mean_rating(), task.total_completions, task.total_assignments)
 
     def get_assigned_tasks_for_player(self, player: Player):
         """Returns a dict mapping task_key to Task for Tasks that are assigned to a given Player."""
-        raise NotImplementedError
-
-    def add_task(self, task_text: str, task_name: str = None):
+        return {k: self._list[k] for k in player.assignments if k in self._list}
+
+    def count_authored_since(self, since: float):
+        """Yield (creator_id, count) for the Players who created Tasks since a time."""
+        counts = {}
+        for task in self._list.values():
+            if task.creation_time >= since:
+                counts[task.creator_id] = counts.get(task.creator_id, 0) + 1
+        return counts.items()
+
+    def get_top_tasks(self, by: str = 'severity', count: int = 10):
+        """
+        Return a list of (Task, score) for the top Tasks, highest first, by 'severity' or 'completion_rate'.
+        Tasks that have not been rated, or not been assigned, are left out of those rankings.
+        """
+        return [(self._list[task_id], score) for (task_id, score) in self.task_stats.top(by, count)]
+
+    def add_task(self, creator_id: int, task_text: str, task_name: str = None):
         """Creates a new Task object and records it in the TaskList."""
         key = self.get_available_key()
-        task = Task(key, task_text, task_name)
+        task = Task(key, creator_id, task_text, task_name)
+        if self.category_index is not None:
+            task.set_index(self.category_index)
+        if self.task_stats is not None:
+            task.set_stats(self.task_stats)
         self._list[key] = task
+        if self._tasks_by_creator is not None:
+            self._tasks_by_creator.setdefault(creator_id, {})[key] = task
+        self.record(key)
+        self.bot.leaderboard.add(creator_id, 'authored')
         return key, task
 
+    def remove_task(self, key):
+        """Delete a Task and record it, taking it out of the CategoryIndex, the rankings and its creator's Tasks."""
+        task = self._list.pop(key)
+        if self.category_index is not None:
+            self.category_index.remove_task(task)
+        if self.task_stats is not None:
+            self.task_stats.task_removed(task)
+        if self._tasks_by_creator is not None:
+            self._tasks_by_creator.get(task.creator_id, {}).pop(key, None)
+        self.record(key)
+        self._creator_versions[task.creator_id] = self.version
+        return task
+
     def cleanup_tasks(self):
         """Remove all deleted tasks."""
         raise NotImplementedError
 
 
 class InterfaceList(CannedDict):
-    """Manages a dictionary mapping message_id to Interface."""
-
-    def load(self, bot):
-        """Load a file and deserialize the list"""
-        self._list = {v['key']: Interfaces.Interface.from_dict(bot, v) for v in json.load(open(self._path, 'r'))}
+    """
+    Manages a dictionary mapping message_id to Interface, and a MessageCache of the Interface messages.
+    Interfaces are only deserialized when first clicked or looked up.
+    """
+    LAZY = True
+    KIND = "interfaces"
+
+    def load(self, bot, records=None):
+        super().load(bot, records)
+        self.message_cache = MessageCache(bot)
+
+    def from_dict(self, bot, d):
+        return Interfaces.Interface.from_dict(bot, d)
+
+    async def handle_reaction(self, event):
+        """Queue a reaction added to an Interface as a button click, ignoring our own buttons and other bots."""
+        if event.message_id not in self._list:
+            return  # Ignore reactions on anything but Interfaces
+        if event.user_id == self.bot.user.id:
+            return  # Ignore our own buttons
+        user = await self.bot.user_resolver.resolve(event.user_id, event.member)
+        if user is None or user.bot:
+            return  # Ignore bots, and users who no longer exist
+        interface = self.get_value(event.message_id)
+        if interface.channel_id is None:
+            # Interfaces saved before channels were recorded learn theirs from the first click.
+            interface.channel_id = event.channel_id
+            self.record(event.message_id)
+        log.info(f"Button '{event.emoji.name}' clicked on Interface {event.message_id}:")
+        self.bot.click_queue.submit(interface, event, user)
+
+    def remove_interface(self, message_id):
+        """Forget the Interface on a deleted message, if there was one, and evict the message from the MessageCache."""
+        self.message_cache.discard(message_id)
+        if message_id in self._list:
+            del self._list[message_id]
+            self.record(message_id)
+
+    async def install_buttons(self, posted, progress=None):
+        """
+        Add the buttons for a number of newly posted Interfaces concurrently.
+        posted is a list of (Interface, Message) pairs; progress is passed on to the ReactionDispatcher.
+        """
+        jobs = [(message, interface.buttons()) for (interface, message) in posted]
+        return await self.bot.reaction_dispatcher.install(jobs, progress=progress)
 
     async def add_actions_interface(self, channel: Messageable):
         interface = Interfaces.ActionsInterface(self.bot)
         message = await interface.post(channel)
         self._list[message.id] = interface
-        self.save()
+        self.record(message.id)
         await interface.add_buttons(message=message)
         return message.id, interface
 
@@ -145,7 +517,7 @@ class InterfaceList(CannedDict):
         interface = Interfaces.CategoryInfoInterface(self.bot)
         message = await interface.post(channel)
         self._list[message.id] = interface
-        self.save()
+        self.record(message.id)
         await interface.add_buttons(message=message)
         return message, interface
 
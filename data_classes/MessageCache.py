@@ -0,0 +1,62 @@
+import logging
+from collections import OrderedDict
+
+from discord import Forbidden, Message, NotFound
+
+log = logging.getLogger(__name__)
+
+MESSAGE_CACHE_SIZE = 512
+
+
+class MessageCache:
+    """
+    Bounded LRU of Message handles keyed by message_id.
+
+    A message that isn't cached can still be handled without an API call if its channel is known, by creating a
+    PartialMessage from the channel in the client's cache. Only a message in an unknown channel has to be fetched.
+    """
+    def __init__(self, bot, size: int = MESSAGE_CACHE_SIZE):
+        self.bot = bot
+        self.size = size
+        self._messages = OrderedDict()
+
+    def put(self, message: Message):
+        """Cache a handle for a message."""
+        self._messages[message.id] = message
+        self._messages.move_to_end(message.id)
+        if len(self._messages) > self.size:
+            self._messages.popitem(last=False)
+
+    def discard(self, message_id: int):
+        """Forget the handle for a message, for example because it was deleted."""
+        self._messages.pop(message_id, None)
+
+    def get_message(self, message_id: int, channel_id: int = None):
+        """Return a handle for a message without any API calls, or None if its channel isn't known."""
+        if message_id in self._messages:
+            self._messages.move_to_end(message_id)
+            return self._messages[message_id]
+        if channel_id is None:
+            return None
+        channel = self.bot.get_channel(channel_id)
+        if channel is None:
+            return None
+        message = channel.get_partial_message(message_id)
+        self.put(message)
+        return message
+
+    async def fetch_message(self, message_id: int, channel_id: int):
+        """
+        Return a handle for a message, fetching the channel and message through the API only if necessary.
+        Returns None if the message or its channel has been deleted, or can no longer be read.
+        """
+        message = self.get_message(message_id, channel_id)
+        if message is None:
+            try:
+                channel = await self.bot.fetch_channel(channel_id)
+                message = await channel.fetch_message(message_id)
+            except (NotFound, Forbidden) as exc:
+                log.warning(f"Could not fetch message {message_id} in channel {channel_id}: {exc}")
+                return None
+            self.put(message)
+        return message
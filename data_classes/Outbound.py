@@ -0,0 +1,296 @@
+import asyncio
+import itertools
+import logging
+import time
+from collections import deque
+
+from diagnostics.Watchdog import labelled
+from discord import HTTPException
+
+log = logging.getLogger(__name__)
+
+# Lower numbers are sent first.
+PRIORITIES = {
+    'REPLY': 0,
+    'VERIFICATION': 1,
+    'PANEL': 2,
+    'BUTTONS': 3
+}
+WORKER_COUNT = 4
+# Workers that only send replies, so that replies never wait for a worker busy with slower traffic.
+REPLY_WORKER_COUNT = 1
+# The rate limit bucket each route counts against, per channel. Every reaction route on a channel shares one bucket.
+ROUTE_BUCKETS = {
+    'send': 'send',
+    'edit': 'edit',
+    'add_reaction': 'reaction',
+    'remove_reaction': 'reaction',
+    'clear_reaction': 'reaction',
+    'clear_reactions': 'reaction',
+}
+# (calls, seconds) allowed in each bucket on each channel, roughly as Discord enforces them.
+BUCKET_LIMITS = {
+    'send': (5, 5.0),
+    'edit': (5, 5.0),
+    'reaction': (1, 0.25),
+}
+# Seconds a bucket is held back after a call in it is rate limited anyway.
+RATE_LIMIT_BACKOFF = 1.0
+
+
+class OutboundJob:
+    def __init__(self, route: str, call, priority: int, key=None, bucket=None):
+        self.route = route
+        self.bucket = bucket
+        self.call = call
+        self.priority = priority
+        self.key = key
+        self.queued_time = time.monotonic()
+        self.started = False
+        # An edit waiting for an edit of the same message to finish, and not queued until then.
+        self.deferred = False
+        self.future = asyncio.get_event_loop().create_future()
+
+
+class BucketState:
+    """
+    The calls counted against one rate limit bucket. Calls count from when they finish, which is never before
+    Discord counted them, so that calls spaced by the limit here are never closer together when they arrive.
+    """
+    def __init__(self):
+        self.finished = deque()
+        self.running = 0
+        self.blocked_until = 0.0
+
+
+class OutboundScheduler:
+    """
+    Owns all outbound Discord API calls, sending them in priority order from a few workers.
+
+    Direct replies go ahead of verification messages, which go ahead of panel refreshes, then button changes. Replies
+    are also offered to reply_workers workers of their own, so they are sent promptly whatever else is queued.
+
+    Calls are counted against per-channel rate limit buckets. A job whose bucket is full is held back until it has
+    room again instead of taking a worker, so that calls sleeping through a rate limit never hold up other routes.
+    A call that is rate limited anyway is queued again, and its bucket held back for a while.
+
+    An edit to a message that already has an edit waiting replaces the waiting edit's content, so only the latest
+    Embed is sent and every caller gets its result. Edits of one message are sent one at a time, so they land in order.
+    """
+    def __init__(self, workers: int = WORKER_COUNT, reply_workers: int = REPLY_WORKER_COUNT):
+        self.worker_count = workers
+        self.reply_worker_count = reply_workers
+        # Called with (route, seconds, succeeded) after each API call, if set.
+        self.call_timer = None
+
+        self._queue = None
+        self._reply_queue = None
+        self._workers = []
+        self._sequence = itertools.count()
+        self._pending_edits = {}
+        self._running_edits = set()
+        self._buckets = {}
+        self._held = {}
+        self._depths = {p: 0 for p in PRIORITIES.values()}
+        self._waits = {p: [0, 0.0, 0.0] for p in PRIORITIES.values()}
+
+    async def send(self, channel, content: str = None, priority: int = PRIORITIES['REPLY'], **kwargs):
+        return await self._submit("send", lambda: channel.send(content, **kwargs), priority, channel.id)
+
+    async def edit(self, message, priority: int = PRIORITIES['PANEL'], **kwargs):
+        job = self._pending_edits.get(message.id)
+        if job is not None:
+            job.call = lambda: message.edit(**kwargs)
+            if priority < job.priority:
+                if job.deferred:
+                    job.priority = priority
+                else:
+                    # Queue the job again at the higher priority; the stale entry is skipped by the workers.
+                    self._depths[job.priority] -= 1
+                    job.priority = priority
+                    self._enqueue(job)
+            return await job.future
+        job = self._make_job("edit", lambda: message.edit(**kwargs), priority, message.channel.id, key=message.id)
+        self._pending_edits[message.id] = job
+        if message.id in self._running_edits:
+            job.deferred = True  # Queued when the running edit finishes.
+        else:
+            self._enqueue(job)
+        return await job.future
+
+    async def add_reaction(self, message, emoji, priority: int = PRIORITIES['BUTTONS']):
+        return await self._submit("add_reaction", lambda: message.add_reaction(emoji), priority, message.channel.id)
+
+    async def remove_reaction(self, message, emoji, member, priority: int = PRIORITIES['BUTTONS']):
+        return await self._submit(
+                "remove_reaction", lambda: message.remove_reaction(emoji, member), priority, message.channel.id)
+
+    async def clear_reaction(self, message, emoji, priority: int = PRIORITIES['BUTTONS']):
+        return await self._submit("clear_reaction", lambda: message.clear_reaction(emoji), priority, message.channel.id)
+
+    async def clear_reactions(self, message, priority: int = PRIORITIES['BUTTONS']):
+        return await self._submit("clear_reactions", lambda: message.clear_reactions(), priority, message.channel.id)
+
+    def get_stats(self):
+        """Return the queue depth and the count, total and maximum of wait times in seconds, for each priority."""
+        return {
+            name: {
+                'depth': self._depths[p],
+                'waited': self._waits[p][0],
+                'total_wait': self._waits[p][1],
+                'max_wait': self._waits[p][2]
+            }
+            for (name, p) in PRIORITIES.items()}
+
+    async def stop(self):
+        """Cancel the workers, failing any calls still waiting to be sent."""
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        for (handle, job) in self._held.items():
+            handle.cancel()
+            if not job.future.done():
+                job.future.cancel()
+        self._held.clear()
+        for queue in (self._queue, self._reply_queue):
+            while queue is not None and not queue.empty():
+                (_, _, job) = queue.get_nowait()
+                if not job.future.done():
+                    job.future.cancel()
+        for job in self._pending_edits.values():
+            if not job.future.done():
+                job.future.cancel()
+        self._queue = None
+        self._reply_queue = None
+        self._pending_edits.clear()
+        self._running_edits.clear()
+        self._buckets.clear()
+        self._depths = {p: 0 for p in PRIORITIES.values()}
+
+    async def _submit(self, route, call, priority, channel_id):
+        job = self._make_job(route, call, priority, channel_id)
+        self._enqueue(job)
+        return await job.future
+
+    def _make_job(self, route, call, priority, channel_id, key=None):
+        if self._queue is None:
+            # Workers are started with the first call, so that they run on the client's event loop.
+            self._queue = asyncio.PriorityQueue()
+            self._reply_queue = asyncio.PriorityQueue()
+            loop = asyncio.get_event_loop()
+            self._workers = [loop.create_task(self._work(self._queue)) for _ in range(self.worker_count)]
+            self._workers += [loop.create_task(self._work(self._reply_queue)) for _ in range(self.reply_worker_count)]
+        return OutboundJob(route, call, priority, key=key, bucket=(ROUTE_BUCKETS.get(route, route), channel_id))
+
+    def _enqueue(self, job):
+        self._depths[job.priority] += 1
+        entry = (job.priority, next(self._sequence), job)
+        self._queue.put_nowait(entry)
+        if job.priority == PRIORITIES['REPLY']:
+            # Whichever worker takes it first sends it; the other skips it as started.
+            self._reply_queue.put_nowait(entry)
+
+    async def _work(self, queue):
+        while True:
+            entry = await queue.get()
+            (priority, _, job) = entry
+            if job.started or priority != job.priority:
+                continue
+            delay = self._bucket_delay(job.bucket)
+            if delay > 0:
+                self._hold(queue, entry, delay)
+                continue
+            job.started = True
+            self._depths[priority] -= 1
+            if job.key is not None:
+                if self._pending_edits.get(job.key) is job:
+                    del self._pending_edits[job.key]
+                self._running_edits.add(job.key)
+            self._record_wait(priority, time.monotonic() - job.queued_time)
+            rate_limited = False
+            try:
+                rate_limited = await self._run(job)
+            finally:
+                self._bucket_finished(job.bucket)
+                if rate_limited:
+                    # Still the running edit of its message, so later edits keep waiting behind it.
+                    job.started = False
+                    self._depths[priority] += 1
+                    queue.put_nowait(entry)
+                elif job.key is not None:
+                    self._edit_finished(job.key)
+
+    def _hold(self, queue, entry, delay: float):
+        """Put a job back in its queue once its bucket has room, without taking a worker meanwhile."""
+        def release():
+            del self._held[handle]
+            queue.put_nowait(entry)
+        handle = asyncio.get_event_loop().call_later(delay, release)
+        self._held[handle] = entry[2]
+
+    def _bucket_delay(self, bucket):
+        """Return how many seconds until a bucket has room for another call, taking it if it has room now."""
+        now = time.monotonic()
+        state = self._buckets.get(bucket)
+        if state is None:
+            state = self._buckets[bucket] = BucketState()
+        if state.blocked_until > now:
+            return state.blocked_until - now
+        limit = BUCKET_LIMITS.get(bucket[0])
+        if limit is None:
+            return 0.0
+        (count, per) = limit
+        while state.finished and state.finished[0] <= now - per:
+            state.finished.popleft()
+        if len(state.finished) + state.running >= count:
+            return state.finished[0] + per - now if state.finished else per
+        state.running += 1
+        return 0.0
+
+    def _bucket_finished(self, bucket):
+        state = self._buckets.get(bucket)
+        if state is not None and state.running:
+            state.running -= 1
+            state.finished.append(time.monotonic())
+
+    def _edit_finished(self, key):
+        self._running_edits.discard(key)
+        waiting = self._pending_edits.get(key)
+        if waiting is not None and waiting.deferred:
+            waiting.deferred = False
+            self._enqueue(waiting)
+
+    async def _run(self, job):
+        """Send a job's call, returning True if it was rate limited and should be sent again."""
+        start = time.perf_counter()
+        succeeded = False
+        try:
+            with labelled(f"outbound {job.route}"):
+                result = await job.call()
+            succeeded = True
+            if not job.future.done():
+                job.future.set_result(result)
+        except asyncio.CancelledError:
+            job.future.cancel()
+            raise
+        except HTTPException as exc:
+            if exc.status == 429:
+                log.warning(f"Rate limited on {job.route} in channel {job.bucket[1]}, retrying.")
+                self._buckets[job.bucket].blocked_until = time.monotonic() + RATE_LIMIT_BACKOFF
+                return True
+            if not job.future.done():
+                job.future.set_exception(exc)
+        except Exception as exc:
+            if not job.future.done():
+                job.future.set_exception(exc)
+        finally:
+            if self.call_timer is not None:
+                self.call_timer(job.route, time.perf_counter() - start, succeeded)
+        return False
+
+    def _record_wait(self, priority, seconds):
+        waits = self._waits[priority]
+        waits[0] += 1
+        waits[1] += seconds
+        waits[2] = max(waits[2], seconds)
@@ -0,0 +1,52 @@
+import logging
+from itertools import islice
+
+log = logging.getLogger(__name__)
+
+PAGE_SIZE = 10
+
+
+class Paginator:
+    """
+    Serves pages of items from a source, building only the pages that are asked for.
+
+    The source is a callable returning an iterable of items in a stable order. A page is sliced from it lazily, along
+    with the pages either side of it, so that moving back or forward a page needs no slicing at all.
+    Cached pages are dropped whenever the version passed in changes.
+    """
+    def __init__(self, source, page_size: int = PAGE_SIZE, count=None):
+        self.source = source
+        self.page_size = page_size
+        self._count = count
+
+        self._version = None
+        self._item_count = None
+        self._pages = {}
+
+    def get_page_count(self, version=None):
+        """Return the number of pages, which is at least 1 even when there are no items."""
+        self._check_version(version)
+        if self._item_count is None:
+            if self._count is not None:
+                self._item_count = self._count()
+            else:
+                self._item_count = sum(1 for _ in self.source())
+        return max(1, -(-self._item_count // self.page_size))
+
+    def get_page(self, page: int, version=None):
+        """Return the list of items on a page, counting from 0."""
+        self._check_version(version)
+        if page not in self._pages:
+            first = max(0, page - 1)
+            items = list(islice(self.source(), first * self.page_size, (page + 2) * self.page_size))
+            self._pages = {}
+            for n in range(first, page + 2):
+                start = (n - first) * self.page_size
+                self._pages[n] = items[start:start + self.page_size]
+        return self._pages[page]
+
+    def _check_version(self, version):
+        if version != self._version:
+            self._version = version
+            self._item_count = None
+            self._pages = {}
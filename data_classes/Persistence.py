@@ -0,0 +1,301 @@
+import asyncio
+import json
+import logging
+import os
+import threading
+
+from data_classes.BinarySnapshot import BinarySnapshot, is_binary_snapshot, json_default, write_binary_snapshot
+from diagnostics.Watchdog import labelled
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+log = logging.getLogger(__name__)
+
+JOURNAL_COMPACT_SIZE = 1024 * 1024
+STREAM_CHUNK_SIZE = 64 * 1024
+NUMBER_CHARACTERS = frozenset(".eE+-0123456789")
+
+
+class JsonArrayStream:
+    """
+    Iterates over the elements of a top-level JSON array in a file, parsing one element at a time.
+
+    The file is read in chunks, and only the unparsed remainder of the current chunk is kept, so memory use does not
+    grow with the size of the file.
+    """
+    def __init__(self, path, chunk_size: int = STREAM_CHUNK_SIZE):
+        self.path = path
+        self.chunk_size = chunk_size
+
+    def __iter__(self):
+        decoder = json.JSONDecoder()
+        with open(self.path, 'r') as file:
+            self._file = file
+            self._buffer = ""
+            self._position = 0
+            self._eof = False
+
+            self._expect("[")
+            if self._peek() == "]":
+                return
+            while True:
+                yield self._decode(decoder)
+                if self._expect(",]") == "]":
+                    return
+
+    def _decode(self, decoder):
+        self._peek()
+        while True:
+            try:
+                (value, end) = decoder.raw_decode(self._buffer, self._position)
+            except json.JSONDecodeError:
+                if self._eof:
+                    raise
+                self._read()
+                continue
+            # A number at the end of the buffer may continue in the next chunk, and one cut off after a sign, point or
+            # exponent is decoded without them, so read on until something else follows it.
+            if not self._eof and all(c in NUMBER_CHARACTERS for c in self._buffer[end:]):
+                self._read()
+                continue
+            self._position = end
+            if self._position >= self.chunk_size:
+                self._buffer = self._buffer[self._position:]
+                self._position = 0
+            return value
+
+    def _peek(self):
+        """Skip whitespace and return the next character, or an empty string at the end of the file."""
+        while True:
+            while self._position < len(self._buffer) and self._buffer[self._position].isspace():
+                self._position += 1
+            if self._position < len(self._buffer) or self._eof:
+                return self._buffer[self._position:self._position + 1]
+            self._read()
+
+    def _expect(self, characters):
+        character = self._peek()
+        if not character or character not in characters:
+            raise json.JSONDecodeError(f"Expected one of {characters!r}", self._buffer, self._position)
+        self._position += 1
+        return character
+
+    def _read(self):
+        chunk = self._file.read(self.chunk_size)
+        if not chunk:
+            self._eof = True
+        self._buffer = self._buffer[self._position:] + chunk
+        self._position = 0
+
+
+def read_snapshot(path, stream: bool = False):
+    """
+    Load the serialized records stored in a snapshot file.
+    JSON snapshots are parsed into a list, using orjson if it is installed, or parsed one record at a time as they
+    are iterated over if stream is set. Binary snapshots are memory-mapped.
+    """
+    if is_binary_snapshot(path):
+        return BinarySnapshot(path)
+    if stream:
+        return JsonArrayStream(path)
+    if orjson is not None:
+        with open(path, 'rb') as file:
+            return orjson.loads(file.read())
+    with open(path, 'r') as file:
+        return json.load(file)
+
+
+def read_records(path, journal: bool = False, stream: bool = False):
+    """
+    Load the serialized records of a CannedDict, replaying its journal in journal mode. Returns an iterable.
+    Touches nothing but the files, so it can run on a worker thread.
+    """
+    records = read_snapshot(path, stream)
+    if journal:
+        records = Journal(path).replay(records)
+    return records
+
+
+def write_snapshot(path, records, kind: str = None):
+    """
+    Atomically replace a snapshot file with the given iterable of serialized records.
+    Writes a binary snapshot of a list of the given kind if one is given, otherwise JSON, one record at a time.
+    """
+    if kind is not None:
+        write_binary_snapshot(path, kind, records)
+        return
+    encoder = json.JSONEncoder(default=json_default)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, 'w') as file:
+        file.write("[")
+        for (index, record) in enumerate(records):
+            if index:
+                file.write(", ")
+            file.write(encoder.encode(record))
+        file.write("]")
+    os.replace(tmp_path, path)
+
+
+class Journal:
+    """
+    Append-only log of changes made to a CannedDict since its JSON snapshot was last written.
+
+    Each change is one line of JSON, either {'op': 'set', 'key': key, 'value': record} or {'op': 'del', 'key': key}.
+    Once the journal grows past compact_size it is rotated aside and folded into the snapshot on a worker thread.
+    Snapshots are written in the binary format for a list of kind, if one is given.
+    """
+    def __init__(self, snapshot_path, compact_size=JOURNAL_COMPACT_SIZE, kind: str = None):
+        self.snapshot_path = snapshot_path
+        self.kind = kind
+        self.path = snapshot_path + ".journal"
+        self.rotated_path = snapshot_path + ".journal.1"
+        self.compact_size = compact_size
+
+        self._lock = threading.Lock()
+        self._compactor = None
+
+    def append(self, entries):
+        """Append a list of journal entries, starting a compaction if the journal has grown too large."""
+        with open(self.path, 'a') as file:
+            for entry in entries:
+                file.write(json.dumps(entry, default=json_default) + "\n")
+            size = file.tell()
+        if size >= self.compact_size:
+            self.compact_in_background()
+
+    def replay(self, records):
+        """
+        Apply the rotated and current journals to an iterable of snapshot records.
+        Returns an iterator over the resulting records, which passes the snapshot records through one at a time.
+        """
+        changes = {}
+        for path in (self.rotated_path, self.path):
+            self._apply(path, changes)
+        if not changes:
+            return iter(records)
+        return self._merge(records, changes)
+
+    @staticmethod
+    def _merge(records, changes):
+        # Changed records keep their place in the snapshot, and new ones follow it.
+        for v in records:
+            key = v['key']
+            if key in changes:
+                v = changes.pop(key)
+                if v is None:
+                    continue
+            yield v
+        for v in changes.values():
+            if v is not None:
+                yield v
+
+    def compact_in_background(self):
+        """Rotate the journal and fold it into the snapshot on a worker thread."""
+        if self._compactor is not None and self._compactor.is_alive():
+            return  # A compaction is already running; it will be caught up by the next one.
+        if os.path.exists(self.rotated_path):
+            log.warning(f"Found unmerged journal {self.rotated_path}, merging it before rotating again.")
+        else:
+            # Rotation happens on the calling thread, so no append can race with it.
+            os.replace(self.path, self.rotated_path)
+        self._compactor = threading.Thread(target=self._compact, name=f"compact {self.snapshot_path}", daemon=True)
+        self._compactor.start()
+
+    def reset(self, records):
+        """Write a full snapshot and discard all journaled changes, waiting for any running compaction."""
+        with self._lock:
+            write_snapshot(self.snapshot_path, records, self.kind)
+            for path in (self.rotated_path, self.path):
+                if os.path.exists(path):
+                    os.remove(path)
+
+    def _compact(self):
+        with self._lock:
+            if not os.path.exists(self.rotated_path):
+                return  # Already merged by a reset.
+            try:
+                merged = {v['key']: v for v in read_snapshot(self.snapshot_path)}
+                self._apply(self.rotated_path, merged)
+                write_snapshot(self.snapshot_path, [v for v in merged.values() if v is not None], self.kind)
+                os.remove(self.rotated_path)
+            except (OSError, json.JSONDecodeError) as exc:
+                log.exception(f"Could not compact journal into {self.snapshot_path}", exc_info=exc)
+                return
+        log.info(f"Compacted journal into {self.snapshot_path}.")
+
+    @staticmethod
+    def _apply(path, merged):
+        """Apply a journal file to a dict mapping key to record. Deleted keys are mapped to None."""
+        try:
+            file = open(path, 'r')
+        except FileNotFoundError:
+            return
+        with file:
+            for line_number, line in enumerate(file, 1):
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    # Only a write interrupted by a crash can leave a torn line, and it is always the last one.
+                    log.warning(f"Ignoring torn journal entry at {path}:{line_number}")
+                    continue
+                if entry['op'] == 'set':
+                    merged[entry['key']] = entry['value']
+                elif entry['op'] == 'del':
+                    merged[entry['key']] = None
+
+
+class WriteBehind:
+    """
+    Defers the saving of a number of CannedDicts, coalescing changes into one flush per interval.
+
+    Records are copied on the event loop, so the copy is consistent, and encoded and written on a worker thread.
+    """
+    def __init__(self, lists, interval: float):
+        self.lists = lists
+        self.interval = interval
+
+        self._task = None
+        self._flush_lock = None
+
+        for canned_dict in self.lists:
+            canned_dict.defer_writes()
+
+    def start(self, loop):
+        """Begin flushing periodically on the given event loop. Does nothing if already started."""
+        if self._task is None:
+            self._task = loop.create_task(self._run())
+
+    async def stop(self):
+        """Stop flushing periodically and flush any outstanding changes."""
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        await self.flush()
+
+    async def flush(self):
+        """Write all outstanding changes to disk."""
+        if self._flush_lock is None:
+            self._flush_lock = asyncio.Lock()
+        loop = asyncio.get_event_loop()
+        async with self._flush_lock:
+            for canned_dict in self.lists:
+                write = canned_dict.take_pending_write()
+                if write is None:
+                    continue
+                try:
+                    await loop.run_in_executor(None, write)
+                except Exception:
+                    canned_dict.save()  # The pending changes were taken, so fall back to a full snapshot next time.
+                    raise
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                with labelled("write-behind flush"):
+                    await self.flush()
+            except Exception as exc:
+                log.exception("Write-behind flush failed, retrying next interval.", exc_info=exc)
@@ -1,36 +1,65 @@
 import logging
-from datetime import datetime
 from data_classes.Assignment import Assignment
+from data_classes.CategoryIndex import CategoryIndex
 
 log = logging.getLogger(__name__)
 
 class Player:
+    """
+    A player of the game, keyed by their user id.
+    Limits are kept as a bitmask of category_ids, and times as UTC timestamps.
+    Assignments loaded from a file stay serialized until they are first accessed.
+    """
+    __slots__ = (
+        '_player_id', 'available', 'limit_mask', '_assignments', '_assignment_records', 'last_beg_time',
+        'last_treat_time', 'credits', '__weakref__')
+
     def __init__(self, player_id):
         self._player_id = player_id
 
         self.available = False
-        self.limits = set()
-        self.assignments = {}
+        self.limit_mask = 0
+        self._assignments = {}
+        self._assignment_records = None
 
         self.last_beg_time = None
         self.last_treat_time = None
 
         self.credits = 1
 
+    @property
+    def player_id(self):
+        return self._player_id
+
+    @property
+    def assignments(self):
+        """A dict mapping task_id to Assignment."""
+        if self._assignment_records is not None:
+            self._assignments = {v['task_id']: Assignment.from_dict(None, v) for v in self._assignment_records}
+            self._assignment_records = None
+        return self._assignments
+
+    def get_assignment_records(self):
+        """Return the serialized Assignments, without deserializing them if they have not been accessed yet."""
+        if self._assignment_records is not None:
+            return self._assignment_records
+        return [v.to_dict() for v in self._assignments.values()]
+
+    @property
+    def limits(self):
+        """The set of category_ids set as limits. Change limits through the methods below, not this set."""
+        return set(CategoryIndex.keys(self.limit_mask))
+
     @classmethod
     def from_dict(cls, bot, d):
         player = Player(d['key'])
         player.available = d['available']
-        player._limits = set(d['limits'])
-        player.assignments = {v['key']: Assignment.from_dict(bot, v) for v in d['assignments']}
-        if d['last_beg_time'] is None:
-            player.last_beg_time = None
-        else:
-            player.last_beg_time = datetime.utcfromtimestamp(d['last_beg_time'])
-        if d['last_treat_time'] is None:
-            player.last_treat_time = None
-        else:
-            player.last_treat_time = datetime.utcfromtimestamp(d['last_treat_time'])
+        for limit_id in d['limits']:
+            player.limit_mask |= 1 << limit_id
+        if d['assignments']:
+            player._assignment_records = d['assignments']
+        player.last_beg_time = d['last_beg_time']
+        player.last_treat_time = d['last_treat_time']
         player.credits = d['credits']
         return player
 
@@ -38,23 +67,20 @@ class Player:
         return {
             'key': self._player_id,
             'available': self.available,
-            'limits': list(self.limits),
-            'assignments': [v.to_dict() for v in self.assignments],
-            'last_beg_time': self.last_beg_time.timestamp(),
-            'last_treat_time': self.last_treat_time.timestamp(),
+            'limits': list(CategoryIndex.keys(self.limit_mask)),
+            'assignments': list(self.get_assignment_records()),
+            'last_beg_time': self.last_beg_time,
+            'last_treat_time': self.last_treat_time,
             'credits': self.credits
         }
 
-    def toggle_limit(self, limit_id: str):
+    def toggle_limit(self, limit_id: int):
         """Toggle presence of a given limit."""
-        if limit_id in self.limits:
-            self.limits.remove(limit_id)
-        else:
-            self.limits.add(limit_id)
+        self.limit_mask ^= 1 << limit_id
 
     def unset_limits(self):
         """Unset all limits."""
-        self.limits.clear()
+        self.limit_mask = 0
 
     def assign_task(self, task_id: int, assigner_id: int):
         """Records an Assignment of a Task to a Player."""
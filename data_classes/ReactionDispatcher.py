@@ -0,0 +1,90 @@
+import asyncio
+import logging
+import time
+
+from discord import HTTPException
+
+log = logging.getLogger(__name__)
+
+MAX_CONCURRENT_CHANNELS = 4
+# Discord allows roughly one reaction per quarter second on each channel.
+REACTION_SPACING = 0.25
+
+
+class ReactionDispatcher:
+    """
+    Installs reaction buttons on a number of messages concurrently, and clears button presses.
+
+    Reactions are rate limited per channel, so each channel gets a single worker that adds its messages' reactions in
+    order, paced to stay inside the limit instead of running into 429s. Workers for different channels run
+    concurrently, up to max_concurrency at a time. Clearing presses is paced against the same per-channel limit.
+    The calls themselves are sent through the OutboundScheduler.
+    """
+    def __init__(self, outbound, max_concurrency: int = MAX_CONCURRENT_CHANNELS, spacing: float = REACTION_SPACING):
+        self.outbound = outbound
+        self.spacing = spacing
+
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._next_allowed = {}
+
+    async def install(self, jobs, progress=None):
+        """
+        Add reactions to messages. jobs is a list of (Message, [emoji]) pairs; each message's emojis are added in order.
+        progress, if given, is called with (done, total) after each reaction.
+        Returns a list of (Message, emoji, HTTPException) for any reactions that could not be added.
+        """
+        by_channel = {}
+        for (message, emojis) in jobs:
+            by_channel.setdefault(message.channel.id, []).append((message, emojis))
+
+        state = {'done': 0, 'total': sum(len(emojis) for (_, emojis) in jobs)}
+        failures = []
+        await asyncio.gather(*[
+                self._install_channel(channel_id, channel_jobs, state, progress, failures)
+                for (channel_id, channel_jobs) in by_channel.items()])
+        return failures
+
+    async def clear_presses(self, message, presses, buttons):
+        """
+        Remove button presses from a message. presses is a list of (emoji, member) pairs; buttons is every button of
+        the message, in order. Either each press is removed, or, if that would take more calls, all reactions are
+        cleared and the buttons added back in order.
+        Returns a list of (emoji, HTTPException) for any presses or buttons that could not be handled.
+        """
+        channel_id = message.channel.id
+        if len(presses) <= len(buttons):
+            failures = []
+            for (emoji, member) in presses:
+                await self._wait_for_bucket(channel_id)
+                try:
+                    await self.outbound.remove_reaction(message, emoji, member)
+                except HTTPException as exc:
+                    failures.append((emoji, exc))
+            return failures
+        await self._wait_for_bucket(channel_id)
+        try:
+            await self.outbound.clear_reactions(message)
+        except HTTPException as exc:
+            return [(None, exc)]
+        return [(emoji, exc) for (_, emoji, exc) in await self.install([(message, buttons)])]
+
+    async def _install_channel(self, channel_id, jobs, state, progress, failures):
+        async with self._semaphore:
+            for (message, emojis) in jobs:
+                for emoji in emojis:
+                    await self._wait_for_bucket(channel_id)
+                    try:
+                        await self.outbound.add_reaction(message, emoji)
+                    except HTTPException as exc:
+                        log.warning(f"Could not add {emoji} to message {message.id}: {exc}")
+                        failures.append((message, emoji, exc))
+                    state['done'] += 1
+                    if progress is not None:
+                        progress(state['done'], state['total'])
+
+    async def _wait_for_bucket(self, channel_id):
+        now = time.monotonic()
+        allowed = self._next_allowed.get(channel_id, now)
+        self._next_allowed[channel_id] = max(now, allowed) + self.spacing
+        if allowed > now:
+            await asyncio.sleep(allowed - now)
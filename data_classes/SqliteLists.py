@@ -0,0 +1,531 @@
+import json
+import logging
+import random
+import sqlite3
+import weakref
+from collections import OrderedDict
+from collections.abc import MutableMapping
+
+from data_classes.Lists import CannedDict, CategoryList, PlayerList, TaskList, InterfaceList
+from data_classes.MessageCache import MessageCache
+from data_classes.Player import Player
+
+log = logging.getLogger(__name__)
+
+ROW_CACHE_SIZE = 4096
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS categories (
+    key INTEGER PRIMARY KEY,
+    data TEXT NOT NULL);
+
+CREATE TABLE IF NOT EXISTS players (
+    key INTEGER PRIMARY KEY,
+    available INTEGER NOT NULL,
+    data TEXT NOT NULL);
+CREATE INDEX IF NOT EXISTS players_by_available ON players (available, key);
+
+CREATE TABLE IF NOT EXISTS assignments (
+    player_id INTEGER NOT NULL,
+    task_id INTEGER NOT NULL,
+    completed INTEGER NOT NULL,
+    PRIMARY KEY (player_id, task_id));
+CREATE INDEX IF NOT EXISTS assignments_by_task ON assignments (task_id, player_id);
+
+CREATE TABLE IF NOT EXISTS tasks (
+    key INTEGER PRIMARY KEY,
+    creator_id INTEGER,
+    data TEXT NOT NULL);
+CREATE INDEX IF NOT EXISTS tasks_by_creator ON tasks (creator_id, key);
+
+CREATE TABLE IF NOT EXISTS task_categories (
+    task_id INTEGER NOT NULL,
+    category_id INTEGER NOT NULL,
+    PRIMARY KEY (task_id, category_id));
+CREATE INDEX IF NOT EXISTS task_categories_by_category ON task_categories (category_id, task_id);
+
+CREATE TABLE IF NOT EXISTS interfaces (
+    key INTEGER PRIMARY KEY,
+    type TEXT NOT NULL,
+    data TEXT NOT NULL);
+"""
+
+
+def _add_task_rankings(connection: sqlite3.Connection):
+    """Add the indexed severity and completion_rate columns of the tasks table, filled in from each Task's data."""
+    columns = {row[1] for row in connection.execute("PRAGMA table_info(tasks)")}
+    for column in ('severity', 'completion_rate'):
+        if column not in columns:
+            connection.execute(f"ALTER TABLE tasks ADD COLUMN {column} REAL")
+    rows = connection.execute("SELECT key, data FROM tasks").fetchall()
+    for (key, data) in rows:
+        d = json.loads(data)
+        ratings = list(d['ratings'].values())
+        severity = sum(ratings) / len(ratings) if ratings else None
+        completion_rate = d['total_completions'] / d['total_assignments'] if d['total_assignments'] else None
+        connection.execute(
+                "UPDATE tasks SET severity = ?, completion_rate = ? WHERE key = ?", (severity, completion_rate, key))
+    connection.execute("CREATE INDEX IF NOT EXISTS tasks_by_severity ON tasks (severity DESC, key)")
+    connection.execute("CREATE INDEX IF NOT EXISTS tasks_by_completion_rate ON tasks (completion_rate DESC, key)")
+
+
+def _add_season_columns(connection: sqlite3.Connection):
+    """Add the columns the Leaderboard is rebuilt from: when Assignments were completed and verified, and Tasks made."""
+    assignment_columns = {row[1] for row in connection.execute("PRAGMA table_info(assignments)")}
+    for (column, kind) in (('completion_time', "REAL"), ('verified', "INTEGER NOT NULL DEFAULT 0")):
+        if column not in assignment_columns:
+            connection.execute(f"ALTER TABLE assignments ADD COLUMN {column} {kind}")
+    for (key, data) in connection.execute("SELECT key, data FROM players").fetchall():
+        connection.executemany(
+                "UPDATE assignments SET completion_time = ?, verified = ? WHERE player_id = ? AND task_id = ?",
+                [(a['completion_time'], int(bool(a['verifiers'])), key, a['task_id'])
+                        for a in json.loads(data)['assignments']])
+    if 'creation_time' not in {row[1] for row in connection.execute("PRAGMA table_info(tasks)")}:
+        connection.execute("ALTER TABLE tasks ADD COLUMN creation_time REAL")
+    for (key, data) in connection.execute("SELECT key, data FROM tasks").fetchall():
+        connection.execute("UPDATE tasks SET creation_time = ? WHERE key = ?", (json.loads(data)['creation_time'], key))
+
+
+# Each migration brings the schema from the version of its position in the list to the next, as kept in user_version.
+MIGRATIONS = [
+    _add_task_rankings,
+    _add_season_columns,
+]
+
+
+def connect(path):
+    """Open the database at the given path, creating any missing tables and indexes and migrating older schemas."""
+    connection = sqlite3.connect(path)
+    connection.execute("PRAGMA journal_mode=WAL")
+    connection.executescript(SCHEMA)
+    migrate(connection)
+    return connection
+
+
+def migrate(connection: sqlite3.Connection):
+    """Apply each migration the database has not had yet, each in its own transaction."""
+    (version,) = connection.execute("PRAGMA user_version").fetchone()
+    for (number, migration) in enumerate(MIGRATIONS[version:], version + 1):
+        connection.execute("BEGIN")
+        try:
+            migration(connection)
+            connection.execute(f"PRAGMA user_version = {number}")
+            connection.commit()
+        except Exception:
+            connection.rollback()
+            raise
+        log.info(f"Migrated database schema to version {number} ({migration.__name__}).")
+
+
+class RowCache(MutableMapping):
+    """
+    The values read from a table, keeping the size most recently used alive. Older values are only kept for as long
+    as something else refers to them, so that a value being changed is never dropped before the change is recorded.
+    """
+    def __init__(self, size: int = ROW_CACHE_SIZE):
+        self.size = size
+        self._recent = OrderedDict()
+        self._older = weakref.WeakValueDictionary()
+
+    def __getitem__(self, key):
+        if key in self._recent:
+            self._recent.move_to_end(key)
+            return self._recent[key]
+        value = self._older[key]
+        self[key] = value
+        return value
+
+    def __setitem__(self, key, value):
+        self._older.pop(key, None)
+        self._recent[key] = value
+        self._recent.move_to_end(key)
+        while len(self._recent) > self.size:
+            (old_key, old_value) = self._recent.popitem(last=False)
+            self._older[old_key] = old_value
+
+    def __delitem__(self, key):
+        if self._recent.pop(key, None) is None and self._older.pop(key, None) is None:
+            raise KeyError(key)
+
+    def __contains__(self, key):
+        return key in self._recent or key in self._older
+
+    def __iter__(self):
+        return iter([*self._recent, *self._older.keys()])
+
+    def __len__(self):
+        return len(self._recent) + len(self._older)
+
+    def snapshot(self):
+        """Return a list of (key, value) for every value still held."""
+        return [*self._recent.items(), *self._older.items()]
+
+
+class SqliteRows(MutableMapping):
+    """
+    A mapping of key to deserialized value backed by a database table.
+
+    Values are only deserialized when first accessed, and are then kept in a RowCache so that changes made to them can
+    be recorded. Keys added but not yet written, and keys deleted but not yet recorded, are tracked until their rows
+    are written, so that the length is a COUNT of the table adjusted by those.
+    """
+    def __init__(self, canned_dict, table):
+        self._canned_dict = canned_dict
+        self._db = canned_dict._db
+        self._table = table
+        self._loaded = RowCache()
+        self._unsaved = {}
+        self._deleted = set()
+
+    def __getitem__(self, key):
+        value = self._loaded.get(key)
+        if value is not None:
+            return value
+        if key in self._deleted:
+            raise KeyError(key)
+        row = self._db.execute(f"SELECT data FROM {self._table} WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            raise KeyError(key)
+        value = self._canned_dict.from_dict(self._canned_dict.bot, json.loads(row[0]))
+        self._loaded[key] = value
+        return value
+
+    def __setitem__(self, key, value):
+        if key not in self:
+            # Held here as well until written, so that it can't be dropped from the cache first.
+            self._unsaved[key] = value
+        self._deleted.discard(key)
+        self._loaded[key] = value
+
+    def __delitem__(self, key):
+        if key not in self:
+            raise KeyError(key)
+        self._loaded.pop(key, None)
+        if self._unsaved.pop(key, None) is None:
+            self._deleted.add(key)
+
+    def __contains__(self, key):
+        if key in self._loaded:
+            return True
+        if key in self._deleted:
+            return False
+        return self._db.execute(f"SELECT 1 FROM {self._table} WHERE key = ?", (key,)).fetchone() is not None
+
+    def __iter__(self):
+        deleted = set(self._deleted)
+        for (key,) in self._db.execute(f"SELECT key FROM {self._table} ORDER BY key"):
+            if key not in deleted:
+                yield key
+        yield from list(self._unsaved)
+
+    def __len__(self):
+        (count,) = self._db.execute(f"SELECT COUNT(*) FROM {self._table}").fetchone()
+        return count + len(self._unsaved) - len(self._deleted)
+
+    def written(self, key):
+        """Note that the row for a key has been written or deleted."""
+        self._unsaved.pop(key, None)
+        self._deleted.discard(key)
+
+
+class SqliteDict(CannedDict):
+    """
+    A CannedDict stored in an SQLite table, with one row per value.
+
+    Nothing is loaded up front; values are read by key as they are needed, and record() updates a single row. Only the
+    most recently used values are kept, so every change must be recorded.
+    Subclasses name their table and may write extra indexed columns and rows for each value.
+    """
+    TABLE = None
+
+    def __init__(self, bot, connection: sqlite3.Connection):
+        self._db = connection
+        super().__init__(bot, None)
+        self._list = SqliteRows(self, self.TABLE)
+
+    def load(self, bot, records=None):
+        """Nothing to load; rows are read on demand."""
+        pass
+
+    def save(self):
+        """Write every value still held in memory to its row."""
+        self.version += 1
+        self._saved_version = self.version
+        self._timed('save', self._write_loaded)
+
+    def _write_loaded(self):
+        for (key, value) in self._list._loaded.snapshot():
+            self._write(key, value)
+        self._db.commit()
+
+    def record(self, key):
+        """Write the row for a single key, or delete it if the key was deleted."""
+        self.version += 1
+        self._key_versions[key] = self.version
+        self._timed('record', self._write_key, key)
+
+    def _write_key(self, key):
+        value = self._list._loaded.get(key)
+        if value is not None:
+            self._write(key, value)
+        elif key in self._list._deleted:
+            self._delete(key)
+        self._db.commit()
+
+    def defer_writes(self):
+        # Each change is already a single row write, so there is nothing for a WriteBehind to coalesce.
+        pass
+
+    def get_available_key(self):
+        """Returns the lowest unused integer key."""
+        row = self._db.execute(f"""
+                SELECT 0 WHERE NOT EXISTS (SELECT 1 FROM {self.TABLE} WHERE key = 0)
+                UNION ALL
+                SELECT MIN(a.key + 1) FROM {self.TABLE} a
+                WHERE NOT EXISTS (SELECT 1 FROM {self.TABLE} b WHERE b.key = a.key + 1)
+                """).fetchone()
+        key = row[0] if row[0] is not None else 0
+        while key in self._list._unsaved:
+            key += 1
+        return key
+
+    def _values_for_keys(self, keys):
+        return {key: self._list[key] for key in keys}
+
+    def _write(self, key, value):
+        d = value.to_dict()
+        columns = self.index_columns(value)
+        names = ", ".join(["key", *columns, "data"])
+        placeholders = ", ".join("?" * (len(columns) + 2))
+        self._db.execute(
+                f"INSERT OR REPLACE INTO {self.TABLE} ({names}) VALUES ({placeholders})",
+                (key, *columns.values(), json.dumps(d)))
+        self.index_rows(key, value)
+        self._list.written(key)
+
+    def _delete(self, key):
+        self._db.execute(f"DELETE FROM {self.TABLE} WHERE key = ?", (key,))
+        self.index_rows(key, None)
+        self._list.written(key)
+
+    def index_columns(self, value):
+        """Return a dict of extra indexed columns to store alongside a value."""
+        return {}
+
+    def index_rows(self, key, value):
+        """Update any secondary index tables for a value, or remove its entries if value is None."""
+        pass
+
+
+class SqliteCategoryList(SqliteDict, CategoryList):
+    """Manages a table mapping category_id to Category."""
+    TABLE = "categories"
+
+
+class SqlitePlayerList(SqliteDict, PlayerList):
+    """Manages a table mapping user_id to Player, indexed by availability."""
+    TABLE = "players"
+
+    def index_columns(self, value):
+        return {'available': int(value.available)}
+
+    def index_rows(self, key, value):
+        self._db.execute("DELETE FROM assignments WHERE player_id = ?", (key,))
+        if value is not None:
+            self._db.executemany(
+                    "INSERT INTO assignments (player_id, task_id, completed, completion_time, verified) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    [(key, task_id, int(a.completed), a.completion_time, int(bool(a.verifiers)))
+                            for (task_id, a) in value.assignments.items()])
+
+    def set_available(self, player: Player, available: bool):
+        """Mark a Player as available or unavailable to receive assignments."""
+        if player.available != available:
+            player.available = available
+            self.record(player.player_id)
+
+    def get_available_players(self):
+        """Return a dict mapping player_id to Player for Players who are marked as available."""
+        keys = [k for (k,) in self._db.execute("SELECT key FROM players WHERE available = 1")]
+        return self._values_for_keys(keys)
+
+    def count_available_players(self):
+        (count,) = self._db.execute("SELECT COUNT(*) FROM players WHERE available = 1").fetchone()
+        return count
+
+    def sample_available_players(self, count: int = 1):
+        """Return a list of up to count distinct Players chosen at random from those marked as available."""
+        total = self.count_available_players()
+        keys = []
+        for offset in random.sample(range(total), min(count, total)):
+            (key,) = self._db.execute(
+                    "SELECT key FROM players WHERE available = 1 ORDER BY key LIMIT 1 OFFSET ?", (offset,)).fetchone()
+            keys.append(key)
+        return [self._list[k] for k in keys]
+
+    def count_completions_since(self, since: float):
+        """
+        Yield (player_id, completions, verified completions) for Players who completed Assignments since a time.
+        Counts what is_season_completion and is_season_verified count, from the indexed columns.
+        """
+        return self._db.execute("""
+                SELECT player_id, COUNT(*), SUM(verified) FROM assignments
+                WHERE completed = 1 AND COALESCE(completion_time, 0) >= ?
+                GROUP BY player_id
+                """, (since,)).fetchall()
+
+    def clear_assignments(self):
+        """Clears all Assignments for all Players."""
+        keys = [k for (k,) in self._db.execute("SELECT DISTINCT player_id FROM assignments")]
+        for key in keys:
+            self._list[key].clear_assignments()
+            self._write(key, self._list[key])
+        self._db.commit()
+
+
+class SelectionCounter:
+    """
+    Takes the place of a CategoryIndex for Tasks read from the database, only counting the changes that affect which
+    Tasks are eligible for a set of limits or how they are weighted.
+    """
+    def __init__(self):
+        self.version = 0
+
+    def add_task(self, task):
+        # Tasks are attached as they are read from the database, which changes nothing.
+        pass
+
+    def changed(self):
+        self.version += 1
+
+    def category_added(self, task_id: int, category_id: int):
+        self.changed()
+
+    def category_removed(self, task_id: int, category_id: int):
+        self.changed()
+
+    def ratings_changed(self, task_id: int):
+        self.changed()
+
+
+class SqliteTaskList(SqliteDict, TaskList):
+    """Manages a table mapping task_id to Task, indexed by creator, category, severity and completion rate."""
+    TABLE = "tasks"
+    RANKING_COLUMNS = ('severity', 'completion_rate')
+
+    def __init__(self, bot, connection: sqlite3.Connection):
+        self._selection = SelectionCounter()
+        self._creator_versions = {}
+        super().__init__(bot, connection)
+
+    @property
+    def selection_version(self):
+        """A number that increases whenever a Task is added or deleted, or its categories or ratings change."""
+        return self._selection.version
+
+    def from_dict(self, bot, d):
+        task = super().from_dict(bot, d)
+        task.set_index(self._selection)
+        return task
+
+    def add_task(self, creator_id: int, task_text: str, task_name: str = None):
+        (key, task) = super().add_task(creator_id, task_text, task_name)
+        task.set_index(self._selection)
+        self._selection.changed()
+        return key, task
+
+    def record(self, key):
+        task = self._list._loaded.get(key)
+        if task is not None:
+            creator_id = task.creator_id
+        else:
+            if key in self._list._deleted:
+                self._selection.changed()
+            row = self._db.execute("SELECT creator_id FROM tasks WHERE key = ?", (key,)).fetchone()
+            creator_id = row[0] if row is not None else None
+        super().record(key)
+        self._creator_versions[creator_id] = self.version
+
+    def index_columns(self, value):
+        return {
+            'creator_id': value.creator_id,
+            'creation_time': value.creation_time,
+            'severity': value.get_mean_rating(),
+            'completion_rate': value.get_completion_ratio()
+        }
+
+    def index_rows(self, key, value):
+        self._db.execute("DELETE FROM task_categories WHERE task_id = ?", (key,))
+        if value is not None:
+            self._db.executemany(
+                    "INSERT INTO task_categories (task_id, category_id) VALUES (?, ?)",
+                    [(key, category_id) for category_id in value.categories])
+
+    def get_tasks_by_player(self, player_key: int):
+        """Return a dict mapping task_key to Task for Tasks written by a given Player."""
+        keys = [k for (k,) in self._db.execute(
+                "SELECT key FROM tasks WHERE creator_id = ? ORDER BY key", (player_key,))]
+        return self._values_for_keys(keys)
+
+    def count_tasks_by_player(self, player_key: int):
+        (count,) = self._db.execute("SELECT COUNT(*) FROM tasks WHERE creator_id = ?", (player_key,)).fetchone()
+        return count
+
+    def count_authored_since(self, since: float):
+        """Yield (creator_id, count) for the Players who created Tasks since a time."""
+        return self._db.execute(
+                "SELECT creator_id, COUNT(*) FROM tasks WHERE creation_time >= ? GROUP BY creator_id",
+                (since,)).fetchall()
+
+    def get_tasks_for_player(self, player: Player):
+        """Return a dict mapping task_key to Task for Tasks that are available for a given Player."""
+        limits = list(player.limits)
+        placeholders = ", ".join("?" * len(limits))
+        keys = [k for (k,) in self._db.execute(f"""
+                SELECT key FROM tasks WHERE key NOT IN (
+                    SELECT task_id FROM task_categories WHERE category_id IN ({placeholders}))
+                """, limits)]
+        return self._values_for_keys(keys)
+
+    def get_weight_stats_for_player(self, player: Player):
+        """
+        Yield (task_key, mean rating, completions, assignments) for Tasks that are available for a given Player,
+        read from the rows without deserializing the Tasks.
+        """
+        limits = list(player.limits)
+        placeholders = ", ".join("?" * len(limits))
+        return self._db.execute(f"""
+                SELECT key, severity, json_extract(data, '$.total_completions'),
+                        json_extract(data, '$.total_assignments')
+                FROM tasks WHERE key NOT IN (
+                    SELECT task_id FROM task_categories WHERE category_id IN ({placeholders}))
+                ORDER BY key
+                """, limits).fetchall()
+
+    def get_assigned_tasks_for_player(self, player: Player):
+        """Returns a dict mapping task_key to Task for Tasks that are assigned to a given Player."""
+        keys = [k for (k,) in self._db.execute(
+                "SELECT task_id FROM assignments WHERE player_id = ?", (player.player_id,))]
+        return self._values_for_keys(keys)
+
+    def get_top_tasks(self, by: str = 'severity', count: int = 10):
+        """
+        Return a list of (Task, score) for the top Tasks, highest first, by 'severity' or 'completion_rate'.
+        Tasks that have not been rated, or not been assigned, are left out of those rankings.
+        """
+        if by not in self.RANKING_COLUMNS:
+            raise ValueError(f"Unknown ranking {by!r}, expected one of {', '.join(self.RANKING_COLUMNS)}")
+        rows = self._db.execute(
+                f"SELECT key, {by} FROM tasks WHERE {by} IS NOT NULL ORDER BY {by} DESC, key LIMIT ?", (count,))
+        return [(self._list[key], score) for (key, score) in rows.fetchall()]
+
+
+class SqliteInterfaceList(SqliteDict, InterfaceList):
+    """Manages a table mapping message_id to Interface."""
+    TABLE = "interfaces"
+
+    def load(self, bot, records=None):
+        self.message_cache = MessageCache(bot)
+
+    def index_columns(self, value):
+        return {'type': value.to_dict()['type']}
@@ -1,31 +1,63 @@
 import logging
-from datetime import datetime
+import sys
+import time
 
 from discord import User
 
+from data_classes.CategoryIndex import CategoryIndex
+
 log = logging.getLogger(__name__)
 
+RATING_VALUES = range(1, 6)
+# Shared by every Task that has not been rated yet.
+EMPTY_HISTOGRAM = (0,) * len(RATING_VALUES)
+
 class Task:
+    """
+    A Task that can be assigned to Players.
+
+    Tasks are kept compact so that the whole TaskList can stay resident: categories are a bitmask of category_ids,
+    times are UTC timestamps, and ratings are a tuple of rater ids with a bytes string of their ratings rather than a
+    dict. Ratings are rare next to reads, and an empty tuple or bytes string costs nothing extra.
+
+    The sum of the ratings and a histogram of how many of each rating were given are kept as running totals, so that
+    severity and completion rate can be read without going over the ratings.
+    """
+    __slots__ = (
+        'task_id', 'creator_id', 'creation_time', 'task_text', 'task_name', 'category_mask',
+        '_raters', '_rating_values', '_rating_sum', '_rating_histogram',
+        'total_assignments', 'total_completions', '_index', '_stats', '__weakref__')
+
     def __init__(self, task_id: int, creator_id: int, task_text: str, task_name: str):
         self.task_id = task_id
         self.creator_id = creator_id
-        self.creation_time = datetime.utcnow()
+        self.creation_time = time.time()
 
         self.task_text = task_text
-        self.task_name = task_name
+        self.task_name = None if task_name is None else sys.intern(task_name)
 
-        self.categories = set()
-        self.ratings = {}
+        self.category_mask = 0
+        self._raters = ()
+        self._rating_values = b""
+        self._rating_sum = 0
+        self._rating_histogram = EMPTY_HISTOGRAM
 
         self.total_assignments = 0
         self.total_completions = 0
 
+        self._index = None
+        self._stats = None
+
     @classmethod
     def from_dict(cls, bot, d):
         task = Task(d['key'], d['creator_id'], d['task_text'], d['task_name'])
-        task.creation_time = datetime.utcfromtimestamp(d['creation_time'])
-        task.categories = set(d['categories'])
-        task.ratings = d['ratings'],
+        task.creation_time = d['creation_time']
+        for category_id in d['categories']:
+            task.add_category(category_id)
+        task._raters = tuple(int(rater_id) for rater_id in d['ratings'])
+        task._rating_values = bytes(d['ratings'].values())
+        task._rating_sum = sum(task._rating_values)
+        task._rating_histogram = tuple(task._rating_values.count(rating) for rating in RATING_VALUES)
         task.total_assignments = d['total_assignments']
         task.total_completions = d['total_completions']
         return task
@@ -34,7 +66,7 @@ class Task:
         return {
             'key': self.task_id,
             'creator_id': self.creator_id,
-            'creation_time': self.creation_time.timestamp(),
+            'creation_time': self.creation_time,
             'task_text': self.task_text,
             'task_name': self.task_name,
             'categories': list(self.categories),
@@ -43,38 +75,113 @@ class Task:
             'total_completions': self.total_completions
         }
 
-    def add_category(self, category_id):
-        raise NotImplementedError
-
-    def remove_category(self, category_id):
-        raise NotImplementedError
-
-    def toggle_category(self, limit_id: str):
+    @property
+    def categories(self):
+        """The set of category_ids for this Task. Change categories through the methods below, not this set."""
+        return set(CategoryIndex.keys(self.category_mask))
+
+    @property
+    def ratings(self):
+        """A dict mapping rater id to rating."""
+        return dict(zip(self._raters, self._rating_values))
+
+    @property
+    def rating_count(self):
+        return len(self._raters)
+
+    @property
+    def rating_histogram(self):
+        """A dict mapping each rating from 1 to 5 to the number of times it was given."""
+        return dict(zip(RATING_VALUES, self._rating_histogram))
+
+    def set_index(self, index):
+        """Attach the CategoryIndex that should be kept up to date with this Task's categories."""
+        self._index = index
+        index.add_task(self)
+
+    def set_stats(self, stats):
+        """Attach the TaskStats that should be kept up to date with this Task's ratings and totals."""
+        self._stats = stats
+        stats.task_changed(self)
+
+    def add_category(self, category_id: int):
+        self.category_mask |= 1 << category_id
+        if self._index is not None:
+            self._index.category_added(self.task_id, category_id)
+
+    def remove_category(self, category_id: int):
+        self.category_mask &= ~(1 << category_id)
+        if self._index is not None:
+            self._index.category_removed(self.task_id, category_id)
+
+    def toggle_category(self, limit_id: int):
         """Toggle presence of a given limit."""
-        if limit_id in self.categories:
-            self.categories.remove(limit_id)
+        if self.category_mask >> limit_id & 1:
+            self.remove_category(limit_id)
         else:
-            self.categories.add(limit_id)
+            self.add_category(limit_id)
 
     def unset_categories(self):
         """Unset all categories."""
-        self.categories.clear()
+        for category_id in CategoryIndex.keys(self.category_mask):
+            self.remove_category(category_id)
 
     def add_rating(self, user: User, rating: int):
-        self.ratings[user.id] = rating
+        histogram = list(self._rating_histogram)
+        if user.id in self._raters:
+            position = self._raters.index(user.id)
+            previous = self._rating_values[position]
+            values = bytearray(self._rating_values)
+            values[position] = rating
+            self._rating_values = bytes(values)
+            self._rating_sum -= previous
+            histogram[previous - 1] -= 1
+        else:
+            self._raters += (user.id,)
+            self._rating_values += bytes((rating,))
+        self._rating_sum += rating
+        histogram[rating - 1] += 1
+        self._rating_histogram = tuple(histogram)
+        if self._index is not None:
+            self._index.ratings_changed(self.task_id)
+        self._stats_changed()
 
     def assigned(self):
         """Mark that the Task was assigned, keeping a running total."""
         self.total_assignments += 1
+        self._stats_changed()
 
     def completed(self):
         """Mark that the Task was completed, keeping a running total."""
         self.total_completions += 1
+        self._stats_changed()
+
+    def _stats_changed(self):
+        if self._stats is not None:
+            self._stats.task_changed(self)
+
+    def get_mean_rating(self):
+        """Return the mean severity rating, or None if the Task has not been rated."""
+        if not self._raters:
+            return None
+        return self._rating_sum / len(self._raters)
+
+    def get_completion_ratio(self):
+        """Return the fraction of assignments that were completed, or None if the Task has not been assigned."""
+        if not self.total_assignments:
+            return None
+        return self.total_completions / self.total_assignments
 
     def get_severity(self):
         """Calculate severity, based on the current severity ratings."""
-        return "{}/5".format(round(sum(self.ratings.values())/len(self.ratings), 1))
+        mean = self.get_mean_rating()
+        if mean is None:
+            return "Unrated"
+        return "{}/5".format(round(mean, 1))
 
     def get_completion_rate(self):
         """Calculate completion rate, based on total assignments and total completions."""
-        return "{}%".format(round(self.total_completions/self.total_assignments, 2))
+        ratio = self.get_completion_ratio()
+        if ratio is None:
+            return "Never assigned"
+        return "{}%".format(round(ratio, 2))
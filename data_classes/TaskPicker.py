@@ -0,0 +1,109 @@
+import logging
+import random
+from collections import OrderedDict
+
+log = logging.getLogger(__name__)
+
+DEFAULT_SEVERITY = 3
+TABLE_CACHE_SIZE = 64
+# Draws made before falling back to a table without the excluded Tasks.
+EXCLUDED_DRAWS = 8
+
+
+def task_weight(severity, completions: int, assignments: int):
+    """
+    Weight a Task for random selection, from its mean rating, or None if unrated, and its totals.
+    Tasks that are usually completed, and Tasks rated as milder, are handed out more often.
+    """
+    if severity is None:
+        severity = DEFAULT_SEVERITY
+    # Smoothed so that new Tasks, with no assignments yet, start at an even chance of completion.
+    completion_rate = (completions + 1) / (assignments + 2)
+    return completion_rate * (6 - severity)
+
+
+class AliasTable:
+    """
+    Walker's alias method for drawing items with probability proportional to their weights.
+    Building the table takes O(n) time; each draw then takes O(1).
+    """
+    def __init__(self, items, weights):
+        count = len(items)
+        total = sum(weights)
+        self.items = items
+        self.weights = weights
+        self._probabilities = [0.0] * count
+        self._aliases = [0] * count
+
+        scaled = [w * count / total for w in weights]
+        small = [i for (i, w) in enumerate(scaled) if w < 1]
+        large = [i for (i, w) in enumerate(scaled) if w >= 1]
+        while small and large:
+            less = small.pop()
+            more = large.pop()
+            self._probabilities[less] = scaled[less]
+            self._aliases[less] = more
+            scaled[more] -= 1 - scaled[less]
+            (small if scaled[more] < 1 else large).append(more)
+        # Whatever is left over only differs from 1 by rounding error.
+        for i in small + large:
+            self._probabilities[i] = 1.0
+
+    def draw(self, rng=random):
+        column = rng.randrange(len(self.items))
+        if rng.random() < self._probabilities[column]:
+            return self.items[column]
+        return self.items[self._aliases[column]]
+
+
+class TaskPicker:
+    """
+    Picks weighted random Tasks for Players.
+
+    An AliasTable is built for each distinct set of limits and kept in an LRU cache, so most picks are a single draw.
+    The cache is emptied whenever the TaskList's selection_version changes. Assignment and completion totals also
+    feed into the weights, but only take effect when the tables are next rebuilt.
+    """
+    def __init__(self, task_list, cache_size: int = TABLE_CACHE_SIZE):
+        self.task_list = task_list
+        self.cache_size = cache_size
+
+        self._tables = OrderedDict()
+        self._version = None
+
+    def pick(self, player, exclude=frozenset()):
+        """
+        Return a weighted random Task that is available for a given Player, or None if there are none.
+        Tasks whose keys are in exclude are never picked.
+        """
+        if self._version != self.task_list.selection_version:
+            self._tables.clear()
+            self._version = self.task_list.selection_version
+
+        limits = player.limit_mask
+        if limits in self._tables:
+            self._tables.move_to_end(limits)
+            table = self._tables[limits]
+        else:
+            table = self._build_table(player)
+            self._tables[limits] = table
+            if len(self._tables) > self.cache_size:
+                self._tables.popitem(last=False)
+
+        if table is None:
+            return None
+        for _ in range(EXCLUDED_DRAWS):
+            key = table.draw()
+            if key not in exclude:
+                return self.task_list.get_value(key)
+        # The excluded Tasks carry most of the weight, so draw from the rest instead.
+        remaining = [(k, w) for (k, w) in zip(table.items, table.weights) if k not in exclude]
+        if not remaining:
+            return None
+        return self.task_list.get_value(AliasTable(*zip(*remaining)).draw())
+
+    def _build_table(self, player):
+        stats = list(self.task_list.get_weight_stats_for_player(player))
+        if not stats:
+            return None
+        return AliasTable([key for (key, *_) in stats], [task_weight(*weight_stats) for (_, *weight_stats) in stats])
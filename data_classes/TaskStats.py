@@ -0,0 +1,63 @@
+import logging
+from bisect import bisect_left, insort
+
+log = logging.getLogger(__name__)
+
+
+class TaskRanking:
+    """
+    Task ids kept sorted by a score, highest first, so that the top N can be read off without sorting.
+
+    score is a callable taking a Task and returning a number, or None to leave the Task out of the ranking.
+    Ties are broken by task_id, lowest first. Moving a Task is a binary search and a list insert.
+    """
+    def __init__(self, score):
+        self.score = score
+        self._entries = []
+        self._entry_by_task = {}
+
+    def __len__(self):
+        return len(self._entries)
+
+    def update(self, task):
+        """Move a Task to the place its current score puts it."""
+        self.remove(task.task_id)
+        score = self.score(task)
+        if score is not None:
+            entry = (-score, task.task_id)
+            insort(self._entries, entry)
+            self._entry_by_task[task.task_id] = entry
+
+    def remove(self, task_id: int):
+        old = self._entry_by_task.pop(task_id, None)
+        if old is not None:
+            del self._entries[bisect_left(self._entries, old)]
+
+    def top(self, count: int):
+        """Return a list of (task_id, score) for the highest scoring Tasks."""
+        return [(task_id, -negated) for (negated, task_id) in self._entries[:count]]
+
+
+class TaskStats:
+    """Rankings of Tasks by severity and by completion rate, kept up to date as Tasks are rated and assigned."""
+    RANKINGS = {
+        'severity': lambda task: task.get_mean_rating(),
+        'completion_rate': lambda task: task.get_completion_ratio(),
+    }
+
+    def __init__(self):
+        self.rankings = {name: TaskRanking(score) for (name, score) in self.RANKINGS.items()}
+
+    def task_changed(self, task):
+        for ranking in self.rankings.values():
+            ranking.update(task)
+
+    def task_removed(self, task):
+        for ranking in self.rankings.values():
+            ranking.remove(task.task_id)
+
+    def top(self, by: str, count: int):
+        """Return a list of (task_id, score) for the top Tasks by a given ranking."""
+        if by not in self.rankings:
+            raise ValueError(f"Unknown ranking {by!r}, expected one of {', '.join(self.rankings)}")
+        return self.rankings[by].top(count)
@@ -0,0 +1,51 @@
+import logging
+import time
+from collections import OrderedDict
+
+from discord import NotFound
+
+log = logging.getLogger(__name__)
+
+USER_CACHE_SIZE = 1024
+USER_CACHE_TTL = 600
+
+
+class UserResolver:
+    """
+    Resolves user ids to Users while avoiding API calls.
+
+    A Member already at hand (such as the one in a reaction payload) is used first, then the client's gateway cache,
+    then a bounded cache of previously fetched Users that expire after ttl seconds. Only then is the User fetched.
+    """
+    def __init__(self, bot, size: int = USER_CACHE_SIZE, ttl: float = USER_CACHE_TTL):
+        self.bot = bot
+        self.size = size
+        self.ttl = ttl
+
+        self._users = OrderedDict()
+
+    async def resolve(self, user_id: int, member=None):
+        """Return the User (or Member) for a user id, or None if there is no such User."""
+        if member is not None:
+            return member
+        user = self.bot.get_user(user_id)
+        if user is not None:
+            return user
+
+        now = time.monotonic()
+        if user_id in self._users:
+            expiry, user = self._users[user_id]
+            if expiry > now:
+                self._users.move_to_end(user_id)
+                return user
+            del self._users[user_id]
+
+        try:
+            user = await self.bot.fetch_user(user_id)
+        except NotFound:
+            log.warning(f"User {user_id} does not exist.")
+            return None
+        self._users[user_id] = (now + self.ttl, user)
+        if len(self._users) > self.size:
+            self._users.popitem(last=False)
+        return user
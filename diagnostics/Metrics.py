@@ -0,0 +1,203 @@
+import asyncio
+import logging
+import os
+import threading
+import time
+from bisect import bisect_left
+
+from data_classes.Interfaces import Interface
+from data_classes.Lists import CannedDict
+
+log = logging.getLogger(__name__)
+
+# Upper bounds in seconds of the latency histogram buckets.
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+DUMP_INTERVAL = 60
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+LISTS = ('category_list', 'player_list', 'task_list', 'interface_list')
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def _labels(names, values, extra=()):
+    pairs = [f'{name}="{_escape(value)}"' for (name, value) in (*zip(names, values), *extra)]
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Histogram:
+    """
+    Counts of observations falling into each of a number of buckets, with their sum, for each set of label values.
+    Observations may come from any thread.
+    """
+    def __init__(self, name: str, help_text: str, label_names=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = tuple(label_names)
+        self.buckets = tuple(buckets)
+
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *label_values):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                # A count for each bucket and one for +Inf, then the sum.
+                series = self._series[label_values] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[index] += 1
+            series[-1] += value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = {k: list(v) for (k, v) in self._series.items()}
+        for (label_values, counts) in sorted(series.items(), key=lambda item: [str(v) for v in item[0]]):
+            cumulative = 0
+            for (bound, count) in zip((*self.buckets, "+Inf"), counts):
+                cumulative += count
+                labels = _labels(self.label_names, label_values, [('le', bound)])
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _labels(self.label_names, label_values)
+            lines.append(f"{self.name}_sum{labels} {counts[-1]}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class Gauge:
+    """A value read when the metrics are rendered. collect returns a list of (label values, value) pairs."""
+    def __init__(self, name: str, help_text: str, label_names, collect):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = tuple(label_names)
+        self.collect = collect
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} gauge"]
+        for (label_values, value) in self.collect():
+            lines.append(f"{self.name}{_labels(self.label_names, label_values)} {value}")
+        return lines
+
+
+class Metrics:
+    """
+    Latency histograms for commands, Interface clicks, Discord API calls and data list I/O, plus the size of each
+    data list, exported in the Prometheus text format.
+
+    install() hooks the metrics into a bot. start() then serves them over HTTP on a local port, writes them to a file
+    periodically, or both.
+    """
+    def __init__(self):
+        self.commands = Histogram(
+                "taskmistress_command_seconds", "Time taken to run each command.", ('command', 'outcome'))
+        self.clicks = Histogram(
+                "taskmistress_click_seconds", "Time taken to handle each button click.", ('interface', 'emoji'))
+        self.api_calls = Histogram(
+                "taskmistress_api_call_seconds", "Time taken by each outbound Discord API call.", ('route', 'outcome'))
+        self.list_io = Histogram(
+                "taskmistress_list_io_seconds", "Time taken to load, save, journal or record a row of each data list.",
+                ('list', 'operation'))
+        self.loop_lag = Histogram(
+                "taskmistress_loop_lag_seconds", "How late the event loop ran each watchdog wake-up.")
+        self._metrics = [self.commands, self.clicks, self.api_calls, self.list_io, self.loop_lag]
+
+        self._server = None
+        self._dump_task = None
+
+    def add(self, metric):
+        """Export another Histogram or Gauge alongside the built-in ones."""
+        self._metrics.append(metric)
+        return metric
+
+    def install(self, bot):
+        """
+        Time the commands, clicks, API calls and list I/O of a bot, and its loop lag if it has a Watchdog, and report
+        the sizes of its lists.
+        """
+        bot.before_invoke(self._before_command)
+        bot.after_invoke(self._after_command)
+        Interface.click_timer = lambda interface, emoji, seconds: self.clicks.observe(seconds, interface.TYPE, emoji)
+        CannedDict.io_timer = lambda kind, operation, seconds: self.list_io.observe(seconds, kind, operation)
+        bot.outbound.call_timer = lambda route, seconds, succeeded: self.api_calls.observe(
+                seconds, route, "ok" if succeeded else "error")
+        if getattr(bot, 'watchdog', None) is not None:
+            bot.watchdog.lag_timer = self.loop_lag.observe
+
+        def list_sizes():
+            canned_dicts = [getattr(bot, name, None) for name in LISTS]
+            return [((c.KIND,), len(c)) for c in canned_dicts if c is not None]
+        self.add(Gauge("taskmistress_list_size", "Number of values in each data list.", ('list',), list_sizes))
+
+    async def _before_command(self, ctx):
+        ctx.metrics_start = time.perf_counter()
+
+    async def _after_command(self, ctx):
+        start = getattr(ctx, 'metrics_start', None)
+        if start is not None:
+            outcome = "error" if ctx.command_failed else "ok"
+            self.commands.observe(time.perf_counter() - start, ctx.command.qualified_name, outcome)
+
+    def render(self):
+        """Return every metric in the Prometheus text exposition format."""
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+    async def start(self, loop, port: int = None, path: str = None, interval: float = DUMP_INTERVAL):
+        """
+        Serve the metrics on a port of localhost, and write them to a file every interval seconds, if either is given.
+        Does nothing that has already been started.
+        """
+        if port and self._server is None:
+            self._server = await asyncio.start_server(self._serve, "127.0.0.1", port)
+            log.info(f"Serving metrics on http://127.0.0.1:{port}/metrics")
+        if path and self._dump_task is None:
+            self._dump_task = loop.create_task(self._dump(path, interval))
+
+    async def stop(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+        if self._dump_task is not None:
+            self._dump_task.cancel()
+            self._dump_task = None
+
+    async def _serve(self, reader, writer):
+        try:
+            request = await reader.readline()
+            while (await reader.readline()).strip():
+                pass  # Skip the headers.
+            parts = request.decode('latin-1').split()
+            if len(parts) >= 2 and parts[0] == "GET" and parts[1].split("?")[0] in ("/", "/metrics"):
+                (status, body) = ("200 OK", self.render().encode('utf-8'))
+            else:
+                (status, body) = ("404 Not Found", b"Not found\n")
+            writer.write(
+                    f"HTTP/1.1 {status}\r\nContent-Type: {CONTENT_TYPE}\r\nContent-Length: {len(body)}\r\n"
+                    f"Connection: close\r\n\r\n".encode('latin-1') + body)
+            await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError) as exc:
+            log.debug(f"Metrics request failed: {exc}")
+        finally:
+            writer.close()
+
+    async def _dump(self, path, interval: float):
+        loop = asyncio.get_event_loop()
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                # Render on the loop so the snapshot is consistent, and write on a worker thread.
+                await loop.run_in_executor(None, self._write, path, self.render())
+            except Exception as exc:
+                log.exception(f"Could not write metrics to {path}, retrying next interval.", exc_info=exc)
+
+    @staticmethod
+    def _write(path, text: str):
+        temp_path = path + ".tmp"
+        with open(temp_path, 'w') as file:
+            file.write(text)
+        os.replace(temp_path, path)
@@ -0,0 +1,101 @@
+import asyncio
+import logging
+import os
+import sys
+import threading
+from collections import Counter
+
+from diagnostics.Watchdog import TASK_LABELS
+
+log = logging.getLogger(__name__)
+
+PROFILE_INTERVAL = 0.005
+IDLE_LABEL = "idle"
+UNLABELLED = "unlabelled"
+
+
+def _frame_name(code):
+    # Collapsed stacks separate frames with semicolons, so none may appear in a name.
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})".replace(";", ":")
+
+
+class Profiler:
+    """
+    A sampling profiler for the event loop thread, started and stopped from within the running bot.
+
+    A helper thread takes the loop thread's stack every interval seconds, and counts each distinct stack under the
+    label of the Task the loop was running, or as idle if it was waiting for events. The counts can be written as
+    collapsed stacks, the input of flamegraph.pl and speedscope, with the label as the root frame.
+    """
+    def __init__(self, loop, interval: float = PROFILE_INTERVAL):
+        self.loop = loop
+        self.interval = interval
+        self.samples = Counter()
+
+        self._thread_id = None
+        self._stopped = threading.Event()
+
+    async def run(self, seconds: float):
+        """Sample for some seconds. Must be awaited on the loop being profiled."""
+        self._thread_id = threading.get_ident()
+        self._stopped.clear()
+        thread = threading.Thread(target=self._sample, name="profiler", daemon=True)
+        thread.start()
+        try:
+            await asyncio.sleep(seconds)
+        finally:
+            self._stopped.set()
+            await self.loop.run_in_executor(None, thread.join)
+
+    def _sample(self):
+        while not self._stopped.wait(self.interval):
+            frame = sys._current_frames().get(self._thread_id)
+            if frame is None:
+                continue
+            task = asyncio.current_task(self.loop)
+            label = IDLE_LABEL if task is None else TASK_LABELS.get(task, UNLABELLED)
+            codes = []
+            while frame is not None:
+                codes.append(frame.f_code)
+                frame = frame.f_back
+            codes.reverse()
+            self.samples[(label, tuple(codes))] += 1
+
+    @property
+    def sample_count(self):
+        return sum(self.samples.values())
+
+    def by_label(self):
+        """Return a Counter of samples by label."""
+        labels = Counter()
+        for ((label, _), count) in self.samples.items():
+            labels[label] += count
+        return labels
+
+    def top(self, count: int = 10, include_idle: bool = False):
+        """
+        Return up to count (function name, self samples, total samples) for the functions that were running most
+        often, ordered by self samples. Total samples include the time spent in functions they called.
+        """
+        own = Counter()
+        total = Counter()
+        for ((label, codes), samples) in self.samples.items():
+            if label == IDLE_LABEL and not include_idle:
+                continue
+            own[codes[-1]] += samples
+            for code in set(codes):
+                total[code] += samples
+        return [(_frame_name(code), samples, total[code]) for (code, samples) in own.most_common(count)]
+
+    def collapsed(self):
+        """Yield the samples as lines of collapsed stacks."""
+        for ((label, codes), count) in sorted(self.samples.items(), key=lambda item: -item[1]):
+            yield ";".join([label.replace(";", ":"), *(_frame_name(code) for code in codes)]) + f" {count}\n"
+
+    def write(self, path):
+        """Write the samples to a file as collapsed stacks."""
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(path, 'w') as file:
+            file.writelines(self.collapsed())
@@ -0,0 +1,113 @@
+import asyncio
+import logging
+import sys
+import threading
+import time
+import traceback
+import weakref
+from contextlib import contextmanager
+
+log = logging.getLogger(__name__)
+
+WATCHDOG_INTERVAL = 0.1
+WATCHDOG_THRESHOLD = 0.25
+# The labels of running asyncio Tasks, such as "command post actions" or "interface 701234567890123456".
+TASK_LABELS = weakref.WeakKeyDictionary()
+
+
+@contextmanager
+def labelled(label: str):
+    """Label the current asyncio Task while the block runs, so that diagnostics can say what it was doing."""
+    task = asyncio.current_task()
+    if task is None:
+        yield
+        return
+    previous = TASK_LABELS.get(task)
+    TASK_LABELS[task] = label
+    try:
+        yield
+    finally:
+        if previous is None:
+            TASK_LABELS.pop(task, None)
+        else:
+            TASK_LABELS[task] = previous
+
+
+def get_running_label(loop):
+    """Return the label of the Task a loop is running, which may be called from any thread, or None."""
+    task = asyncio.current_task(loop)
+    return None if task is None else TASK_LABELS.get(task)
+
+
+class Watchdog:
+    """
+    Measures how late the event loop runs a callback, and reports what blocked it when the lag passes a threshold.
+
+    A coroutine on the loop wakes every interval seconds and notes the time. A helper thread checks that it keeps
+    doing so; once it hasn't for threshold seconds, the loop must be stuck in synchronous code, so the thread captures
+    the loop thread's stack and logs it with the label of the running Task. Each stall is reported once, and its
+    full length is logged when the loop recovers.
+    """
+    def __init__(self, interval: float = WATCHDOG_INTERVAL, threshold: float = WATCHDOG_THRESHOLD):
+        self.interval = interval
+        self.threshold = threshold
+        # Called with the lag in seconds of each wake-up, if set.
+        self.lag_timer = None
+        self.max_lag = 0.0
+        self.stalls = 0
+
+        self._loop = None
+        self._loop_thread_id = None
+        self._task = None
+        self._thread = None
+        self._stopped = threading.Event()
+        self._last_tick = 0.0
+        self._ticks = 0
+        self._reported_tick = None
+
+    def start(self, loop):
+        """Begin watching the given event loop, which must be running on this thread. Does nothing if started."""
+        if self._task is not None:
+            return
+        self._loop = loop
+        self._loop_thread_id = threading.get_ident()
+        self._last_tick = time.monotonic()
+        self._stopped.clear()
+        self._task = loop.create_task(self._tick())
+        self._thread = threading.Thread(target=self._watch, name="watchdog", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        self._stopped.set()
+        self._thread = None
+
+    async def _tick(self):
+        while True:
+            expected = time.monotonic() + self.interval
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            lag = max(0.0, now - expected)
+            self._last_tick = now
+            self._ticks += 1
+            self.max_lag = max(self.max_lag, lag)
+            if self.lag_timer is not None:
+                self.lag_timer(lag)
+            if lag >= self.threshold:
+                log.warning(f"Event loop was blocked for {lag * 1000:.0f} ms.")
+
+    def _watch(self):
+        while not self._stopped.wait(self.interval / 2):
+            (ticks, stalled) = (self._ticks, time.monotonic() - self._last_tick - self.interval)
+            if stalled < self.threshold or self._reported_tick == ticks:
+                continue
+            self._reported_tick = ticks
+            self.stalls += 1
+            frame = sys._current_frames().get(self._loop_thread_id)
+            if frame is None:
+                continue
+            label = get_running_label(self._loop) or "no labelled handler"
+            stack = "".join(traceback.format_stack(frame))
+            log.warning(f"Event loop blocked for over {stalled * 1000:.0f} ms in {label}:\n{stack}")
@@ -1,7 +1,21 @@
 import json
 import logging
+import os
+import time
 import typing
+from concurrent.futures import ThreadPoolExecutor
+from data_classes.ClickQueue import ClickQueue
+from data_classes.Leaderboard import Leaderboard
 from data_classes.Lists import CategoryList, PlayerList, TaskList, InterfaceList
+from data_classes.Outbound import OutboundScheduler
+from data_classes.Persistence import WriteBehind, read_records
+from data_classes.ReactionDispatcher import ReactionDispatcher
+from data_classes.TaskPicker import TaskPicker
+from data_classes.UserResolver import UserResolver
+from data_classes.SqliteLists import connect, SqliteCategoryList, SqlitePlayerList, SqliteTaskList, SqliteInterfaceList
+from diagnostics.Metrics import Metrics
+from diagnostics.Profiler import Profiler
+from diagnostics.Watchdog import Watchdog, labelled
 from discord import Embed,      Emoji, Member
 from discord.ext import commands
 
@@ -14,6 +28,16 @@ CATEGORY_LIST_FILE = "data/categories.json"
 PLAYER_LIST_FILE = "data/players.json"
 TASK_LIST_FILE = "data/tasks.json"
 INTERFACE_LIST_FILE = "data/interfaces.json"
+DATABASE_FILE = "data/task_mistress.db"
+PAST_WINNER_COUNT = 3
+STANDINGS_COUNT = 10
+# More lines than this could overflow the Embed description.
+STANDINGS_MAX_COUNT = 25
+METRICS_INTERVAL = 60
+PROFILE_DIRECTORY = "profiles"
+PROFILE_SECONDS = 30
+PROFILE_MAX_SECONDS = 600
+PROFILE_TOP_COUNT = 15
 
 def load_critical_config_file(path):
     """Load a file or print an error and quit."""
@@ -33,16 +57,134 @@ class TaskMistress(commands.Bot):
 
         self.config = load_critical_config_file(CONFIG_FILE)
 
-        self.category_list = CategoryList(self, CATEGORY_LIST_FILE)
-        self.player_list = PlayerList(self, PLAYER_LIST_FILE)
-        self.task_list = TaskList(self, TASK_LIST_FILE)
-        self.interface_list = InterfaceList(self, INTERFACE_LIST_FILE)
+        self.outbound = OutboundScheduler()
+        self.reaction_dispatcher = ReactionDispatcher(self.outbound)
+        self.user_resolver = UserResolver(self)
+        self.click_queue = ClickQueue()
+
+        self.watchdog = None
+        if self.config.get('watchdogThreshold'):
+            self.watchdog = Watchdog(threshold=self.config['watchdogThreshold'])
+
+        self.profiler = None
+
+        self.metrics = None
+        if self.config.get('metricsPort') or self.config.get('metricsFile'):
+            # Installed before the lists are loaded, so that loading them is timed too.
+            self.metrics = Metrics()
+            self.metrics.install(self)
+
+        self.write_behind = None
+        if self.config.get('storage', "json") == "sqlite":
+            connection = connect(self.config.get('databasePath') or DATABASE_FILE)
+            self.category_list = SqliteCategoryList(self, connection)
+            self.player_list = SqlitePlayerList(self, connection)
+            self.task_list = SqliteTaskList(self, connection)
+            self.interface_list = SqliteInterfaceList(self, connection)
+        else:
+            self.load_lists(
+                    self.config.get('journalData', False), self.config.get('parallelLoad', False),
+                    self.config.get('snapshotFormat', "json") == "binary", self.config.get('streamingLoad', False))
+            if self.config.get('writeBehindInterval'):
+                self.write_behind = WriteBehind(
+                        [self.category_list, self.player_list, self.task_list, self.interface_list],
+                        self.config['writeBehindInterval'])
+
+        self.leaderboard = Leaderboard(self.config.get('seasonBegin'))
+        self.leaderboard.rebuild(self.player_list, self.task_list)
+
+        self.task_picker = TaskPicker(self.task_list)
+
+    def load_lists(self, journal: bool, parallel: bool, binary: bool = False, stream: bool = False):
+        """
+        Read and deserialize the four data lists, logging how long each took.
+        In parallel mode the files are read and parsed on a thread pool so that their I/O overlaps. The lists are
+        built on this thread afterwards, as deserializing is pure Python and would only contend for the GIL.
+        In streaming mode JSON files are instead parsed a record at a time while the lists are built, so that time is
+        counted as building. Binary snapshots are kept next to the JSON files, with a .bin extension; a list without
+        one is loaded from its JSON file and converted.
+        """
+        lists = [
+            ('category_list', CategoryList, CATEGORY_LIST_FILE),
+            ('player_list', PlayerList, PLAYER_LIST_FILE),
+            ('task_list', TaskList, TASK_LIST_FILE),
+            ('interface_list', InterfaceList, INTERFACE_LIST_FILE),
+        ]
+
+        sources = [path for (_, _, path) in lists]
+        if binary:
+            for (index, (name, list_class, path)) in enumerate(lists):
+                binary_path = os.path.splitext(path)[0] + ".bin"
+                if os.path.exists(binary_path) or not os.path.exists(path):
+                    sources[index] = binary_path
+                else:
+                    log.warning(f"No binary snapshot at {binary_path}, converting {path}.")
+                lists[index] = (name, list_class, binary_path)
+
+        def read(path):
+            start = time.perf_counter()
+            records = read_records(path, journal, stream)
+            return records, time.perf_counter() - start
+
+        if parallel:
+            with ThreadPoolExecutor(max_workers=len(lists), thread_name_prefix="load") as pool:
+                futures = [pool.submit(read, source) for source in sources]
+                reads = [future.result() for future in futures]
+        else:
+            reads = [read(source) for source in sources]
+
+        for ((name, list_class, path), source, (records, read_time)) in zip(lists, sources, reads):
+            start = time.perf_counter()
+            setattr(self, name, list_class(self, path, journal=journal, records=records, binary=binary))
+            build_time = time.perf_counter() - start
+            log.info(f"Loaded {len(getattr(self, name))} records from {source}: read {read_time * 1000:.1f} ms, "
+                    f"built {build_time * 1000:.1f} ms.")
+            if source != path:
+                # Write the binary snapshot now, so that changes journaled against it are never lost.
+                getattr(self, name).save()
 
     def save_data(self):
         self.player_list.save()
         self.task_list.save()
         self.interface_list.save()
 
+    def save_config(self):
+        temp_path = CONFIG_FILE + ".tmp"
+        with open(temp_path, 'w') as file:
+            json.dump(self.config, file, indent=4)
+        os.replace(temp_path, CONFIG_FILE)
+
+    def end_season(self):
+        """Record the top Players of the current season in pastWinners, then begin the next season."""
+        season = self.config.get('seasonNumber') or 1
+        self.config.setdefault('pastWinners', {})[str(season)] = [
+                {
+                    'player_id': player_id,
+                    'rank': rank,
+                    'score': score,
+                    'contributions': self.leaderboard.get_contributions(player_id)
+                } for (rank, player_id, score) in self.leaderboard.get_top(PAST_WINNER_COUNT)]
+        self.config['seasonNumber'] = season + 1
+        self.config['seasonBegin'] = time.time()
+        self.save_config()
+        self.leaderboard = Leaderboard(self.config['seasonBegin'])
+        return season
+
+    async def flush(self):
+        """Write any changes still held back by write-behind saving to disk."""
+        if self.write_behind is not None:
+            await self.write_behind.flush()
+
+    async def close(self):
+        if self.watchdog is not None:
+            self.watchdog.stop()
+        if self.write_behind is not None:
+            await self.write_behind.stop()
+        if self.metrics is not None:
+            await self.metrics.stop()
+        await self.outbound.stop()
+        await super().close()
+
     def when_mentioned(self, message):
         return [
             '{} '.format(self.user.mention),
@@ -50,11 +192,32 @@ class TaskMistress(commands.Bot):
 
     async def on_command_error(self, ctx, error):
         log.exception(str(error), exc_info=error)
-        await ctx.channel.send(str(error))
+        await self.outbound.send(ctx.channel, str(error))
+
+    async def on_raw_message_delete(self, event):
+        self.interface_list.remove_interface(event.message_id)
+
+    async def on_raw_bulk_message_delete(self, event):
+        for message_id in event.message_ids:
+            self.interface_list.remove_interface(message_id)
 
     async def on_ready(self):
         log.info("We have logged in as {}".format(self.user))
         self.first_login = False
+        if self.write_behind is not None:
+            self.write_behind.start(self.loop)
+        if self.watchdog is not None:
+            self.watchdog.start(self.loop)
+        if self.metrics is not None:
+            await self.metrics.start(
+                    self.loop, self.config.get('metricsPort'), self.config.get('metricsFile'),
+                    self.config.get('metricsInterval') or METRICS_INTERVAL)
+
+    async def invoke(self, ctx):
+        if ctx.command is None:
+            return await super().invoke(ctx)
+        with labelled(f"command {ctx.command.qualified_name}"):
+            await super().invoke(ctx)
 
     async def on_message(self, message):
         if message.author.bot:
@@ -62,14 +225,7 @@ class TaskMistress(commands.Bot):
         await self.process_commands(message)
 
     async def on_raw_reaction_add(self, event):
-        user = await bot.fetch_user(event.user_id)
-        if user.bot:
-            return  # Ignore bots
-        if event.message_id in bot.interface_list:
-            interface = bot.interface_list.get_value(event.message_id)
-            log.info(f"Button '{event.emoji.name}' clicked on Interface {event.message_id}:")
-            log.debug(repr(interface.handle_click))
-            await interface.handle_click(event, user)
+        await self.interface_list.handle_reaction(event)
 
 
 bot = TaskMistress(command_prefix=TaskMistress.when_mentioned)
@@ -94,6 +250,61 @@ async def category_info(ctx):
     await bot.interface_list.add_category_info_interface(channel)
     await ctx.message.delete()
 
+@post.command()
+async def profile(ctx, seconds: float = PROFILE_SECONDS):
+    """Sample the running bot for some seconds, save the collapsed stacks and report the hottest functions."""
+    log.info(f"Executing `post profile` command for {ctx.author.display_name}.")
+    if bot.profiler is not None:
+        raise commands.CommandError("A profile is already running.")
+    seconds = min(max(seconds, 1), PROFILE_MAX_SECONDS)
+    path = os.path.join(
+            bot.config.get('profileDirectory') or PROFILE_DIRECTORY,
+            time.strftime("profile-%Y%m%d-%H%M%S.collapsed"))
+    # Claimed before the first await, so that another invocation sees it.
+    profiler = bot.profiler = Profiler(bot.loop)
+    try:
+        await bot.outbound.send(ctx.channel, f"Profiling for {seconds:g} seconds.")
+        await profiler.run(seconds)
+    finally:
+        if bot.profiler is profiler:
+            bot.profiler = None
+    await bot.loop.run_in_executor(None, profiler.write, path)
+
+    sample_count = profiler.sample_count or 1
+    labels = ", ".join(f"{label} {n * 100 / sample_count:.0f}%" for (label, n) in profiler.by_label().most_common(5))
+    lines = [f"{profiler.sample_count} samples in {seconds:g} s, written to {path}.", f"By handler: {labels}.",
+            "  self  total  function"]
+    for (name, own, total) in profiler.top(PROFILE_TOP_COUNT):
+        lines.append(f"{own * 100 / sample_count:5.1f}% {total * 100 / sample_count:5.1f}%  {name[:80]}")
+    await bot.outbound.send(ctx.channel, "```\n" + "\n".join(lines) + "\n```")
+
+@bot.group(hidden=True)
+@commands.has_role("Administrator")
+async def season(ctx):
+    if ctx.invoked_subcommand is None:
+        pass
+
+@season.command(name="end")
+async def end_season(ctx):
+    """End the current season, recording its winners, and begin the next."""
+    log.info(f"Executing `season end` command for {ctx.author.display_name}.")
+    number = bot.end_season()
+    winners = ", ".join(f"<@{w['player_id']}> ({w['score']})" for w in bot.config['pastWinners'][str(number)])
+    await bot.outbound.send(ctx.channel, f"Season {number} is over. Winners: {winners or 'nobody'}.")
+
+@bot.command()
+async def standings(ctx, count: int = STANDINGS_COUNT):
+    """Show the top Players of the current season, and your own rank."""
+    count = min(max(count, 1), STANDINGS_MAX_COUNT)
+    embed = Embed(title="Standings for season {}".format(bot.config.get('seasonNumber') or 1))
+    lines = [f"{rank}. <@{player_id}>: {score}" for (rank, player_id, score) in bot.leaderboard.get_top(count)]
+    embed.description = "\n".join(lines) or "Nobody has scored yet."
+    rank = bot.leaderboard.get_rank(ctx.author.id)
+    if rank is not None:
+        embed.set_footer(text=f"You are ranked {rank} of {len(bot.leaderboard)} with "
+                f"{bot.leaderboard.get_score(ctx.author.id)} points.")
+    await bot.outbound.send(ctx.channel, embed=embed)
+
 @bot.command()
 async def assign(ctx, target: Member, task_id: typing.Optional[int]):
     """Give a task to a particular person."""
@@ -135,7 +346,7 @@ async def categories(ctx):
 async def add(ctx, name: str, emoji: Emoji, *, description):
     """Adds a new Category."""
     key, category = ctx.bot.category_list.add(ctx, name, emoji, description)
-    await ctx.channel.send(f"New category {category.name}{category.emoji} added: {category.description}")
+    await ctx.bot.outbound.send(ctx.channel, f"New category {category.name}{category.emoji} added: {category.description}")
 
 @categories.command()
 async def remove(ctx, category_id: int):
@@ -0,0 +1,183 @@
+import json
+import os
+import random
+import tempfile
+import unittest
+
+from benchmarks.generator import generate_categories, generate_interfaces, generate_players, generate_tasks
+from data_classes.BinarySnapshot import json_default
+from data_classes.Persistence import Journal, JsonArrayStream, read_records, read_snapshot, write_snapshot
+
+CHUNK_SIZES = (1, 2, 3)
+
+
+class PersistenceTestCase(unittest.TestCase):
+    def setUp(self):
+        self._directory = tempfile.TemporaryDirectory()
+        self.directory = self._directory.name
+
+    def tearDown(self):
+        self._directory.cleanup()
+
+    def write_file(self, name, text):
+        path = os.path.join(self.directory, name)
+        with open(path, 'w') as file:
+            file.write(text)
+        return path
+
+
+class TestJsonArrayStream(PersistenceTestCase):
+    def assertStreams(self, text):
+        """Check that every small chunk size streams the same elements that json.loads parses."""
+        path = self.write_file("stream.json", text)
+        expected = json.loads(text)
+        for chunk_size in CHUNK_SIZES:
+            with self.subTest(chunk_size=chunk_size):
+                self.assertEqual(list(JsonArrayStream(path, chunk_size)), expected)
+
+    def test_empty_arrays(self):
+        self.assertStreams("[]")
+        self.assertStreams("  [ \n ]  ")
+        self.assertStreams("[[], {}, [[]]]")
+
+    def test_numbers(self):
+        self.assertStreams("[0, -1, 12345, 3.25, -0.5, 1e5, 2.5E-3, -7e+2, 123456789012345678901234567890]")
+        self.assertStreams("[1,22,333,-4444,5.5,66.66]")
+        self.assertStreams("[ 1 , 2 ]")
+
+    def test_strings_with_escapes(self):
+        self.assertStreams(r'["", "a\"b", "back\\slash", "line\nbreak", "tab\t", "é中", "😀"]')
+        self.assertStreams(r'["ends with escape\\", "]", ",", "[{"]')
+
+    def test_nested_values(self):
+        self.assertStreams('[{"key": 1, "a": [1, 2, {"b": [3.5, "x"]}]}, [[-1e3], {"c": null}], true, false, null]')
+        self.assertStreams('[{"key": 0, "ratings": {"1": 5, "2": 3}, "categories": [4, 7]}]')
+
+    def test_generated_records(self):
+        rng = random.Random(0)
+        records = generate_tasks(rng, 20, 5, 10)
+        self.assertStreams(json.dumps(records))
+
+    def test_malformed(self):
+        for text in ("", "{}", "[1, 2", "[1 2]", "[1,]"):
+            path = self.write_file("malformed.json", text)
+            for chunk_size in CHUNK_SIZES:
+                with self.subTest(text=text, chunk_size=chunk_size):
+                    with self.assertRaises(json.JSONDecodeError):
+                        list(JsonArrayStream(path, chunk_size))
+
+
+class TestJournal(PersistenceTestCase):
+    def setUp(self):
+        super().setUp()
+        self.snapshot_path = os.path.join(self.directory, "tasks.json")
+        write_snapshot(self.snapshot_path, [{'key': k, 'value': k} for k in range(5)])
+
+    def append_lines(self, path, lines):
+        with open(path, 'a') as file:
+            file.write("".join(lines))
+
+    def test_replay_without_journal(self):
+        records = read_records(self.snapshot_path, journal=True)
+        self.assertEqual(list(records), [{'key': k, 'value': k} for k in range(5)])
+
+    def test_replay_sets_and_deletions(self):
+        journal = Journal(self.snapshot_path)
+        journal.append([
+            {'op': 'set', 'key': 1, 'value': {'key': 1, 'value': 'changed'}},
+            {'op': 'del', 'key': 3},
+            {'op': 'set', 'key': 7, 'value': {'key': 7, 'value': 'new'}},
+            {'op': 'set', 'key': 8, 'value': {'key': 8, 'value': 'gone'}},
+            {'op': 'del', 'key': 8},
+            {'op': 'del', 'key': 9},
+        ])
+        self.assertEqual(list(read_records(self.snapshot_path, journal=True)), [
+            {'key': 0, 'value': 0},
+            {'key': 1, 'value': 'changed'},
+            {'key': 2, 'value': 2},
+            {'key': 4, 'value': 4},
+            {'key': 7, 'value': 'new'},
+        ])
+
+    def test_replay_deleted_then_set(self):
+        journal = Journal(self.snapshot_path)
+        journal.append([{'op': 'del', 'key': 2}, {'op': 'set', 'key': 2, 'value': {'key': 2, 'value': 'back'}}])
+        records = {v['key']: v['value'] for v in read_records(self.snapshot_path, journal=True)}
+        self.assertEqual(records, {0: 0, 1: 1, 2: 'back', 3: 3, 4: 4})
+
+    def test_replay_ignores_torn_last_line(self):
+        journal = Journal(self.snapshot_path)
+        journal.append([{'op': 'del', 'key': 0}])
+        self.append_lines(journal.path, ['{"op": "set", "key": 1, "value": {"key": 1, "val'])
+        with self.assertLogs('data_classes.Persistence', 'WARNING'):
+            records = list(read_records(self.snapshot_path, journal=True))
+        self.assertEqual(records, [{'key': k, 'value': k} for k in range(1, 5)])
+
+    def test_replay_rotated_journal_first(self):
+        journal = Journal(self.snapshot_path)
+        self.append_lines(journal.rotated_path, [
+            json.dumps({'op': 'set', 'key': 0, 'value': {'key': 0, 'value': 'old'}}) + "\n",
+            json.dumps({'op': 'del', 'key': 1}) + "\n",
+            '{"op": "del", "ke',
+        ])
+        journal.append([
+            {'op': 'set', 'key': 0, 'value': {'key': 0, 'value': 'newer'}},
+            {'op': 'set', 'key': 1, 'value': {'key': 1, 'value': 'restored'}},
+        ])
+        with self.assertLogs('data_classes.Persistence', 'WARNING'):
+            records = {v['key']: v['value'] for v in read_records(self.snapshot_path, journal=True)}
+        self.assertEqual(records, {0: 'newer', 1: 'restored', 2: 2, 3: 3, 4: 4})
+
+    def test_reset_discards_journal(self):
+        journal = Journal(self.snapshot_path)
+        journal.append([{'op': 'del', 'key': 0}])
+        journal.reset([{'key': 9, 'value': 9}])
+        self.assertFalse(os.path.exists(journal.path))
+        self.assertEqual(list(read_records(self.snapshot_path, journal=True)), [{'key': 9, 'value': 9}])
+
+    def test_compaction(self):
+        journal = Journal(self.snapshot_path, compact_size=1)
+        journal.append([{'op': 'del', 'key': 0}, {'op': 'set', 'key': 5, 'value': {'key': 5, 'value': 5}}])
+        journal._compactor.join()
+        self.assertFalse(os.path.exists(journal.rotated_path))
+        self.assertEqual(read_snapshot(self.snapshot_path), [{'key': k, 'value': k} for k in range(1, 6)])
+
+
+class TestBinarySnapshot(PersistenceTestCase):
+    def generate(self):
+        rng = random.Random(0)
+        return {
+            'categories': generate_categories(rng, 5),
+            'tasks': generate_tasks(rng, 50, 5, 20),
+            'players': generate_players(rng, 20, 5, 50),
+            'interfaces': generate_interfaces(rng, 10, 20, 50),
+        }
+
+    def test_round_trip(self):
+        for (kind, records) in self.generate().items():
+            with self.subTest(kind=kind):
+                path = os.path.join(self.directory, f"{kind}.bin")
+                write_snapshot(path, records, kind)
+                snapshot = read_snapshot(path)
+                self.assertEqual(len(snapshot), len(records))
+                self.assertEqual([v['key'] for v in snapshot], [v['key'] for v in records])
+                self.assertEqual(json.loads(json.dumps(list(snapshot), default=json_default)), records)
+
+    def test_round_trip_with_journal(self):
+        records = self.generate()['tasks']
+        path = os.path.join(self.directory, "tasks.bin")
+        journal = Journal(path, kind='tasks')
+        journal.reset(records)
+        changed = {**records[0], 'task_name': "Changed"}
+        journal.append([{'op': 'set', 'key': 0, 'value': changed}, {'op': 'del', 'key': 1}])
+        replayed = json.loads(json.dumps(list(read_records(path, journal=True)), default=json_default))
+        self.assertEqual(replayed, [changed] + records[2:])
+
+    def test_empty(self):
+        path = os.path.join(self.directory, "players.bin")
+        write_snapshot(path, [], 'players')
+        self.assertEqual(list(read_snapshot(path)), [])
+
+
+if __name__ == '__main__':
+    unittest.main()